@@ -0,0 +1,160 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+"""
+Benchmarks the parsing and analysis stages on synthetic campaign data and
+reports throughput and peak memory for each stage.
+
+Run from the repository root:
+    python benchmarks/bench_pipeline.py --endpoints 10000 --seqs 60
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "data_collection"))
+sys.path.insert(0, REPO_DIR)
+
+from synthetic_scamper import (
+    generate_endpoints, get_asn_df, write_campaign_csvs, write_paris_trs,
+    write_ttl_outputs,
+)
+from parse_scamper import aggregate_data, get_last_hops_from_paris_tr, paris_tr_to_df
+from paper.scripts.src.import_data import import_and_clean_df
+from paper.scripts.src.outage_analysis import get_consecutive_df
+
+def run_stage(name: str, func, num_rows: int) -> tuple:
+    """
+    Runs `func()` once, timing it and tracking peak traced memory.
+
+    :param name: stage name
+    :param func: stage to run
+    :param num_rows: number of input rows, used for throughput
+    :return: (stage result, stats dict)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = {
+        'stage': name,
+        'rows': num_rows,
+        'seconds': elapsed,
+        'rows_per_sec': num_rows / elapsed if elapsed > 0 else float('inf'),
+        'peak_mb': peak / 2**20,
+    }
+    print(
+        f"{name:<30} {num_rows:>12,} rows {elapsed:>9.3f} s "
+        f"{stats['rows_per_sec']:>14,.0f} rows/s {stats['peak_mb']:>10.1f} MB peak"
+    )
+    return result, stats
+
+def run_benchmarks(
+        num_endpoints: int,
+        num_seqs: int,
+        json_endpoints: int,
+        json_seqs: int,
+        loss_rate: float,
+        outage_rate: float,
+        roman: bool,
+        work_dir: str,
+        seed: int = 0,
+) -> pd.DataFrame:
+    asn = "AS14593"
+    print(f"generating {num_endpoints:,} endpoints in {work_dir}")
+    endpoints_df = generate_endpoints(num_endpoints, seed=seed)
+    json_endpoints_df = endpoints_df.head(json_endpoints)
+
+    paris_tr_file = write_paris_trs(json_endpoints_df, f"{work_dir}/paris_tr_{asn}.json", seed=seed)
+    endpoint_files_info, seclast_files_info = write_ttl_outputs(
+        json_endpoints_df, f"{work_dir}/tmp_output_{asn}", json_seqs,
+        loss_rate=loss_rate, outage_rate=outage_rate, seed=seed,
+    )
+    endpoint_file, seclast_file, mapping_file = write_campaign_csvs(
+        endpoints_df, f"{work_dir}/{asn}", num_seqs,
+        loss_rate=loss_rate, outage_rate=outage_rate, roman=roman, seed=seed,
+    )
+    print("done generating\n")
+
+    all_stats = []
+    json_rows = len(json_endpoints_df) * json_seqs
+
+    _, stats = run_stage(
+        "aggregate_data", lambda: aggregate_data(endpoint_files_info), json_rows,
+    )
+    all_stats.append(stats)
+
+    _, stats = run_stage(
+        "paris_tr_to_df", lambda: paris_tr_to_df(paris_tr_file), len(json_endpoints_df),
+    )
+    all_stats.append(stats)
+
+    asn_df = get_asn_df(json_endpoints_df, asn)
+    _, stats = run_stage(
+        "get_last_hops_from_paris_tr",
+        lambda: get_last_hops_from_paris_tr(paris_tr_file, asn, asn_df=asn_df),
+        len(json_endpoints_df),
+    )
+    all_stats.append(stats)
+
+    analysis_dir = f"{work_dir}/analysis"
+    os.makedirs(analysis_dir, exist_ok=True)
+    (outages_df, _, _), stats = run_stage(
+        "import_and_clean_df",
+        lambda: import_and_clean_df(
+            seclast_file, endpoint_file, None, analysis_dir,
+            modified=roman, seclast_mapping=mapping_file,
+        ),
+        num_endpoints * num_seqs,
+    )
+    all_stats.append(stats)
+
+    _, stats = run_stage(
+        "get_consecutive_df", lambda: get_consecutive_df(outages_df), len(outages_df),
+    )
+    all_stats.append(stats)
+
+    return pd.DataFrame(all_stats)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parsing and analysis on synthetic data")
+    parser.add_argument("--endpoints", type=int, default=10000, help="Number of customer endpoints")
+    parser.add_argument("--seqs", type=int, default=60, help="Number of probe rounds in the CSVs")
+    parser.add_argument("--json-endpoints", type=int, default=None,
+                        help="Endpoints in the scamper json outputs (default: --endpoints)")
+    parser.add_argument("--json-seqs", type=int, default=5, help="Probe rounds in the scamper json outputs")
+    parser.add_argument("--loss-rate", type=float, default=0.01, help="Per-probe loss rate")
+    parser.add_argument("--outage-rate", type=float, default=0.05, help="Fraction of endpoints with an outage")
+    parser.add_argument("--roman", action="store_true", help="Generate Roman (one pre-sat probe per hop) data")
+    parser.add_argument("--work-dir", type=str, default=None, help="Directory for generated data (default: temporary)")
+    parser.add_argument("--output", type=str, default=None, help="Optional CSV file to write the results to")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="roman_hh_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        results_df = run_benchmarks(
+            args.endpoints,
+            args.seqs,
+            args.json_endpoints or args.endpoints,
+            args.json_seqs,
+            args.loss_rate,
+            args.outage_rate,
+            args.roman,
+            work_dir,
+            seed=args.seed,
+        )
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        results_df.to_csv(args.output, index=False)
@@ -0,0 +1,144 @@
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import pandas as pd
+
+"""
+Benchmarks the startup time of the collection and analysis entry points, each
+in a fresh interpreter, so cron-driven restarts and quick analysis queries are
+not dominated by import cost.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py --repeats 10 --importtime
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_COLLECTION_DIR = os.path.join(REPO_DIR, "data_collection")
+PAPER_DIR = os.path.join(REPO_DIR, "paper")
+
+# (name, working directory, python statement)
+ENTRY_POINTS = [
+    ("import run_roman_hitchhiking", DATA_COLLECTION_DIR, "import run_roman_hitchhiking"),
+    ("import run_scamper", DATA_COLLECTION_DIR, "import run_scamper"),
+    ("import parse_scamper", DATA_COLLECTION_DIR, "import parse_scamper"),
+    ("import coordinator", DATA_COLLECTION_DIR, "import coordinator"),
+    ("import scripts.pipeline", PAPER_DIR, "import scripts.pipeline"),
+    ("import scripts.outage_lengths", PAPER_DIR, "import scripts.outage_lengths"),
+    ("import scripts.src.import_data", PAPER_DIR, "import scripts.src.import_data"),
+]
+
+def time_command(args: list, cwd: str, repeats: int) -> list:
+    """
+    Runs `args` `repeats` times and returns the wall-clock seconds of each run.
+    """
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+# imported by every interpreter before the statement runs
+STARTUP_MODULES = {'site', 'encodings', 'codecs', 'io', 'abc', 'zipimport', 'builtins'}
+
+def get_import_times(statement: str, cwd: str, top: int) -> list:
+    """
+    Returns the `top` packages imported by `statement` with the largest
+    cumulative import time, as (package, ms) from `python -X importtime`.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    )
+    entry_module = statement.split()[-1].split(".")[0]
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if "." in name or name in STARTUP_MODULES or name == entry_module:
+            continue
+        packages[name] = max(packages.get(name, 0), int(cumulative) / 1000)
+    return sorted(packages.items(), key=lambda m: m[1], reverse=True)[:top]
+
+def write_restart_dir(work_dir: str, asn: str):
+    """
+    Writes the files a restart of `run_roman_hitchhiking.py` finds when today's
+    output already exists, so it only checks them and exits.
+    """
+    with open(f"{work_dir}/exposed_ips.txt", 'w') as f:
+        f.write("192.0.2.1\n")
+    with open(f"{work_dir}/sec_last_{asn}.csv", 'w') as f:
+        f.write("dst,sec_last_ip,hop_count\n")
+    output_dir = f"{work_dir}/{datetime.now().strftime('%Y%m%d')}"
+    os.makedirs(output_dir, exist_ok=True)
+    for stream in ['endpoint', 'sec_last']:
+        with open(f"{output_dir}/{asn}_{stream}.csv", 'w') as f:
+            f.write("seq,dst,rtt\n")
+
+def run_benchmarks(repeats: int, importtime: bool, top: int, work_dir: str) -> pd.DataFrame:
+    baseline = statistics.median(time_command([sys.executable, "-c", "pass"], REPO_DIR, repeats))
+    print(f"{'interpreter baseline':<40} {baseline * 1000:>9.1f} ms\n")
+
+    sys.path.insert(0, DATA_COLLECTION_DIR)
+    from config import STARLINK_ASN
+    write_restart_dir(work_dir, STARLINK_ASN)
+    entry_points = ENTRY_POINTS + [(
+        "run_roman_hitchhiking.py (output exists)",
+        DATA_COLLECTION_DIR,
+        None,
+        [
+            os.path.join(DATA_COLLECTION_DIR, "run_roman_hitchhiking.py"),
+            "--probe-interval", "1", "--num-probes", "1",
+            "--exposed-ips-file", f"{work_dir}/exposed_ips.txt",
+            "--output-dir", work_dir,
+        ],
+    )]
+
+    all_stats = []
+    for entry_point in entry_points:
+        name, cwd, statement = entry_point[:3]
+        args = ["-c", statement] if statement is not None else entry_point[3]
+        seconds = time_command([sys.executable] + args, cwd, repeats)
+        stats = {
+            'entry_point': name,
+            'repeats': repeats,
+            'min_ms': min(seconds) * 1000,
+            'median_ms': statistics.median(seconds) * 1000,
+            'over_baseline_ms': (statistics.median(seconds) - baseline) * 1000,
+        }
+        print(
+            f"{name:<40} {stats['min_ms']:>9.1f} ms min {stats['median_ms']:>9.1f} ms median "
+            f"{stats['over_baseline_ms']:>9.1f} ms over baseline"
+        )
+        if importtime and statement is not None:
+            for module, ms in get_import_times(statement, cwd, top):
+                print(f"    {module:<36} {ms:>9.1f} ms")
+        all_stats.append(stats)
+
+    return pd.DataFrame(all_stats)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark startup time of the entry points")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters started per entry point")
+    parser.add_argument("--importtime", action="store_true",
+                        help="Also list the slowest top-level imports of each entry point")
+    parser.add_argument("--top", type=int, default=5, help="Imports listed with --importtime")
+    parser.add_argument("--output", type=str, default=None, help="Optional CSV file to write the results to")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="roman_hh_startup_")
+    try:
+        results_df = run_benchmarks(args.repeats, args.importtime, args.top, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        results_df.to_csv(args.output, index=False)
@@ -0,0 +1,32 @@
+import json
+import os
+
+"""
+Checkpoint and probe plan files of continuous runs, kept free of heavy
+imports so a restart can check for them quickly.
+"""
+
+def get_checkpoint_file(output_dir: str, asn: str) -> str:
+    return f"{output_dir}/checkpoint_{asn}.json"
+
+def get_plan_file(output_dir: str, asn: str) -> str:
+    return f"{output_dir}/plan_{asn}.json"
+
+def read_checkpoint(checkpoint_file: str) -> dict:
+    """
+    Reads a checkpoint written by `write_checkpoint`.
+
+    :return: the checkpoint, or None if there is no readable checkpoint
+    """
+    try:
+        with open(checkpoint_file, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_checkpoint(checkpoint_file: str, checkpoint: dict):
+    # write then rename, so a crash never leaves a partial checkpoint
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_file, checkpoint_file)
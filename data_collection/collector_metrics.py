@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+Runtime metrics for the probing loop in `modified_concurrent_ttl_ping_by_grouping`.
+
+Metrics are kept in memory and exposed in the Prometheus text format, either
+over a local HTTP endpoint or as a rolling text file with one line per round:
+    metrics = CollectorMetrics()
+    serve_metrics(metrics, 9100)      # curl localhost:9100/metrics
+    modified_concurrent_ttl_ping_by_grouping(..., metrics=metrics, metrics_file="metrics.log")
+"""
+
+METRIC_PREFIX = "roman_hh"
+
+class CollectorMetrics:
+    """
+    Thread-safe counters, gauges and rolling windows of recent samples.
+
+    :param window: (optional) number of recent samples kept per windowed metric
+    """
+    def __init__(self, window: int = 60):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.windows = defaultdict(lambda: deque(maxlen=window))
+
+    def inc(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def set(self, name: str, value: float):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        with self.lock:
+            self.windows[name].append(value)
+
+    def record_spawn(self, stream: str, seconds: float):
+        self.inc(f"{stream}_tasks_spawned_total")
+        self.observe("spawn_seconds", seconds)
+
+    def record_task(self, stream: str, runtime: float):
+        """
+        :param runtime: seconds from spawn until the task was seen finished,
+                        so it is rounded up to the probe interval
+        """
+        self.inc(f"{stream}_tasks_completed_total")
+        self.observe(f"{stream}_task_seconds", runtime)
+
+    def record_round(
+            self,
+            seq: int,
+            num_probes: int,
+            round_seconds: float,
+            in_flight: int,
+            queue_depth: int,
+    ):
+        """
+        Records one probe round of the loop.
+
+        :param num_probes: number of targets probed in the round
+        :param round_seconds: wall-clock duration of the round, including the
+                              sleep that maintains the probe interval
+        """
+        self.inc("rounds_total")
+        self.inc("probes_sent_total", num_probes)
+        self.set("seq", seq)
+        self.set("in_flight_tasks", in_flight)
+        self.set("aggregation_queue_depth", queue_depth)
+        with self.lock:
+            self.windows["round_probes"].append(num_probes)
+            self.windows["round_seconds"].append(round_seconds)
+
+    def record_batch(
+            self,
+            stream: str,
+            df,
+            num_files: int,
+            parse_seconds: float,
+            bytes_written: int,
+    ):
+        """
+        Records one aggregated batch of scamper outputs.
+
+        :param stream: 'endpoint' or 'seclast'
+        :param df: the batch as returned by `aggregate_data`
+        """
+        self.inc(f"{stream}_files_parsed_total", num_files)
+        self.inc(f"{stream}_rows_written_total", len(df))
+        self.inc(f"{stream}_bytes_written_total", bytes_written)
+        self.observe("parse_seconds", parse_seconds)
+        if len(df) > 0:
+            responsive = int(df['rtt'].notna().sum())
+            self.inc(f"{stream}_responsive_total", responsive)
+            self.observe(f"{stream}_responsive_fraction", responsive / len(df))
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current value of every metric. Windowed metrics are
+        summarized by their last, mean and max over the window.
+        """
+        with self.lock:
+            values = dict(self.counters)
+            values.update(self.gauges)
+            windows = {name: list(samples) for name, samples in self.windows.items()}
+
+        values['uptime_seconds'] = time.time() - self.start_time
+        for name, samples in windows.items():
+            if not samples or name in ('round_probes', 'round_seconds'):
+                continue
+            values[f"{name}_last"] = samples[-1]
+            values[f"{name}_mean"] = sum(samples) / len(samples)
+            values[f"{name}_max"] = max(samples)
+
+        round_seconds = sum(windows.get('round_seconds', []))
+        if round_seconds > 0:
+            values['achieved_pps'] = sum(windows['round_probes']) / round_seconds
+        return values
+
+    def render(self) -> str:
+        """
+        Returns the snapshot in the Prometheus text exposition format.
+        """
+        return ''.join(
+            f"{METRIC_PREFIX}_{name} {value:g}\n"
+            for name, value in sorted(self.snapshot().items())
+        )
+
+    def render_line(self) -> str:
+        values = self.snapshot()
+        fields = ' '.join(f"{name}={value:g}" for name, value in sorted(values.items()))
+        return f"{time.strftime('%Y-%m-%dT%H:%M:%S')} {fields}\n"
+
+def write_metrics_file(
+        metrics: CollectorMetrics,
+        metrics_file: str,
+        max_bytes: int = 10 * 2**20,
+):
+    """
+    Appends the current metrics as one line to `metrics_file`, rolling it over
+    to `{metrics_file}.1` once it exceeds `max_bytes`.
+    """
+    if os.path.exists(metrics_file) and os.path.getsize(metrics_file) > max_bytes:
+        os.replace(metrics_file, f"{metrics_file}.1")
+    with open(metrics_file, 'a') as f:
+        f.write(metrics.render_line())
+
+def serve_metrics(
+        metrics: CollectorMetrics,
+        port: int,
+        host: str = "127.0.0.1",
+) -> ThreadingHTTPServer:
+    """
+    Serves `metrics` at http://{host}:{port}/metrics from a daemon thread.
+
+    :return: the running server, stop it with `server.shutdown()`
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # keep scrapes out of the collector's output
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"serving collector metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+"""
+Preallocated typed column buffers for the aggregation worker, so parsed rows
+are written into the same arrays for the whole collection instead of into
+new per-file dataframes.
+"""
+
+class ColumnBuffer:
+    """
+    Fixed-capacity columns that rows are appended to and flushed from.
+
+    :param dtypes: column name to numpy dtype, in row order
+    :param capacity: number of rows the buffer holds
+    """
+    def __init__(self, dtypes: dict, capacity: int):
+        self.columns = list(dtypes)
+        self.arrays = [np.empty(capacity, dtype=dtype) for dtype in dtypes.values()]
+        self.capacity = capacity
+        self.size = 0
+
+    def append(self, row: tuple) -> bool:
+        """
+        Appends one row.
+
+        :return: whether the buffer is now full and must be flushed
+        """
+        i = self.size
+        for array, value in zip(self.arrays, row):
+            array[i] = value
+        self.size = i + 1
+        return self.size == self.capacity
+
+    def extend(self, arrays: list, start: int = 0) -> int:
+        """
+        Copies the rows of `arrays`, one array per column, from `start` on, as
+        many as fit in the buffer.
+
+        :return: index of the first row that did not fit
+        """
+        n = min(self.capacity - self.size, len(arrays[0]) - start)
+        for buffer_array, array in zip(self.arrays, arrays):
+            buffer_array[self.size:self.size + n] = array[start:start + n]
+        self.size += n
+        return start + n
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the buffered rows as a dataframe. It may share memory with the
+        buffer, so it must be used before the buffer is cleared.
+        """
+        return pd.DataFrame(
+            {name: array[:self.size] for name, array in zip(self.columns, self.arrays)},
+            copy=False,
+        )
+
+    def clear(self):
+        # object columns keep their references until overwritten, which
+        # bounds memory by the capacity rather than releasing it every flush
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import pandas as pd
+
+import run_scamper
+from config import STARLINK_ASN
+from run_scamper import Grouping, modified_concurrent_ttl_ping_by_grouping
+
+"""
+Splits a Roman HitchHiking campaign across several vantage points and merges
+their outputs into one dataset.
+
+The pre-sat hops are divided between the workers, so every pre-sat group and
+its customers are probed by a single worker. All workers share the campaign's
+anchor time, so seq n is sent by every worker at anchor + n * probe interval
+and the seqs line up across workers.
+
+    # on the coordinator
+    python coordinator.py plan --sec-last-file roman-hh/sec_last_AS14593.csv \
+        --campaign-dir campaign --workers 3 --probe-interval 1 --num-probes 0
+    # on each host, with campaign/ on shared storage or copied over
+    python coordinator.py worker --campaign-dir campaign --worker-id 0
+    # once the worker directories are back under campaign/
+    python coordinator.py merge --campaign-dir campaign
+
+    # or all of the above with local worker processes
+    python coordinator.py local --sec-last-file ... --campaign-dir campaign --workers 3 ...
+
+The merged manifests can be passed to `import_and_clean_df` in place of the
+csv files, with `modified=True` and the merged mapping file.
+"""
+
+CAMPAIGN_FILE = "campaign.json"
+
+def get_worker_dir(campaign_dir: str, worker_id: int) -> str:
+    return os.path.join(campaign_dir, f"worker_{worker_id}")
+
+def read_campaign(campaign_dir: str) -> dict:
+    with open(os.path.join(campaign_dir, CAMPAIGN_FILE), 'r') as f:
+        return json.load(f)
+
+def split_endpoints(df: pd.DataFrame, num_workers: int) -> list:
+    """
+    Assigns each pre-sat hop, with all of its customers, to a worker. Pre-sat
+    hops are assigned largest first to the least loaded worker.
+
+    :param df: dataframe formatted like the output of `get_last_hops_from_paris_tr`
+    :return: list of `num_workers` dataframes
+    """
+    sizes = df.groupby('sec_last_ip').size().sort_values(ascending=False)
+    loads = [0] * num_workers
+    assignment = {}
+    for sec_last_ip, size in sizes.items():
+        worker_id = loads.index(min(loads))
+        assignment[sec_last_ip] = worker_id
+        loads[worker_id] += size
+
+    worker_of_dst = df['sec_last_ip'].map(assignment)
+    return [df[worker_of_dst == worker_id] for worker_id in range(num_workers)]
+
+def plan_campaign(
+        sec_to_last_df: pd.DataFrame,
+        campaign_dir: str,
+        num_workers: int,
+        probe_interval: float,
+        num_probes: int,
+        asn: str = STARLINK_ASN,
+        start_delay: float = 30,
+        grouping: Grouping = None,
+        sample_size: int = None,
+        slash: int = None,
+        combined: bool = False,
+        rotate_minutes: float = None,
+        compression: str = None,
+) -> dict:
+    """
+    Splits the customers between `num_workers` workers and writes the
+    campaign description to `{campaign_dir}/campaign.json`.
+
+    :param start_delay: (optional) seconds from now until seq 0, to give the
+                        workers time to start. Workers starting later skip
+                        the seqs already past.
+    :return: the campaign description
+    """
+    os.makedirs(campaign_dir, exist_ok=True)
+    workers = []
+    for worker_id, worker_df in enumerate(split_endpoints(sec_to_last_df, num_workers)):
+        worker_dir = get_worker_dir(campaign_dir, worker_id)
+        os.makedirs(worker_dir, exist_ok=True)
+        endpoints_file = os.path.join(worker_dir, f"sec_last_{asn}.csv")
+        worker_df.to_csv(endpoints_file, index=None)
+        workers.append({
+            'worker_id': worker_id,
+            'endpoints_file': os.path.relpath(endpoints_file, campaign_dir),
+            'num_endpoints': len(worker_df),
+            'num_presats': int(worker_df['sec_last_ip'].nunique()),
+        })
+
+    campaign = {
+        'asn': asn,
+        'probe_interval': probe_interval,
+        'num_probes': num_probes,
+        'anchor_time': time.time() + start_delay,
+        'grouping': grouping.name if grouping is not None else None,
+        'sample_size': sample_size,
+        'slash': slash,
+        'combined': combined,
+        'rotate_minutes': rotate_minutes,
+        'compression': compression,
+        'workers': workers,
+    }
+    with open(os.path.join(campaign_dir, CAMPAIGN_FILE), 'w') as f:
+        json.dump(campaign, f, indent=1)
+
+    for worker in workers:
+        print(f"worker {worker['worker_id']}: {worker['num_endpoints']} endpoints, {worker['num_presats']} pre-sat hops")
+    return campaign
+
+def run_worker(
+        campaign_dir: str,
+        worker_id: int,
+        multiple_src_ips: bool = True,
+):
+    """
+    Probes the customers assigned to `worker_id`, writing to
+    `{campaign_dir}/worker_{worker_id}/`.
+    """
+    campaign = read_campaign(campaign_dir)
+    worker = campaign['workers'][worker_id]
+    worker_dir = get_worker_dir(campaign_dir, worker_id)
+    sec_to_last_df = pd.read_csv(os.path.join(campaign_dir, worker['endpoints_file']))
+    asn = campaign['asn']
+    rotate_minutes = campaign['rotate_minutes']
+
+    print(f"worker {worker_id}: probing {len(sec_to_last_df)} endpoints")
+    modified_concurrent_ttl_ping_by_grouping(
+            sec_to_last_df, asn,
+            output_file=os.path.join(worker_dir, asn),
+            wait_probe=campaign['probe_interval'],
+            num_probes=campaign['num_probes'],
+            grouping=Grouping[campaign['grouping']] if campaign['grouping'] else None,
+            sample_size=campaign['sample_size'],
+            slash=campaign['slash'],
+            multiple_src_ips=multiple_src_ips,
+            output_dir=worker_dir,
+            rotate_seconds=rotate_minutes * 60 if rotate_minutes else None,
+            compression=campaign['compression'],
+            combined=campaign['combined'],
+            anchor_time=campaign['anchor_time'],
+    )
+
+def merge_campaign(campaign_dir: str) -> tuple:
+    """
+    Writes manifests under `{campaign_dir}/merged/` listing the outputs of
+    every worker, either their rotated segments or their single csv files,
+    along with the customer to pre-sat hop mapping of the whole campaign.
+
+    :return: (endpoint manifest, sec_last manifest, mapping file)
+    """
+    campaign = read_campaign(campaign_dir)
+    asn = campaign['asn']
+    merged_dir = os.path.join(campaign_dir, "merged")
+    os.makedirs(merged_dir, exist_ok=True)
+
+    manifest_files = []
+    for stream in ['endpoint', 'sec_last']:
+        segments = []
+        for worker in campaign['workers']:
+            worker_dir = get_worker_dir(campaign_dir, worker['worker_id'])
+            worker_prefix = os.path.join(worker_dir, f"{asn}_{stream}")
+            worker_segments = []
+            if os.path.exists(f"{worker_prefix}.manifest.json"):
+                with open(f"{worker_prefix}.manifest.json", 'r') as f:
+                    worker_segments = json.load(f)['segments']
+            if os.path.exists(f"{worker_prefix}.csv"):
+                worker_segments.append({
+                    'file': os.path.basename(f"{worker_prefix}.csv"),
+                    'rows': None,
+                    'min_seq': None,
+                    'max_seq': None,
+                    'min_start_sec': None,
+                    'max_start_sec': None,
+                })
+            if not worker_segments:
+                print(f"no {stream} output from worker {worker['worker_id']}")
+            for segment in worker_segments:
+                segment = dict(segment)
+                segment['file'] = os.path.relpath(os.path.join(worker_dir, segment['file']), merged_dir)
+                segment['worker_id'] = worker['worker_id']
+                segments.append(segment)
+
+        manifest_file = os.path.join(merged_dir, f"{asn}_{stream}.manifest.json")
+        with open(manifest_file, 'w') as f:
+            json.dump({'stream': stream, 'segments': segments}, f, indent=1)
+        manifest_files.append(manifest_file)
+        print(f"merged {len(segments)} {stream} segments into {manifest_file}")
+
+    mapping_file = os.path.join(merged_dir, f"{asn}_sec_last_actual_vs_expected.csv")
+    mapping_df = pd.concat([
+        pd.read_csv(os.path.join(campaign_dir, worker['endpoints_file']))[['dst', 'sec_last_ip']]
+        for worker in campaign['workers']
+    ], ignore_index=True)
+    mapping_df.to_csv(mapping_file, index=False)
+
+    return manifest_files[0], manifest_files[1], mapping_file
+
+def run_local(
+        campaign_dir: str,
+        num_workers: int,
+        scamper: str = None,
+) -> tuple:
+    """
+    Runs every worker of a planned campaign as a local process and merges
+    their outputs once they all finish.
+
+    With `fake_scamper.py` as `scamper`, each worker's fake scamper answers
+    from the topology planned for it, unless FAKE_SCAMPER_TOPOLOGY is set.
+    Raises RuntimeError without merging if any worker fails.
+    """
+    campaign = read_campaign(campaign_dir)
+    procs = []
+    for worker_id in range(num_workers):
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "worker",
+            "--campaign-dir", campaign_dir, "--worker-id", str(worker_id),
+        ]
+        env = None
+        if scamper is not None:
+            cmd += ["--scamper", scamper]
+            if os.path.basename(scamper) == "fake_scamper.py" and not os.environ.get("FAKE_SCAMPER_TOPOLOGY"):
+                endpoints_file = os.path.join(campaign_dir, campaign['workers'][worker_id]['endpoints_file'])
+                env = dict(os.environ, FAKE_SCAMPER_TOPOLOGY=os.path.abspath(endpoints_file))
+        procs.append(subprocess.Popen(cmd, env=env))
+
+    failed = [worker_id for worker_id, proc in enumerate(procs) if proc.wait() != 0]
+    if failed:
+        raise RuntimeError(
+            f"workers failed: {failed}, not merging a partial dataset "
+            f"(run `merge` to merge the outputs in {campaign_dir} anyway)"
+        )
+    return merge_campaign(campaign_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Roman HitchHiking from several vantage points")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = argparse.ArgumentParser(add_help=False)
+    plan_parser.add_argument("--sec-last-file", type=str, required=True,
+                             help="Endpoints with their pre-sat hops (sec_last_{asn}.csv)")
+    plan_parser.add_argument("--workers", type=int, required=True, help="Number of workers")
+    plan_parser.add_argument("--probe-interval", type=float, required=True, help="Seconds between probes")
+    plan_parser.add_argument("--num-probes", type=int, required=True, help="Number of probes (0 = continuous)")
+    plan_parser.add_argument("--start-delay", type=float, default=30,
+                             help="Seconds from planning until seq 0")
+    plan_parser.add_argument("--sample-size", type=int, default=None,
+                             help="Endpoints sampled per pre-sat hop (SECLAST grouping)")
+    plan_parser.add_argument("--combined", action="store_true",
+                             help="Probe pre-sat and endpoint TTLs of pre-sat representatives in one task")
+    plan_parser.add_argument("--rotate-minutes", type=float, default=None,
+                             help="Optional minutes after which workers start a new output segment")
+    plan_parser.add_argument("--compression", type=str, choices=["gzip", "zstd"], default=None,
+                             help="Optional compression of closed output segments")
+
+    campaign_parser = argparse.ArgumentParser(add_help=False)
+    campaign_parser.add_argument("--campaign-dir", type=str, required=True, help="Campaign directory")
+
+    scamper_parser = argparse.ArgumentParser(add_help=False)
+    scamper_parser.add_argument("--scamper", type=str, default=None,
+                                help="Optional scamper binary, e.g. fake_scamper.py for testing")
+
+    subparsers.add_parser("plan", parents=[campaign_parser, plan_parser], help="Split a campaign between workers")
+    worker_parser = subparsers.add_parser("worker", parents=[campaign_parser, scamper_parser], help="Run one worker")
+    worker_parser.add_argument("--worker-id", type=int, required=True, help="Worker to run")
+    subparsers.add_parser("merge", parents=[campaign_parser], help="Merge the outputs of all workers")
+    subparsers.add_parser("local", parents=[campaign_parser, plan_parser, scamper_parser],
+                          help="Plan, run all workers as local processes and merge")
+
+    args = parser.parse_args()
+
+    if args.command in ("plan", "local"):
+        plan_campaign(
+            pd.read_csv(args.sec_last_file),
+            args.campaign_dir,
+            args.workers,
+            args.probe_interval,
+            args.num_probes,
+            start_delay=args.start_delay,
+            grouping=Grouping.SECLAST if args.sample_size else None,
+            sample_size=args.sample_size,
+            combined=args.combined,
+            rotate_minutes=args.rotate_minutes,
+            compression=args.compression,
+        )
+
+    if args.command == "worker":
+        if args.scamper is not None:
+            run_scamper.scamper = args.scamper
+        run_worker(args.campaign_dir, args.worker_id)
+    elif args.command == "merge":
+        merge_campaign(args.campaign_dir)
+    elif args.command == "local":
+        run_local(args.campaign_dir, args.workers, scamper=args.scamper)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import shlex
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from scamper_records import cycle_records, make_hop, make_trace_record
+
+"""
+Stand-in for the scamper binary, for load-testing the probing loop without raw
+sockets or a satellite path. Select it with the module-level `scamper` setting:
+
+    import run_scamper
+    run_scamper.scamper = "/path/to/data_collection/fake_scamper.py"
+
+Supports the invocations used in run_scamper.py:
+    fake_scamper.py -O json -o <output> -p <pps> -c "trace ... [-S src] [-f first] [-m max]" <targets>
+
+Behaviour is configured through environment variables:
+- FAKE_SCAMPER_RTT_MS: mean endpoint rtt in ms (default 40)
+- FAKE_SCAMPER_LOSS: probability that a probe gets no reply (default 0)
+- FAKE_SCAMPER_DELAY: seconds to sleep before probing, to model startup (default 0)
+- FAKE_SCAMPER_TOPOLOGY: optional csv with 'dst', 'hop_count', 'sec_last_ip'
+  columns (e.g. a sec_last_{asn}.csv); paths are otherwise derived from a hash
+  of the destination
+"""
+
+def get_topology(topology_file: str) -> dict:
+    if not topology_file:
+        return {}
+    with open(topology_file, 'r', newline='') as f:
+        return {
+            row['dst']: (int(float(row['hop_count'])), row['sec_last_ip'])
+            for row in csv.DictReader(f)
+        }
+
+def get_path(dst: str, topology: dict) -> tuple:
+    """
+    Returns (hop_count, sec_last_ip) for `dst`. Destinations in the same /24
+    share a pre-sat hop when no topology is given.
+    """
+    if dst in topology:
+        return topology[dst]
+    subnet = dst.rsplit('.', 1)[0]
+    digest = hashlib.md5(subnet.encode()).digest()
+    return 10 + digest[0] % 5, f"206.224.{digest[1]}.{digest[2]}"
+
+def parse_trace_command(command: str) -> dict:
+    parser = argparse.ArgumentParser(prog="trace", add_help=False)
+    parser.add_argument("-P", dest="method", default="icmp-paris")
+    parser.add_argument("-S", dest="src", default="192.0.2.1")
+    parser.add_argument("-q", dest="attempts", type=int, default=2)
+    parser.add_argument("-f", dest="first_hop", type=int, default=1)
+    parser.add_argument("-m", dest="max_hop", type=int, default=255)
+    parser.add_argument("-g", dest="gap_limit", type=int, default=5)
+    args, _ = parser.parse_known_args(shlex.split(command)[1:])
+    return vars(args)
+
+def probe(
+        dst: str,
+        trace: dict,
+        topology: dict,
+        rtt_ms: float,
+        loss: float,
+        rng: random.Random,
+) -> dict:
+    """
+    Simulates one trace to `dst` and returns its scamper json record.
+    """
+    hop_count, sec_last_ip = get_path(dst, topology)
+    now = time.time()
+    sec, usec = int(now), int((now % 1) * 1e6)
+
+    hops = []
+    for ttl in range(trace['first_hop'], trace['max_hop'] + 1):
+        if rng.random() < loss:
+            continue
+        if ttl >= hop_count:
+            hops.append(make_hop(dst, ttl, rng.gauss(rtt_ms, rtt_ms / 10), sec, usec, True))
+            break
+        addr = sec_last_ip if ttl == hop_count - 1 else f"10.0.{ttl}.1"
+        rtt = rng.uniform(1, rtt_ms / 4) * ttl / hop_count
+        hops.append(make_hop(addr, ttl, rtt, sec, usec, False))
+
+    return make_trace_record(dst, trace['src'], trace['first_hop'], trace['max_hop'], sec, usec, hops)
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Fake scamper for load tests")
+    parser.add_argument("-O", dest="output_format", default="json")
+    parser.add_argument("-o", dest="output_file", required=True)
+    parser.add_argument("-p", dest="pps", type=int, default=100)
+    parser.add_argument("-c", dest="command", default="trace")
+    parser.add_argument("target_file")
+    args = parser.parse_args(argv)
+
+    if args.output_format != "json":
+        raise ValueError(f"fake scamper only supports json output, got: {args.output_format}")
+
+    rtt_ms = float(os.environ.get("FAKE_SCAMPER_RTT_MS", 40))
+    loss = float(os.environ.get("FAKE_SCAMPER_LOSS", 0))
+    delay = float(os.environ.get("FAKE_SCAMPER_DELAY", 0))
+    topology = get_topology(os.environ.get("FAKE_SCAMPER_TOPOLOGY"))
+
+    trace = parse_trace_command(args.command)
+    with open(args.target_file, 'r') as f:
+        targets = [line.strip() for line in f if line.strip()]
+
+    time.sleep(delay)
+    rng = random.Random()
+    start = time.time()
+    with open(args.output_file, 'w') as out:
+        cycle_start, cycle_stop = cycle_records(start, start)
+        out.write(json.dumps(cycle_start) + '\n')
+        for i, dst in enumerate(targets):
+            # pace probes at the requested packets per second
+            to_sleep = start + i / args.pps - time.time()
+            if to_sleep > 0:
+                time.sleep(to_sleep)
+            out.write(json.dumps(probe(dst, trace, topology, rtt_ms, loss, rng)) + '\n')
+        # wait for the last replies
+        time.sleep(rtt_ms / 1000)
+        cycle_stop['stop_time'] = int(time.time())
+        out.write(json.dumps(cycle_stop) + '\n')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+import run_scamper
+from fake_scamper import parse_trace_command
+from run_scamper import (
+    Grouping, concurrent_ttl_ping, modified_concurrent_ttl_ping_by_grouping,
+    round_robin_ttl_ping,
+)
+from scamper_records import cycle_records, make_hop, make_trace_record
+from synthetic_scamper import generate_endpoints
+
+"""
+Simulated LEO network for comparing probing strategies on outage-detection
+recall against the packets and CPU they spend.
+
+Customers sit behind pre-satellite hops. Every `epoch_seconds` each customer
+is reassigned a satellite (new satellite rtt, brief handover loss), outages of
+known length are injected, pre-satellite hops rate-limit the ICMP replies they
+generate, and background loss grows with the aggregate probe rate.
+
+The simulator replaces `run_scamper.scamper_popen`, so the probing functions
+in run_scamper.py run unmodified against it. Run from data_collection/:
+    python leo_simulator.py --endpoints 2000 --num-probes 120 --sample-size 4
+"""
+
+SIM_START_SEC = 1748349926
+
+class SimulatedScamper:
+    """
+    A finished-in-the-background scamper task, with the parts of the
+    subprocess.Popen interface used by run_scamper.py.
+    """
+    def __init__(self, thread: threading.Thread):
+        self.thread = thread
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not self.thread.is_alive():
+            self.returncode = 0
+        return self.returncode
+
+    def wait(self, timeout: float = None):
+        self.thread.join(timeout)
+        return self.poll()
+
+class LeoNetworkSimulator:
+    """
+    :param endpoints_df: customers, formatted like the output of
+                         `get_last_hops_from_paris_tr`
+    :param epoch_seconds: (optional) seconds between satellite reassignments
+    :param handover_seconds: (optional) seconds of loss after each reassignment
+    :param handover_loss: (optional) loss probability during a handover
+    :param outage_rate: (optional) expected outages per customer per hour
+    :param min_outage_len: (optional) minimum outage length in seconds
+    :param max_outage_len: (optional) maximum outage length in seconds
+    :param base_loss: (optional) loss probability of an idle network
+    :param loss_per_kpps: (optional) added endpoint loss per 1000 pps sent
+    :param icmp_rate_limit: (optional) ICMP replies a pre-sat hop sends per second
+    :param pps: (optional) probes per second of a single task, as in `-p`
+    :param time_scale: (optional) simulated seconds per wall-clock second
+    :param duration: (optional) simulated seconds to generate outages for
+    :param seed: (optional) random seed
+    """
+    def __init__(
+            self,
+            endpoints_df: pd.DataFrame,
+            epoch_seconds: float = 15,
+            handover_seconds: float = 0.5,
+            handover_loss: float = 0.5,
+            outage_rate: float = 2.0,
+            min_outage_len: float = 5,
+            max_outage_len: float = 75,
+            base_loss: float = 0.002,
+            loss_per_kpps: float = 0.01,
+            icmp_rate_limit: int = 10,
+            pps: int = 50000,
+            time_scale: float = 1.0,
+            duration: float = 3600,
+            seed: int = 0,
+    ):
+        self.epoch_seconds = epoch_seconds
+        self.handover_seconds = handover_seconds
+        self.handover_loss = handover_loss
+        self.base_loss = base_loss
+        self.loss_per_kpps = loss_per_kpps
+        self.icmp_rate_limit = icmp_rate_limit
+        self.pps = pps
+        self.time_scale = time_scale
+        self.seed = seed
+
+        self.paths = {
+            row.dst: (int(row.hop_count), row.sec_last_ip)
+            for row in endpoints_df.itertuples(index=False)
+        }
+        self.outages = self.generate_outages(
+            endpoints_df['dst'].tolist(), outage_rate, min_outage_len,
+            max_outage_len, duration,
+        )
+        self.outages_by_dst = {
+            dst: list(zip(group['start'], group['end']))
+            for dst, group in self.outages.groupby('dst')
+        }
+
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.packets = 0
+        self.cpu_seconds = 0             # CPU spent by the simulated scamper tasks
+        self.packets_per_sec = {}        # sim second -> probes sent
+        self.icmp_per_router_sec = {}    # (router, sim second) -> replies sent
+        self.start = None
+
+    def generate_outages(
+            self,
+            dsts: list,
+            outage_rate: float,
+            min_outage_len: float,
+            max_outage_len: float,
+            duration: float,
+    ) -> pd.DataFrame:
+        """
+        Ground truth outages: (dst, start, end) in simulated seconds.
+        """
+        rng = np.random.default_rng(self.seed)
+        counts = rng.poisson(outage_rate * duration / 3600, size=len(dsts))
+        dst_col = np.repeat(dsts, counts)
+        starts = rng.uniform(0, duration, size=len(dst_col))
+        lengths = rng.uniform(min_outage_len, max_outage_len, size=len(dst_col))
+        return pd.DataFrame({
+            'dst': dst_col,
+            'start': starts,
+            'end': starts + lengths,
+        })
+
+    def now(self) -> float:
+        if self.start is None:
+            self.start = time.time()
+        return (time.time() - self.start) * self.time_scale
+
+    def in_outage(self, dst: str, t: float) -> bool:
+        return any(start <= t < end for start, end in self.outages_by_dst.get(dst, []))
+
+    def satellite_rtt(self, dst: str, t: float) -> float:
+        epoch = int(t // self.epoch_seconds)
+        digest = hashlib.md5(f"{self.seed}:{dst}:{epoch}".encode()).digest()
+        return 20 + digest[0] / 255 * 40
+
+    def send(self, dst: str, ttl: int, t: float) -> tuple:
+        """
+        Sends one probe and returns (reply addr, rtt), or None if it is lost.
+        """
+        hop_count, sec_last_ip = self.paths.get(dst, (12, "206.224.255.255"))
+        second = int(t)
+        with self.lock:
+            self.packets += 1
+            self.packets_per_sec[second] = self.packets_per_sec.get(second, 0) + 1
+            load_loss = self.loss_per_kpps * self.packets_per_sec[second] / 1000
+            lost = self.rng.random() < self.base_loss + load_loss
+            if t % self.epoch_seconds < self.handover_seconds:
+                lost |= self.rng.random() < self.handover_loss
+
+            if ttl < hop_count - 1:
+                return None if lost else (f"10.0.{ttl}.1", self.rng.uniform(1, 5))
+
+            if ttl == hop_count - 1:
+                # the pre-sat hop rate-limits the ICMP replies it generates
+                key = (sec_last_ip, second)
+                replies = self.icmp_per_router_sec.get(key, 0)
+                if lost or replies >= self.icmp_rate_limit:
+                    return None
+                self.icmp_per_router_sec[key] = replies + 1
+                return sec_last_ip, self.rng.uniform(5, 15)
+
+        if lost or self.in_outage(dst, t):
+            return None
+        return dst, self.satellite_rtt(dst, t) + self.rng.uniform(5, 15)
+
+    def run_trace(self, cmd: list):
+        cpu_start = time.thread_time()
+        try:
+            self.simulate_trace(cmd)
+        finally:
+            with self.lock:
+                self.cpu_seconds += time.thread_time() - cpu_start
+
+    def simulate_trace(self, cmd: list):
+        output_file = cmd[cmd.index("-o") + 1]
+        pps = int(cmd[cmd.index("-p") + 1]) if "-p" in cmd else self.pps
+        trace = parse_trace_command(cmd[cmd.index("-c") + 1])
+        with open(cmd[-1], 'r') as f:
+            targets = [line.strip() for line in f if line.strip()]
+
+        start = self.now()
+        wall_start = time.time()
+        records = []
+        for i, dst in enumerate(targets):
+            t = start + i / pps * self.time_scale
+            sec = SIM_START_SEC + int(t)
+            usec = int((t % 1) * 1e6)
+            hops = []
+            for ttl in range(trace['first_hop'], trace['max_hop'] + 1):
+                reply = self.send(dst, ttl, t)
+                if reply is None:
+                    continue
+                addr, rtt = reply
+                hops.append(make_hop(addr, ttl, rtt, sec, usec, addr == dst))
+                if addr == dst:
+                    break
+            records.append(make_trace_record(dst, trace['src'], trace['first_hop'], trace['max_hop'], sec, usec, hops))
+
+        # the task takes as long as pacing the targets at `pps` would
+        to_sleep = len(targets) / pps - (time.time() - wall_start)
+        if to_sleep > 0:
+            time.sleep(to_sleep)
+
+        with open(output_file, 'w') as out:
+            cycle_start, cycle_stop = cycle_records(SIM_START_SEC + int(start), SIM_START_SEC + int(self.now()))
+            out.write(json.dumps(cycle_start) + '\n')
+            for record in records:
+                out.write(json.dumps(record) + '\n')
+            out.write(json.dumps(cycle_stop) + '\n')
+
+    def popen(self, cmd: list, *args, **kwargs) -> SimulatedScamper:
+        """
+        Drop-in for `run_scamper.scamper_popen`.
+        """
+        self.now()
+        thread = threading.Thread(target=self.run_trace, args=(cmd,), daemon=True)
+        thread.start()
+        return SimulatedScamper(thread)
+
+def get_detected_outages(
+        endpoint_file: str,
+        seclast_file: str,
+        endpoints_df: pd.DataFrame,
+        min_outage_len: int = 5,
+) -> pd.DataFrame:
+    """
+    Applies the Roman HitchHiking outage definition (endpoint lost while its
+    pre-sat hop responds, for at least `min_outage_len` consecutive seqs) to a
+    strategy's output.
+
+    Pre-sat measurements are matched to endpoints through their pre-sat hop,
+    so the naive, round-robin and Roman outputs are all evaluated the same way.
+
+    :return: dataframe of detected outages: 'dst', 'start', 'end' in simulated
+             seconds
+    """
+    router_of_dst = endpoints_df.set_index('dst')['sec_last_ip']
+    endpoint_df = pd.read_csv(endpoint_file)
+    seclast_df = pd.read_csv(seclast_file)
+
+    endpoint_df['router'] = endpoint_df['dst'].map(router_of_dst)
+    seclast_df['router'] = seclast_df['dst'].map(router_of_dst)
+    seclast_ok = (
+        seclast_df
+        .assign(presat_ok=seclast_df['rtt'].notna())
+        .groupby(['seq', 'router'])['presat_ok']
+        .any()
+        .reset_index()
+    )
+    df = endpoint_df.merge(seclast_ok, how='left', on=['seq', 'router'])
+    df['is_outage'] = df['rtt'].isna() & df['presat_ok'].fillna(False).astype(bool)
+    df = df.sort_values(['dst', 'seq'])
+
+    # consecutive outage seqs per dst
+    outage_df = df[df['is_outage']]
+    new_run = (
+        (outage_df['dst'] != outage_df['dst'].shift())
+        | (outage_df['seq'] != outage_df['seq'].shift() + 1)
+    )
+    outage_df = outage_df.assign(run=new_run.cumsum())
+    runs = outage_df.groupby('run').agg(
+        dst=('dst', 'first'),
+        start=('start_sec', 'min'),
+        end=('start_sec', 'max'),
+        len=('seq', 'size'),
+    )
+    runs = runs[runs['len'] >= min_outage_len]
+    runs[['start', 'end']] = runs[['start', 'end']] - SIM_START_SEC
+    return runs.reset_index(drop=True)
+
+def score_detection(
+        detected_df: pd.DataFrame,
+        truth_df: pd.DataFrame,
+        probed_dsts: set,
+        window: tuple,
+        min_outage_len: int = 5,
+) -> dict:
+    """
+    Recall of ground truth outages (that are long enough and fall inside the
+    probing window for probed customers) and precision of detected outages.
+    """
+    truth_df = truth_df[
+        truth_df['dst'].isin(probed_dsts)
+        & (truth_df['start'] >= window[0])
+        & (truth_df['end'] <= window[1])
+        & (truth_df['end'] - truth_df['start'] >= min_outage_len)
+    ]
+    pairs = truth_df.reset_index().merge(
+        detected_df.reset_index(), on='dst', suffixes=['_truth', '_detected'],
+    )
+    pairs = pairs[(pairs['start_detected'] <= pairs['end_truth']) & (pairs['end_detected'] >= pairs['start_truth'])]
+
+    return {
+        'true_outages': len(truth_df),
+        'detected_outages': len(detected_df),
+        'recall': pairs['index_truth'].nunique() / len(truth_df) if len(truth_df) else float('nan'),
+        'precision': pairs['index_detected'].nunique() / len(detected_df) if len(detected_df) else float('nan'),
+    }
+
+def get_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def run_strategy(
+        strategy: str,
+        endpoints_df: pd.DataFrame,
+        output_dir: str,
+        wait_probe: float,
+        num_probes: int,
+        sample_size: int = None,
+        **simulator_kwargs,
+) -> dict:
+    """
+    Runs one probing strategy ('naive', 'round_robin' or 'roman') against a
+    fresh simulator and scores its outage detection. 'cpu_seconds' is the
+    collector's CPU, without the 'simulator_cpu_seconds' of the simulated
+    scamper tasks.
+    """
+    asn = "AS14593"
+    simulator = LeoNetworkSimulator(endpoints_df, **simulator_kwargs)
+    output_file = f"{output_dir}/{strategy}_{asn}"
+
+    original_popen = run_scamper.scamper_popen
+    run_scamper.scamper_popen = simulator.popen
+    # the simulated scamper tasks run as threads of this process, so their CPU
+    # is subtracted to leave the collector's
+    cpu_start = get_cpu_seconds()
+    wall_start = time.time()
+    try:
+        if strategy == 'naive':
+            concurrent_ttl_ping(endpoints_df.copy(), asn, output_file, wait_probe=wait_probe, num_probes=num_probes)
+        elif strategy == 'round_robin':
+            round_robin_ttl_ping(endpoints_df.copy(), output_file, wait_probe=wait_probe, num_probes=num_probes)
+        elif strategy == 'roman':
+            modified_concurrent_ttl_ping_by_grouping(
+                endpoints_df.copy(), asn, output_file,
+                wait_probe=wait_probe,
+                num_probes=num_probes,
+                grouping=Grouping.SECLAST,
+                sample_size=sample_size,
+                slash=None,
+                multiple_src_ips=False,
+                output_dir=output_dir,
+            )
+        else:
+            raise ValueError(f"Unknown strategy: {strategy}")
+    finally:
+        run_scamper.scamper_popen = original_popen
+    cpu_seconds = get_cpu_seconds() - cpu_start
+    sim_end = simulator.now()
+
+    endpoint_file = f"{output_file}_endpoint.csv"
+    seclast_file = f"{output_file}_sec_last.csv"
+    probed_dsts = set(pd.read_csv(endpoint_file, usecols=['dst'])['dst'])
+    detected_df = get_detected_outages(endpoint_file, seclast_file, endpoints_df)
+    scores = score_detection(detected_df, simulator.outages, probed_dsts, (0, sim_end))
+
+    return {
+        'strategy': strategy,
+        'sample_size': sample_size,
+        'probed_endpoints': len(probed_dsts),
+        'packets': simulator.packets,
+        'cpu_seconds': cpu_seconds - simulator.cpu_seconds,
+        'simulator_cpu_seconds': simulator.cpu_seconds,
+        'wall_seconds': time.time() - wall_start,
+        **scores,
+    }
+
+def compare_strategies(
+        endpoints_df: pd.DataFrame,
+        output_dir: str,
+        wait_probe: float = 1,
+        num_probes: int = 120,
+        sample_sizes: list = None,
+        strategies: list = None,
+        **simulator_kwargs,
+) -> pd.DataFrame:
+    """
+    Runs each strategy (and each Roman `sample_size`) against the same simulated
+    network and returns recall, precision, packets and CPU per run.
+    """
+    if sample_sizes is None:
+        sample_sizes = [4]
+    if strategies is None:
+        strategies = ['naive', 'round_robin', 'roman']
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    for strategy in strategies:
+        for sample_size in (sample_sizes if strategy == 'roman' else [None]):
+            print(f"----simulating {strategy}{f' (sample size {sample_size})' if sample_size else ''}")
+            results.append(run_strategy(
+                strategy, endpoints_df, output_dir, wait_probe, num_probes,
+                sample_size=sample_size, **simulator_kwargs,
+            ))
+    return pd.DataFrame(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare probing strategies on a simulated LEO network")
+    parser.add_argument("--endpoints", type=int, default=2000, help="Number of customer endpoints")
+    parser.add_argument("--probe-interval", type=float, default=1, help="Seconds between probes")
+    parser.add_argument("--num-probes", type=int, default=120, help="Number of probe rounds")
+    parser.add_argument("--sample-size", type=int, nargs="+", default=[4],
+                        help="Roman sample sizes to compare")
+    parser.add_argument("--strategies", type=str, nargs="+", default=['naive', 'round_robin', 'roman'])
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Simulated seconds per wall-clock second")
+    parser.add_argument("--outage-rate", type=float, default=2.0, help="Outages per customer per hour")
+    parser.add_argument("--icmp-rate-limit", type=int, default=10, help="ICMP replies per pre-sat hop per second")
+    parser.add_argument("--output-dir", type=str, default=None, help="Output directory (default: temporary)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    endpoints_df = generate_endpoints(args.endpoints, seed=args.seed)
+    results_df = compare_strategies(
+        endpoints_df,
+        args.output_dir or tempfile.mkdtemp(prefix="roman_hh_sim_"),
+        wait_probe=args.probe_interval / args.time_scale,
+        num_probes=args.num_probes,
+        sample_sizes=args.sample_size,
+        strategies=args.strategies,
+        time_scale=args.time_scale,
+        outage_rate=args.outage_rate,
+        icmp_rate_limit=args.icmp_rate_limit,
+        duration=args.num_probes * args.probe_interval + 60,
+        seed=args.seed,
+    )
+    print(results_df.to_string(index=False))
@@ -0,0 +1,191 @@
+import argparse
+import os
+import resource
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+import run_scamper
+from run_scamper import Grouping, modified_concurrent_ttl_ping_by_grouping
+from synthetic_scamper import generate_endpoints
+
+"""
+Drives `modified_concurrent_ttl_ping_by_grouping` with the fake scamper binary
+at a target probe rate and reports spawn overhead, round jitter, aggregation
+lag and CPU per probe.
+
+Run from data_collection/:
+    python load_harness.py --endpoints 20000 --probe-interval 1 --num-probes 30
+"""
+
+FAKE_SCAMPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_scamper.py")
+
+class LoadStats:
+    """
+    Collects timings from the instrumented `scamper_popen` and `iter_ttl_rows`.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spawns = []        # (seq, spawn start, spawn seconds, num targets)
+        self.aggregations = []  # lag seconds from output written to parsed
+        self.targets_per_file = {}
+
+    def count_targets(self, input_file: str) -> int:
+        if input_file not in self.targets_per_file:
+            with open(input_file, 'r') as f:
+                self.targets_per_file[input_file] = sum(1 for line in f if line.strip())
+        return self.targets_per_file[input_file]
+
+def get_seq(output_file: str) -> int:
+    # temp outputs are named {type}_{seq}_{uuid}.json
+    return int(os.path.basename(output_file).split('_')[1])
+
+def instrument(stats: LoadStats):
+    """
+    Wraps `run_scamper.scamper_popen` and `run_scamper.iter_ttl_rows` to record
+    timings. Returns a function that restores the originals.
+    """
+    original_popen = run_scamper.scamper_popen
+    original_iter_ttl_rows = run_scamper.iter_ttl_rows
+
+    def timed_popen(cmd, *args, **kwargs):
+        start = time.perf_counter()
+        proc = original_popen(cmd, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if isinstance(cmd, list) and cmd[0] == run_scamper.scamper:
+            output_file = cmd[cmd.index("-o") + 1]
+            with stats.lock:
+                stats.spawns.append((get_seq(output_file), start, elapsed, stats.count_targets(cmd[-1])))
+        return proc
+
+    def timed_iter_ttl_rows(f_info: dict):
+        if os.path.exists(f_info['output_file']):
+            lag = time.time() - os.path.getmtime(f_info['output_file'])
+            with stats.lock:
+                stats.aggregations.append(lag)
+        return original_iter_ttl_rows(f_info)
+
+    run_scamper.scamper_popen = timed_popen
+    run_scamper.iter_ttl_rows = timed_iter_ttl_rows
+
+    def restore():
+        run_scamper.scamper_popen = original_popen
+        run_scamper.iter_ttl_rows = original_iter_ttl_rows
+
+    return restore
+
+def summarize(values: list, scale: float = 1.0) -> str:
+    if len(values) == 0:
+        return "n/a"
+    values = np.asarray(values) * scale
+    return (
+        f"mean {values.mean():.2f}  p50 {np.percentile(values, 50):.2f}  "
+        f"p99 {np.percentile(values, 99):.2f}  max {values.max():.2f}"
+    )
+
+def report(stats: LoadStats, wait_probe: float, elapsed: float, cpu: dict):
+    spawns = pd.DataFrame(stats.spawns, columns=['seq', 'start', 'seconds', 'targets'])
+    round_starts = spawns.groupby('seq')['start'].min().sort_index()
+    round_intervals = round_starts.diff().dropna()
+    jitter = (round_intervals - wait_probe).abs()
+    num_probes = spawns['targets'].sum()
+    lags = stats.aggregations
+
+    print("-----------------------------------------------------------------")
+    print(f"rounds: {len(round_starts)}  tasks: {len(spawns)}  probes: {num_probes:,}")
+    print(f"achieved pps: {num_probes / elapsed:,.0f}")
+    print(f"spawn overhead (ms): {summarize(spawns['seconds'], 1000)}")
+    print(f"spawn time per round (ms): {summarize(spawns.groupby('seq')['seconds'].sum(), 1000)}")
+    print(f"round jitter (ms): {summarize(jitter, 1000)}")
+    print(f"aggregation lag (s): {summarize(lags)}")
+    print(f"collector cpu per probe (us): {cpu['self'] / max(num_probes, 1) * 1e6:.2f}")
+    print(f"scamper cpu per probe (us): {cpu['children'] / max(num_probes, 1) * 1e6:.2f}")
+    print("-----------------------------------------------------------------")
+
+def get_cpu_seconds(who: int) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+def run_load_test(
+        num_endpoints: int,
+        wait_probe: float,
+        num_probes: int,
+        output_dir: str,
+        grouping: Grouping = None,
+        sample_size: int = None,
+        rtt_ms: float = 40,
+        loss: float = 0,
+        delay: float = 0,
+        seed: int = 0,
+) -> LoadStats:
+    os.makedirs(output_dir, exist_ok=True)
+    asn = "AS14593"
+    sec_to_last_df = generate_endpoints(num_endpoints, seed=seed)
+    topology_file = f"{output_dir}/sec_last_{asn}.csv"
+    sec_to_last_df.to_csv(topology_file, index=None)
+
+    os.environ["FAKE_SCAMPER_RTT_MS"] = str(rtt_ms)
+    os.environ["FAKE_SCAMPER_LOSS"] = str(loss)
+    os.environ["FAKE_SCAMPER_DELAY"] = str(delay)
+    os.environ["FAKE_SCAMPER_TOPOLOGY"] = topology_file
+
+    original_scamper = run_scamper.scamper
+    run_scamper.scamper = FAKE_SCAMPER
+    stats = LoadStats()
+    restore = instrument(stats)
+
+    cpu_start = {
+        'self': get_cpu_seconds(resource.RUSAGE_SELF),
+        'children': get_cpu_seconds(resource.RUSAGE_CHILDREN),
+    }
+    start = time.time()
+    try:
+        modified_concurrent_ttl_ping_by_grouping(
+            sec_to_last_df, asn,
+            output_file=f"{output_dir}/{asn}",
+            wait_probe=wait_probe,
+            num_probes=num_probes,
+            grouping=grouping,
+            sample_size=sample_size,
+            slash=None,
+            multiple_src_ips=True,
+            output_dir=output_dir,
+        )
+    finally:
+        restore()
+        run_scamper.scamper = original_scamper
+    elapsed = time.time() - start
+    cpu = {
+        'self': get_cpu_seconds(resource.RUSAGE_SELF) - cpu_start['self'],
+        'children': get_cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_start['children'],
+    }
+
+    report(stats, wait_probe, elapsed, cpu)
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the probing loop with a fake scamper")
+    parser.add_argument("--endpoints", type=int, default=10000, help="Number of customer endpoints")
+    parser.add_argument("--probe-interval", type=float, default=1, help="Seconds between probes")
+    parser.add_argument("--num-probes", type=int, default=30, help="Number of probe rounds")
+    parser.add_argument("--sample-size", type=int, default=None,
+                        help="Endpoints sampled per pre-sat hop (SECLAST grouping)")
+    parser.add_argument("--rtt-ms", type=float, default=40, help="Mean fake rtt in ms")
+    parser.add_argument("--loss", type=float, default=0, help="Fake per-probe loss rate")
+    parser.add_argument("--delay", type=float, default=0, help="Fake scamper startup delay in seconds")
+    parser.add_argument("--output-dir", type=str, default=None, help="Output directory (default: temporary)")
+    args = parser.parse_args()
+
+    run_load_test(
+        args.endpoints,
+        args.probe_interval,
+        args.num_probes,
+        args.output_dir or tempfile.mkdtemp(prefix="roman_hh_load_"),
+        grouping=Grouping.SECLAST if args.sample_size else None,
+        sample_size=args.sample_size,
+        rtt_ms=args.rtt_ms,
+        loss=args.loss,
+        delay=args.delay,
+    )
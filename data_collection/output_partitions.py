@@ -0,0 +1,209 @@
+import gzip
+import json
+import os
+import shutil
+import time
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+Rotating output partitions for long-running captures.
+
+Instead of appending forever to `{output_file}_endpoint.csv`, each stream is
+written as a series of segments:
+    {output_file}_endpoint.00000.csv.partial   (open, being appended to)
+    {output_file}_endpoint.00000.csv[.gz|.zst] (closed, never modified again)
+    {output_file}_endpoint.manifest.json
+
+A segment is closed once it is older than `rotate_seconds` or larger than
+`rotate_bytes`, compressed if requested, and renamed into place, so readers
+never see a partial write. The manifest lists the closed segments in order
+with their row count and seq and start_sec ranges, so loaders can read only
+the segments they need (see `read_measurements` in paper/scripts/src/import_data.py).
+"""
+
+COMPRESSION_EXTENSIONS = {
+    None: "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+def get_manifest_file(output_file: str, stream: str) -> str:
+    return f"{output_file}_{stream}.manifest.json"
+
+def read_manifest(manifest_file: str) -> dict:
+    with open(manifest_file, 'r') as f:
+        return json.load(f)
+
+def compress_file(src_file: str, dst_file: str, compression: str):
+    with open(src_file, 'rb') as src:
+        if compression == "gzip":
+            with gzip.open(dst_file, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        elif compression == "zstd":
+            with open(dst_file, 'wb') as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+        else:
+            raise ValueError(f"unknown compression: {compression}")
+
+class PartitionedWriter:
+    """
+    Appends dataframes to rotating csv segments of one output stream.
+
+    :param output_file: output prefix, as passed to the probing functions
+    :param stream: stream name, e.g. 'endpoint' or 'sec_last'
+    :param rotate_seconds: (optional) close a segment once it is this old
+    :param rotate_bytes: (optional) close a segment once it is this large
+    :param compression: (optional) 'gzip' or 'zstd' for closed segments
+    """
+    def __init__(
+            self,
+            output_file: str,
+            stream: str,
+            rotate_seconds: float = None,
+            rotate_bytes: int = None,
+            compression: str = None,
+    ):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"compression must be one of {list(COMPRESSION_EXTENSIONS)}, got: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires the 'zstandard' package")
+
+        self.prefix = f"{output_file}_{stream}"
+        self.rotate_seconds = rotate_seconds
+        self.rotate_bytes = rotate_bytes
+        self.compression = compression
+        self.manifest_file = get_manifest_file(output_file, stream)
+
+        if os.path.exists(self.manifest_file):
+            self.manifest = read_manifest(self.manifest_file)
+        else:
+            self.manifest = {'stream': stream, 'segments': []}
+        self.segment_index = len(self.manifest['segments'])
+        self.segment = None
+
+        # a segment closed by a previous run that stopped before recording it
+        segment_file = self.get_segment_file()
+        if os.path.exists(segment_file):
+            if os.path.exists(self.get_partial_file()):
+                os.remove(self.get_partial_file())
+            self.segment = self.new_segment_info(os.path.getmtime(segment_file))
+            self.update_segment_info(pd.read_csv(segment_file))
+            self.record_segment(segment_file)
+
+        # a segment left open by a previous run is closed as is
+        partial_file = self.get_partial_file()
+        if os.path.exists(partial_file):
+            self.recover_partial(partial_file)
+
+    def get_partial_file(self) -> str:
+        return f"{self.prefix}.{self.segment_index:05d}.csv.partial"
+
+    def get_segment_file(self) -> str:
+        return (
+            f"{self.prefix}.{self.segment_index:05d}.csv"
+            f"{COMPRESSION_EXTENSIONS[self.compression]}"
+        )
+
+    def recover_partial(self, partial_file: str):
+        with open(partial_file, 'rb+') as f:
+            data = f.read()
+            # drop a trailing partial line from an interrupted write
+            f.truncate(data.rfind(b'\n') + 1)
+        if os.path.getsize(partial_file) == 0:
+            os.remove(partial_file)
+            return
+        df = pd.read_csv(partial_file)
+        print(f"recovered {len(df)} rows from {partial_file}")
+        self.segment = self.new_segment_info(os.path.getmtime(partial_file))
+        self.update_segment_info(df)
+        self.close_segment()
+
+    def new_segment_info(self, opened_at: float) -> dict:
+        return {
+            'file': None,
+            'opened_at': opened_at,
+            'rows': 0,
+            'min_seq': None,
+            'max_seq': None,
+            'min_start_sec': None,
+            'max_start_sec': None,
+        }
+
+    def update_segment_info(self, df: pd.DataFrame):
+        if len(df) == 0:
+            return
+        segment = self.segment
+        segment['rows'] += len(df)
+        for key in ['seq', 'start_sec']:
+            values = pd.to_numeric(df[key], errors='coerce').dropna()
+            if len(values) == 0:
+                continue
+            low, high = int(values.min()), int(values.max())
+            min_key, max_key = f"min_{key}", f"max_{key}"
+            segment[min_key] = low if segment[min_key] is None else min(segment[min_key], low)
+            segment[max_key] = high if segment[max_key] is None else max(segment[max_key], high)
+
+    def write(self, df: pd.DataFrame) -> int:
+        """
+        Appends `df` to the open segment, closing it afterwards if it is due
+        for rotation.
+
+        :return: number of bytes written
+        """
+        partial_file = self.get_partial_file()
+        if self.segment is None:
+            self.segment = self.new_segment_info(time.time())
+        size_before = os.path.getsize(partial_file) if os.path.exists(partial_file) else 0
+        df.to_csv(partial_file, mode='a', header=size_before == 0, index=False)
+        size_after = os.path.getsize(partial_file)
+        self.update_segment_info(df)
+
+        if (
+            (self.rotate_bytes is not None and size_after >= self.rotate_bytes)
+            or (self.rotate_seconds is not None
+                and time.time() - self.segment['opened_at'] >= self.rotate_seconds)
+        ):
+            self.close_segment()
+        return size_after - size_before
+
+    def close_segment(self):
+        """
+        Finalizes the open segment: compresses it if requested, renames it into
+        place and records it in the manifest.
+        """
+        if self.segment is None:
+            return
+        partial_file = self.get_partial_file()
+        segment_file = self.get_segment_file()
+        if self.compression is None:
+            os.replace(partial_file, segment_file)
+        else:
+            tmp_file = f"{segment_file}.tmp"
+            compress_file(partial_file, tmp_file, self.compression)
+            os.replace(tmp_file, segment_file)
+            os.remove(partial_file)
+        self.record_segment(segment_file)
+
+    def record_segment(self, segment_file: str):
+        self.segment['file'] = os.path.basename(segment_file)
+        self.segment['bytes'] = os.path.getsize(segment_file)
+        self.segment['closed_at'] = time.time()
+        self.manifest['segments'].append(self.segment)
+        self.write_manifest()
+
+        self.segment = None
+        self.segment_index += 1
+
+    def write_manifest(self):
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_file, self.manifest_file)
+
+    def close(self):
+        self.close_segment()
@@ -1,15 +1,23 @@
 import json
+import time
+import numpy as np
 import pandas as pd
 from datetime import datetime, timezone
 
-from src.get_asn import get_all_asn
-
-def get_last_hops_from_paris_tr(file_path: str, asn: str) -> pd.DataFrame:
+def get_last_hops_from_paris_tr(
+        file_path: str,
+        asn: str,
+        asn_df: pd.DataFrame = None,
+) -> pd.DataFrame:
     """
     Extract the hop number and IPs for the second-to-last and last hop in
     ICMP paris-traceroutes.
 
     :param file_path: file path to the .json formatted scamper trace output
+    :param asn: ASN the second-to-last hops must belong to
+    :param asn_df: (optional) known 'ip' to 'asn' mapping, formatted like
+                   `get_all_asn`. Second-to-last hops missing from it are
+                   looked up with `get_all_asn`.
     :return: dataframe with the IPs and hop numbers of the second-to-last and
     last hops in the traceroutes as well as the stop reason.
     """
@@ -44,7 +52,17 @@ def get_last_hops_from_paris_tr(file_path: str, asn: str) -> pd.DataFrame:
 
     # ensure all second-to-last-hops are from correct ASN (eliminate traceroutes with little visibility)
     sec_last_ips = list(df['sec_last_ip'].unique())
-    asn_df = get_all_asn(sec_last_ips)
+    # requests is only imported when IPs have to be looked up, not by the
+    # parsing workers or when `asn_df` already covers every IP
+    if asn_df is None:
+        from src.get_asn import get_all_asn
+        asn_df = get_all_asn(sec_last_ips)
+    else:
+        known_ips = set(asn_df['ip'])
+        unknown_ips = [ip for ip in sec_last_ips if ip not in known_ips]
+        if unknown_ips:
+            from src.get_asn import get_all_asn
+            asn_df = pd.concat([asn_df, get_all_asn(unknown_ips)], ignore_index=True)
     print(asn_df)
     asn_df = asn_df[asn_df['asn'] == asn]
     validated_sec_last_ips = asn_df['ip'].tolist()
@@ -106,12 +124,105 @@ def ping_to_df(file_path: str) -> pd.DataFrame:
     df = pd.DataFrame(data)
     return df
 
+# columns of the endpoint and sec_last outputs and their buffer dtypes
+TTL_OUTPUT_DTYPES = {
+    'date': 'object',
+    'seq': 'int64',
+    'dst': 'object',
+    'stop_reason': 'object',
+    'start_time': 'object',
+    'start_sec': 'int64',
+    'hop_count': 'int64',
+    'ip_at_ttl': 'object',
+    'probe_ttl': 'float64',
+    'rtt': 'float64',
+}
+DST_COLUMN = list(TTL_OUTPUT_DTYPES).index('dst')
+IP_AT_TTL_COLUMN = list(TTL_OUTPUT_DTYPES).index('ip_at_ttl')
+RTT_COLUMN = list(TTL_OUTPUT_DTYPES).index('rtt')
+
+def iter_ttl_rows(f_info: dict):
+    """
+    Parses one scamper output of single-TTL traces line by line, yielding one
+    row per trace with the columns of `TTL_OUTPUT_DTYPES`. Rows match those of
+    `aggregate_data`, without building a dataframe per file.
+
+    :param f_info: file info dict in the format expected by `aggregate_data`
+    """
+    seq = f_info['seq']
+    select_ttl = f_info.get('select_ttl')
+    try:
+        with open(f_info['output_file'], 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Could not parse line of seq {seq}: {f_info['output_file']}")
+                    continue
+                if record.get('type') != 'trace' or 'start' not in record:
+                    continue
+
+                try:
+                    hops = record.get('hops') or []
+                    hop_count = record['hop_count']
+                    if select_ttl is not None:
+                        hop_count = record[select_ttl]
+                        hops = [hop for hop in hops if hop['probe_ttl'] == hop_count]
+
+                    start = record['start']
+                    ftime = start.get('ftime')
+                    if hops:
+                        hop = hops[0]
+                        ip_at_ttl, probe_ttl, rtt = hop['addr'], hop['probe_ttl'], hop['rtt']
+                    else:
+                        ip_at_ttl, probe_ttl, rtt = None, float('nan'), float('nan')
+                    row = (
+                        ftime.split()[0] if ftime else None,
+                        seq,
+                        record['dst'],
+                        record['stop_reason'],
+                        ftime,
+                        start['sec'],
+                        hop_count,
+                        ip_at_ttl,
+                        probe_ttl,
+                        rtt,
+                    )
+                except (KeyError, TypeError, AttributeError) as e:
+                    # a record missing a field is skipped, not the rest of the file
+                    print(f"Could not parse record of seq {seq}: {f_info['output_file']}: {e!r}")
+                    continue
+                yield row
+    except FileNotFoundError:
+        print(f"Could not load json file with seq: {seq}")
+
+def parse_ttl_columns(f_info: dict) -> tuple:
+    """
+    Parses one scamper output like `iter_ttl_rows`, returning its rows as one
+    typed array per column of `TTL_OUTPUT_DTYPES`, so that a parsing process
+    can hand back a whole file at once.
+
+    :param f_info: file info dict in the format expected by `aggregate_data`
+    :return: (list of column arrays, seconds spent parsing)
+    """
+    parse_start = time.time()
+    rows = list(iter_ttl_rows(f_info))
+    columns = zip(*rows) if rows else [[]] * len(TTL_OUTPUT_DTYPES)
+    arrays = [
+        np.array(column, dtype=dtype)
+        for column, dtype in zip(columns, TTL_OUTPUT_DTYPES.values())
+    ]
+    return arrays, time.time() - parse_start
+
 def aggregate_data(files_info: list) -> pd.DataFrame:
     """
     Aggregates data from list of files containing scamper outputs when running ttl_ping
     into a single file.
 
-    :param files: list of .json files from scamper output
+    :param files: list of .json files from scamper output, 'input_file' may be
+                  None for outputs recovered after a restart. Outputs of traces
+                  over several TTLs set 'select_ttl' to the record field
+                  ('firsthop' or 'hoplimit') holding the TTL whose reply to keep.
     :return: a single aggregated dataframe with column for seq numbers
     """
 
@@ -148,6 +259,11 @@ def aggregate_data(files_info: list) -> pd.DataFrame:
             return hops[0]['addr']
         except:
             return None
+    def select_hop(row, select_ttl):
+        if not isinstance(row['hops'], list):
+            return None
+        hops = [hop for hop in row['hops'] if hop['probe_ttl'] == row[select_ttl]]
+        return hops if hops else None
 
     dfs = []
     for idx, f_info in enumerate(files_info):
@@ -164,8 +280,9 @@ def aggregate_data(files_info: list) -> pd.DataFrame:
 
         if df.empty:
             print(f"File was empty: {input_file_name}")
-            with open(input_file_name, 'r') as f:
-                print(f.read())
+            if input_file_name is not None:
+                with open(input_file_name, 'r') as f:
+                    print(f.read())
             print("\n\n\n")
             continue
         try: 
@@ -177,6 +294,9 @@ def aggregate_data(files_info: list) -> pd.DataFrame:
             df['start_time'] = df['start'].apply(get_start_time)
             df['start_sec'] = df['start'].apply(get_start_sec)
             if 'hops' in df.columns:
+                if f_info.get('select_ttl') is not None:
+                    df['hops'] = df.apply(select_hop, axis=1, args=(f_info['select_ttl'],))
+                    df['hop_count'] = df[f_info['select_ttl']]
                 df['ip_at_ttl'] = df['hops'].apply(get_ip_at_ttl)
                 df['probe_ttl'] = df['hops'].apply(get_probe_ttl)
                 df['rtt'] = df['hops'].apply(get_rtt)
@@ -191,8 +311,9 @@ def aggregate_data(files_info: list) -> pd.DataFrame:
         except Exception as e:
             print(f"Could not parse: {e}")
             print(f"Using input_file: {input_file_name} on hop: {hop}")
-            with open(input_file_name, 'r') as f:
-                print(f.read())
+            if input_file_name is not None:
+                with open(input_file_name, 'r') as f:
+                    print(f.read())
             print("\n\n\n")
         dfs.append(df)
 
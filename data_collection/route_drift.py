@@ -0,0 +1,163 @@
+import threading
+
+"""
+Route drift detection for a running campaign.
+
+Endpoints are probed at the hop_count found by the discovery traceroutes and
+pre-sat representatives at the sec_last_hop, so a path that changes length
+afterwards makes the probes land on the wrong hop:
+- an endpoint probe answered by an address other than the endpoint means
+  the path got longer
+- a pre-sat probe answered by the endpoint itself means the path got shorter
+
+After `mismatch_after` such replies in a row, the target is suspended from
+its probe group and paris-tracerouted again in the background. The probing
+loop then moves it to the group of its new TTLs, or back to its old group if
+the traceroute found no valid path, between rounds. Endpoints whose path got
+shorter keep answering at their old TTL, so only pre-sat probes catch those.
+"""
+
+class RouteDriftMonitor:
+    """
+    Tracks consecutive mismatched replies per probed target.
+
+    :param mismatch_after: (optional) consecutive mismatched replies after
+                           which a target is re-tracerouted
+    :param max_batch: (optional) targets re-tracerouted at once
+    """
+    def __init__(
+            self,
+            mismatch_after: int = 3,
+            max_batch: int = 1000,
+    ):
+        if mismatch_after < 1:
+            raise ValueError("'mismatch_after' must be at least 1")
+
+        self.mismatch_after = mismatch_after
+        self.max_batch = max_batch
+        self.retrace = None
+
+        self.lock = threading.Lock()
+        # (role, dst) -> probe group, hop_count for 'endpoint' and
+        # (sec_last_hop, hop_count) for 'seclast'
+        self.groups = {}
+        self.mismatches = {}
+        # (role, dst) -> first seq probed in its current group
+        self.valid_from = {}
+        self.suspended = {}
+        self.new_suspended = []
+        self.to_trace = set()
+        self.moves = []
+        self.trace_thread = None
+        self.retraced = 0
+        self.moved = 0
+
+    def track(self, plan: dict, retrace):
+        """
+        Starts tracking the targets of a probe plan.
+
+        :param plan: plan from `build_probe_plan`
+        :param retrace: function paris-tracerouting a list of dsts, returning a
+                        dataframe formatted like `get_last_hops_from_paris_tr`
+        """
+        self.retrace = retrace
+        with self.lock:
+            for hop, dsts in plan['endpoint']:
+                for dst in dsts:
+                    self.groups[('endpoint', dst)] = hop
+            for hop, endpoint_hop, dsts in plan['seclast']:
+                for dst in dsts:
+                    self.groups[('seclast', dst)] = (hop, endpoint_hop)
+
+    def observe(self, task_type: str, stream: str, seq: int, dsts: list, ips: list):
+        """
+        Records the replies of one parsed output stream of a task. Replies to
+        probes sent before a target was moved are ignored.
+        """
+        role = 'endpoint' if task_type == 'endpoint' else 'seclast'
+        with self.lock:
+            for dst, ip in zip(dsts, ips):
+                key = (role, dst)
+                # no reply says nothing about the path
+                if not isinstance(ip, str) or key not in self.groups or key in self.suspended:
+                    continue
+                if seq < self.valid_from.get(key, 0):
+                    continue
+                if stream == 'endpoint':
+                    matched = ip == dst
+                else:
+                    matched = ip != dst
+                if matched:
+                    self.mismatches[key] = 0
+                    continue
+                self.mismatches[key] = self.mismatches.get(key, 0) + 1
+                if self.mismatches[key] >= self.mismatch_after:
+                    self.mismatches[key] = 0
+                    self.suspended[key] = self.groups[key]
+                    self.new_suspended.append((role, dst, self.groups[key]))
+                    self.to_trace.add(dst)
+
+    def is_suspended(self, role: str, dst: str) -> bool:
+        with self.lock:
+            return (role, dst) in self.suspended
+
+    def poll(self, seq: int) -> tuple:
+        """
+        Starts re-traceroutes of the suspended targets if none is running.
+        Called before round `seq`, the first round that probes the returned
+        moves in their new groups.
+
+        :return: (targets suspended since the last call as (role, dst, group),
+                  targets re-tracerouted since the last call as
+                  (role, dst, old group, new group))
+        """
+        with self.lock:
+            suspended, self.new_suspended = self.new_suspended, []
+            moves, self.moves = self.moves, []
+            for role, dst, _, _ in moves:
+                self.valid_from[(role, dst)] = seq
+            if self.to_trace and (self.trace_thread is None or not self.trace_thread.is_alive()):
+                batch = sorted(self.to_trace)[:self.max_batch]
+                self.to_trace.difference_update(batch)
+                self.trace_thread = threading.Thread(target=self.run_retrace, args=(batch,), daemon=True)
+                self.trace_thread.start()
+        return suspended, moves
+
+    def run_retrace(self, dsts: list):
+        print(f"re-tracerouting {len(dsts)} targets with mismatched replies")
+        try:
+            df = self.retrace(dsts)
+            # targets without a completed path stay in their old group
+            paths = {
+                row.dst: (int(row.sec_last_hop), int(row.hop_count))
+                for row in df.itertuples()
+                if row.stop_reason == 'COMPLETED'
+            }
+        except Exception as e:
+            print(f"re-traceroute failed: {e}")
+            paths = {}
+
+        with self.lock:
+            self.retraced += len(dsts)
+            for dst in dsts:
+                for role in ['endpoint', 'seclast']:
+                    old_group = self.suspended.pop((role, dst), None)
+                    if old_group is None:
+                        continue
+                    new_group = old_group
+                    if dst in paths:
+                        sec_last_hop, hop_count = paths[dst]
+                        new_group = hop_count if role == 'endpoint' else (sec_last_hop, hop_count)
+                    if new_group != old_group:
+                        self.moved += 1
+                    self.groups[(role, dst)] = new_group
+                    self.moves.append((role, dst, old_group, new_group))
+
+    def publish(self, metrics):
+        """
+        Sets the route drift gauges and counters on a `CollectorMetrics`.
+        """
+        with self.lock:
+            metrics.set("drift_suspended_targets", len(self.suspended))
+            metrics.set("drift_retraced_targets_total", self.retraced)
+            metrics.set("drift_moved_targets_total", self.moved)
@@ -1,13 +1,13 @@
 import argparse
 import os
-import pandas as pd
 from datetime import datetime
 from config import STARLINK_ASN
-from run_scamper import Grouping, modified_concurrent_ttl_ping_by_grouping, run_paris_trs
-from parse_scamper import get_last_hops_from_paris_tr
 
 """
 Runs Roman HitchHiking
+
+pandas, scamper and the probing loop are imported only on the paths that
+use them, so a restart that finds its output already written exits quickly.
 """
 
 def run_roman_hitchhiking(
@@ -16,10 +16,23 @@ def run_roman_hitchhiking(
         num_probes: int,
         output_dir: str,
         multiple_src_ips: bool = True,
-        grouping: Grouping = None,
+        grouping=None,
         sample_size: int = None,
         slash: int = None,
         exposed_ips_file: str = None,
+        metrics_port: int = None,
+        metrics_file: str = None,
+        rotate_minutes: float = None,
+        rotate_mb: float = None,
+        compression: str = None,
+        combined: bool = False,
+        spool_high_files: int = None,
+        spool_high_mb: float = None,
+        spool_policy: str = 'throttle',
+        parse_workers: int = None,
+        evict_after: int = None,
+        reprobe_every: int = 60,
+        drift_after: int = None,
 ):
     """
     :param asn: the autonomous system number formatted as "AS####"
@@ -28,10 +41,26 @@ def run_roman_hitchhiking(
                        if 0, continuously send probes every probe_interval
     :param output_dir: output directory
     :param multiple_src_ips: whether or not to use multiple source IPs
-    :param grouping: specify grouping
+    :param grouping: specify grouping, a `run_scamper.Grouping`
     :param sample_size: sample size
     :param slash: subnet
     :param exposed_services_file: file to use for exposed services
+    :param metrics_port: (optional) port to serve collector metrics on
+    :param metrics_file: (optional) file to append collector metrics to every round
+    :param rotate_minutes: (optional) minutes between output segments
+    :param rotate_mb: (optional) maximum size of an output segment in MB
+    :param compression: (optional) 'gzip' or 'zstd' compression of closed segments
+    :param combined: (optional) probe the pre-sat and endpoint TTLs of each
+                     pre-sat representative in one scamper task
+    :param spool_high_files: (optional) queued scamper outputs at which to apply `spool_policy`
+    :param spool_high_mb: (optional) queued MB of scamper outputs at which to apply `spool_policy`
+    :param spool_policy: (optional) 'throttle', 'coarsen' or 'drop', see spool.py
+    :param parse_workers: (optional) number of processes parsing scamper outputs
+    :param evict_after: (optional) consecutive unanswered probes after which an
+                        endpoint is evicted until it answers a re-probe
+    :param reprobe_every: (optional) probe rounds between re-probes of evicted endpoints
+    :param drift_after: (optional) consecutive replies from the wrong hop after
+                        which a target is re-tracerouted and moved to its new TTLs
     """
     as_num = asn[2:]
 
@@ -42,7 +71,6 @@ def run_roman_hitchhiking(
         exposed_ips_file = f"{output_dir}/censys_exposed_ips_{asn}.txt"
         if os.path.exists(censys_exposed_services_file):
             print(f"file exists: {censys_exposed_services_file}")
-            censys_df = pd.read_csv(censys_exposed_services_file)
         else:
             print(f"file doesn't exist: {censys_exposed_services_file}")
             print("----querying Censys for exposed services")
@@ -54,11 +82,12 @@ def run_roman_hitchhiking(
     # paris traceroute all exposed services
     paris_tr_file = f"{output_dir}/paris_tr_{asn}"
     sec_to_last_file = f"{output_dir}/sec_last_{asn}.csv"
+    sec_to_last_df = None
     if os.path.exists(f"{sec_to_last_file}"):
         print(f"file exists: {paris_tr_file}.csv")
-        # find second-to-last hops
-        sec_to_last_df = pd.read_csv(sec_to_last_file)
     else:
+        from parse_scamper import get_last_hops_from_paris_tr
+        from run_scamper import run_paris_trs
         print(f"file doesn't exists: {paris_tr_file}.csv")
         if not os.path.exists(f"{paris_tr_file}.json"):
             print("----running paris traceroutes")
@@ -71,15 +100,66 @@ def run_roman_hitchhiking(
     
 
     # run roman hitchhiking
-    date_str = datetime.now().strftime("%Y%m%d")
-    modified_concurrent_output_dir = f"{output_dir}/{date_str}"
-    os.makedirs(modified_concurrent_output_dir, exist_ok=True)
-    modified_concurrent_file_name = f"{modified_concurrent_output_dir}/{asn}"
-    if not os.path.exists(f"{modified_concurrent_file_name}_endpoint.csv") and \
-        not os.path.exists(f"{modified_concurrent_file_name}_sec_last.csv"):
-        print(f"file does not exist: {modified_concurrent_file_name}")
+    checkpoint = None
+    if num_probes == 0:
+        from checkpoint import get_checkpoint_file, read_checkpoint
+        # a continuous run that was stopped resumes into its original output
+        checkpoint = read_checkpoint(get_checkpoint_file(output_dir, asn))
+    fresh_output = False
+    if checkpoint is not None and checkpoint.get('wait_probe') != probe_interval:
+        # seqs are counted in probe intervals, so the new campaign cannot
+        # append to the checkpoint's output
+        print(f"checkpoint probes every {checkpoint.get('wait_probe')} s, not {probe_interval} s, starting a new output")
+        checkpoint = None
+        fresh_output = True
+
+    if checkpoint is not None:
+        modified_concurrent_file_name = checkpoint['output_file']
+        print(f"checkpoint exists, resuming: {modified_concurrent_file_name}")
+        run_probes = True
+    else:
+        # today's output may be the rejected checkpoint's, so use the time too
+        date_str = datetime.now().strftime("%Y%m%d_%H%M%S" if fresh_output else "%Y%m%d")
+        modified_concurrent_output_dir = f"{output_dir}/{date_str}"
+        os.makedirs(modified_concurrent_output_dir, exist_ok=True)
+        modified_concurrent_file_name = f"{modified_concurrent_output_dir}/{asn}"
+        run_probes = not any(
+            os.path.exists(f"{modified_concurrent_file_name}_{stream}{suffix}")
+            for stream in ['endpoint', 'sec_last']
+            for suffix in ['.csv', '.manifest.json']
+        )
+        if run_probes:
+            print(f"file does not exist: {modified_concurrent_file_name}")
 
+    if run_probes:
+        import pandas as pd
+        from collector_metrics import CollectorMetrics, serve_metrics
+        from route_drift import RouteDriftMonitor
+        from run_scamper import modified_concurrent_ttl_ping_by_grouping
+        from spool import Spool
+        from target_tracker import TargetTracker
+        if sec_to_last_df is None:
+            # find second-to-last hops
+            sec_to_last_df = pd.read_csv(sec_to_last_file)
         print("----running modified concurrent pings")
+        metrics = None
+        if metrics_port is not None or metrics_file is not None:
+            metrics = CollectorMetrics()
+        if metrics_port is not None:
+            serve_metrics(metrics, metrics_port)
+        spool = None
+        if spool_high_files is not None or spool_high_mb is not None:
+            spool = Spool(
+                high_files=spool_high_files,
+                high_bytes=int(spool_high_mb * 2**20) if spool_high_mb else None,
+                policy=spool_policy,
+            )
+        target_tracker = None
+        if evict_after is not None:
+            target_tracker = TargetTracker(evict_after=evict_after, reprobe_every=reprobe_every)
+        route_monitor = None
+        if drift_after is not None:
+            route_monitor = RouteDriftMonitor(mismatch_after=drift_after)
         modified_concurrent_ttl_ping_by_grouping(
                 sec_to_last_df, asn, 
                 output_file=modified_concurrent_file_name, 
@@ -90,6 +170,16 @@ def run_roman_hitchhiking(
                 slash=slash, 
                 multiple_src_ips=multiple_src_ips,
                 output_dir=output_dir,
+                metrics=metrics,
+                metrics_file=metrics_file,
+                rotate_seconds=rotate_minutes * 60 if rotate_minutes else None,
+                rotate_bytes=int(rotate_mb * 2**20) if rotate_mb else None,
+                compression=compression,
+                combined=combined,
+                spool=spool,
+                parse_workers=parse_workers,
+                target_tracker=target_tracker,
+                route_monitor=route_monitor,
         ) 
         print("----done running concurrent pings")
 
@@ -127,6 +217,98 @@ if __name__ == "__main__":
         help="Directory to store output files"
     )
 
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Optional local port to serve collector metrics on (/metrics)"
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="Optional file to append collector metrics to every round"
+    )
+
+    parser.add_argument(
+        "--rotate-minutes",
+        type=float,
+        default=None,
+        help="Optional minutes after which to start a new output segment"
+    )
+
+    parser.add_argument(
+        "--rotate-mb",
+        type=float,
+        default=None,
+        help="Optional size in MB after which to start a new output segment"
+    )
+
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=["gzip", "zstd"],
+        default=None,
+        help="Optional compression of closed output segments"
+    )
+
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="Probe pre-sat and endpoint TTLs of pre-sat representatives in one task"
+    )
+
+    parser.add_argument(
+        "--spool-high-files",
+        type=int,
+        default=None,
+        help="Optional number of queued scamper outputs at which to apply the spool policy"
+    )
+
+    parser.add_argument(
+        "--spool-high-mb",
+        type=float,
+        default=None,
+        help="Optional MB of queued scamper outputs at which to apply the spool policy"
+    )
+
+    parser.add_argument(
+        "--spool-policy",
+        type=str,
+        choices=["throttle", "coarsen", "drop"],
+        default="throttle",
+        help="What to do while the spool is above its high watermark"
+    )
+
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=None,
+        help="Optional number of processes parsing scamper outputs"
+    )
+
+    parser.add_argument(
+        "--evict-after",
+        type=int,
+        default=None,
+        help="Optional number of consecutive unanswered probes after which to evict an endpoint"
+    )
+
+    parser.add_argument(
+        "--reprobe-every",
+        type=int,
+        default=60,
+        help="Probe rounds between re-probes of evicted endpoints"
+    )
+
+    parser.add_argument(
+        "--drift-after",
+        type=int,
+        default=None,
+        help="Optional number of replies from the wrong hop after which to re-traceroute a target"
+    )
+
     args = parser.parse_args()
 
     os.makedirs(args.output_dir, exist_ok=True)
@@ -141,4 +323,17 @@ if __name__ == "__main__":
         sample_size=None,
         slash=None,
         exposed_ips_file=args.exposed_ips_file,
+        metrics_port=args.metrics_port,
+        metrics_file=args.metrics_file,
+        rotate_minutes=args.rotate_minutes,
+        rotate_mb=args.rotate_mb,
+        compression=args.compression,
+        combined=args.combined,
+        spool_high_files=args.spool_high_files,
+        spool_high_mb=args.spool_high_mb,
+        spool_policy=args.spool_policy,
+        parse_workers=args.parse_workers,
+        evict_after=args.evict_after,
+        reprobe_every=args.reprobe_every,
+        drift_after=args.drift_after,
     )
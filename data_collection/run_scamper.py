@@ -1,5 +1,11 @@
+import concurrent.futures
+import hashlib
+import heapq
 import ipaddress
 import itertools
+import json
+import math
+import multiprocessing
 import threading
 import queue
 import os
@@ -9,7 +15,17 @@ import subprocess
 import sys
 import tempfile
 import time
-from parse_scamper import aggregate_data, paris_tr_to_df
+from parse_scamper import (
+    DST_COLUMN, IP_AT_TTL_COLUMN, RTT_COLUMN, TTL_OUTPUT_DTYPES, aggregate_data,
+    get_last_hops_from_paris_tr, iter_ttl_rows, parse_ttl_columns, paris_tr_to_df,
+)
+from checkpoint import get_checkpoint_file, get_plan_file, read_checkpoint, write_checkpoint
+from column_buffer import ColumnBuffer
+from collector_metrics import CollectorMetrics, write_metrics_file
+from output_partitions import PartitionedWriter
+from route_drift import RouteDriftMonitor
+from spool import Spool
+from target_tracker import TargetTracker
 from collections import defaultdict
 from enum import Enum
 from config import SRC_IPS
@@ -20,8 +36,15 @@ class Grouping(Enum):
 
 # depending on the pps required you may need to download and build from 
 # the source: https://www.caida.org/catalog/software/scamper/
+# set to the path of fake_scamper.py to load-test without raw sockets
 scamper = "scamper" 
+# launches a scamper command, replaced by leo_simulator.py to probe a
+# simulated network instead of spawning processes
+scamper_popen = subprocess.Popen
 pps = 50000
+# seconds a combined task waits for the pre-sat reply before sending the
+# endpoint TTL (scamper trace -w, at least 1, default 5)
+combined_wait_timeout = 1
 
 # FIXME
 src_ips = ['<INSERT SOURCE IPS HERE>'] 
@@ -63,6 +86,206 @@ def find_successful_ips(
     print(f"BY DF: found number of successful sec_last_ips: {len(df)}")
     return df
 
+def build_probe_plan(
+        df: pd.DataFrame,
+        grouping: Grouping,
+        sample_size: int,
+        slash: int,
+        combined: bool = False,
+) -> dict:
+    """
+    Samples the endpoints to probe and groups them by the TTLs they are
+    probed at.
+
+    :param df: dataframe formatted like the output of `get_last_hops_from_paris_tr`
+    :param combined: (optional) probe the pre-sat representatives at both
+                     TTLs in one task, so they are left out of 'endpoint'
+    :return: dict with
+             'endpoint': list of [hop_count, dsts], probed at hop_count
+             'seclast': list of [sec_last_hop, hop_count, dsts], one dst per
+                        pre-sat hop, probed at sec_last_hop (and at hop_count
+                        too if 'combined')
+             'combined': whether the plan is for combined probing
+    """
+    if grouping == Grouping.SUBNET:
+        df = df.copy()
+        df['subnet'] = df['dst'].apply(
+            lambda x: ipaddress.IPv4Network(x + f"/{slash}", strict=False)
+        )
+        df_sampled = df.groupby('subnet', group_keys=False).head(sample_size)
+    elif grouping == Grouping.SECLAST:
+        df_sampled = df.groupby('sec_last_ip', group_keys=False).head(sample_size)
+    else:
+        df_sampled = df
+
+    presat_endpoints = (
+        df_sampled
+        .groupby(['sec_last_ip', 'sec_last_hop'])['dst']
+        .first()
+        .reset_index()
+    )
+
+    presat_endpoints = presat_endpoints.merge(
+        df_sampled[['dst', 'sec_last_ip', 'sec_last_hop', 'hop_count']],
+        how='left',
+        on=['dst', 'sec_last_ip', 'sec_last_hop']
+    )
+
+    presat_endpoint_grouped = (
+        presat_endpoints
+        .groupby(['sec_last_hop', 'hop_count'])['dst']
+        .apply(lambda dsts: sorted(set(dsts)))
+    )
+
+    if combined:
+        df_sampled = df_sampled[~df_sampled['dst'].isin(presat_endpoints['dst'])]
+    endpoints_grouped = (
+        df_sampled
+        .groupby('hop_count')['dst']
+        .apply(lambda dsts: sorted(set(dsts)))
+    )
+
+    return {
+        'endpoint': [
+            [int(hop), dsts] for hop, dsts in endpoints_grouped.items()
+        ],
+        'seclast': [
+            [int(hop), int(endpoint_hop), dsts]
+            for (hop, endpoint_hop), dsts in presat_endpoint_grouped.items()
+        ],
+        'combined': combined,
+    }
+
+def get_plan_hash(plan: dict) -> str:
+    return hashlib.sha256(json.dumps(plan, sort_keys=True).encode()).hexdigest()
+
+def read_probe_plan(plan_file: str) -> dict:
+    with open(plan_file, 'r') as f:
+        return json.load(f)
+
+def write_probe_plan(plan: dict, plan_file: str):
+    tmp_file = f"{plan_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(plan, f)
+    os.replace(tmp_file, plan_file)
+
+def get_next_seq(anchor_time: float, wait_probe: float) -> int:
+    """
+    Returns the first seq whose send time, anchor_time + seq * wait_probe, is
+    not yet past.
+    """
+    return max(0, math.ceil((time.time() - anchor_time) / wait_probe))
+
+def get_tmp_outputs(tmp_output_dir: str) -> list:
+    """
+    Returns (file name, type, seq) of the scamper outputs in `tmp_output_dir`,
+    named {type}_{seq}_{uuid}.json.
+    """
+    outputs = []
+    for file_name in sorted(os.listdir(tmp_output_dir)):
+        parts = file_name[:-len(".json")].split('_')
+        if not file_name.endswith(".json") or len(parts) != 3 or not parts[1].isdigit():
+            continue
+        outputs.append((file_name, parts[0], int(parts[1])))
+    return outputs
+
+def recover_tmp_outputs(tmp_output_dir: str) -> list:
+    """
+    Finds scamper outputs left in `tmp_output_dir` by a run that stopped before
+    aggregating them. A trailing partial line, from a scamper killed mid-write,
+    is truncated so the rest of the file can be parsed. Only call this when
+    resuming the campaign that wrote them, their seqs belong to it.
+
+    :return: list of file info dicts in the format expected by `aggregate_data`
+    """
+    files_info = []
+    for file_name, task_type, seq in get_tmp_outputs(tmp_output_dir):
+        output_file = os.path.join(tmp_output_dir, file_name)
+        with open(output_file, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+        files_info.append({
+            'type': task_type,
+            'seq': seq,
+            'hop': None,
+            'input_file': None,
+            'output_file': output_file,
+        })
+    if files_info:
+        print(f"recovered {len(files_info)} scamper outputs from {tmp_output_dir}")
+    return files_info
+
+def set_aside_tmp_outputs(tmp_output_dir: str) -> int:
+    """
+    Moves scamper outputs left by a different campaign, or by a finite run,
+    out of `tmp_output_dir` into a 'stale_{time}' directory next to it, so
+    their seqs are not mixed into the new campaign's outputs.
+
+    :return: number of outputs moved
+    """
+    outputs = get_tmp_outputs(tmp_output_dir)
+    if not outputs:
+        return 0
+    stale_dir = f"{tmp_output_dir}_stale_{int(time.time())}"
+    os.makedirs(stale_dir, exist_ok=True)
+    for file_name, _, _ in outputs:
+        os.replace(os.path.join(tmp_output_dir, file_name), os.path.join(stale_dir, file_name))
+    print(f"moved {len(outputs)} scamper outputs of a previous run to {stale_dir}")
+    return len(outputs)
+
+def retrace_targets(
+        dsts: list,
+        output_dir: str,
+        asn: str,
+        asn_df: pd.DataFrame = None,
+) -> pd.DataFrame:
+    """
+    Paris-traceroutes `dsts` again, like the discovery traceroutes in
+    run_roman_hitchhiking.py, to find their current hops.
+
+    :param asn_df: (optional) known 'ip' to 'asn' mapping, see
+                   `get_last_hops_from_paris_tr`
+    :return: dataframe formatted like the output of `get_last_hops_from_paris_tr`,
+             only the traceroutes that reached their dst (one stopped by the
+             gap limit has no valid last hops)
+    """
+    output_file = os.path.join(output_dir, f"retrace_{uuid.uuid4().hex}.json")
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as tmp:
+        for dst in dsts:
+            tmp.write(dst + '\n')
+
+    cmd = [
+        scamper, "-O", "json", "-o", output_file, "-p", str(pps),
+        "-c", "trace -P icmp-paris -q 1 -g 15",
+        tmp.name
+    ]
+    try:
+        scamper_popen(cmd).wait()
+        if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+            return pd.DataFrame(columns=['dst', 'stop_reason', 'hop_count', 'sec_last_ip', 'sec_last_hop'])
+        df = get_last_hops_from_paris_tr(output_file, asn, asn_df=asn_df)
+        return df[df['stop_reason'] == 'COMPLETED']
+    finally:
+        os.remove(tmp.name)
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+def get_stream_infos(p: dict) -> list:
+    """
+    Returns (stream, file info) pairs for the output streams a completed task
+    writes to. The file infos only keep the fields the parser needs, so they
+    can be sent to parsing processes.
+    """
+    f_info = {key: p.get(key) for key in ['type', 'seq', 'hop', 'input_file', 'output_file']}
+    if p['type'] == 'combined':
+        # combined outputs hold the replies of both streams
+        return [
+            ('endpoint', {**f_info, 'select_ttl': 'hoplimit'}),
+            ('seclast', {**f_info, 'select_ttl': 'firsthop'}),
+        ]
+    return [(p['type'], f_info)]
+
 def modified_concurrent_ttl_ping_by_grouping(
         df: pd.DataFrame,
         asn: str,
@@ -75,52 +298,262 @@ def modified_concurrent_ttl_ping_by_grouping(
         multiple_src_ips: bool,
         output_dir: str,
         src_ip: str = SRC_IPS[0],
+        metrics: CollectorMetrics = None,
+        metrics_file: str = None,
+        rotate_seconds: float = None,
+        rotate_bytes: int = None,
+        compression: str = None,
+        combined: bool = False,
+        anchor_time: float = None,
+        buffer_rows: int = 100000,
+        spool: Spool = None,
+        parse_workers: int = None,
+        target_tracker: TargetTracker = None,
+        route_monitor: RouteDriftMonitor = None,
 ):
-    def aggregation_worker():
+    """
+    Probes every endpoint and one representative per pre-sat hop each
+    `wait_probe` seconds, streaming the parsed results to
+    `{output_file}_endpoint.csv` and `{output_file}_sec_last.csv`, or to
+    rotating segments of them if `rotate_seconds` or `rotate_bytes` is set.
+
+    :param metrics: (optional) collects per-round runtime metrics, see
+                    collector_metrics.py
+    :param metrics_file: (optional) file to append a line of metrics to after
+                         every round, requires `metrics`
+    :param rotate_seconds: (optional) start a new output segment this often,
+                           see output_partitions.py
+    :param rotate_bytes: (optional) start a new output segment at this size
+    :param compression: (optional) 'gzip' or 'zstd' compression of closed
+                        segments
+    :param combined: (optional) probe each pre-sat representative at its
+                     pre-sat and endpoint TTLs in one `-f sec_last_hop -m hop_count`
+                     task and split the replies into the two output streams.
+                     TTLs in between are probed too when hop_count >
+                     sec_last_hop + 1. scamper sends the next TTL once the
+                     previous reply arrives or after `combined_wait_timeout`
+                     seconds, so the endpoint probe follows the pre-sat one by
+                     one pre-sat rtt, or by up to `combined_wait_timeout` when
+                     the pre-sat reply is lost. The two probes can then still
+                     fall in different 15 s satellite scheduling epochs.
+    :param anchor_time: (optional) shared time base, seq n is sent at
+                        anchor_time + n * wait_probe. A run starting after the
+                        anchor skips the seqs already past, see coordinator.py
+    :param buffer_rows: (optional) rows buffered per output stream before
+                        they are written
+    :param spool: (optional) watermarks on the queued scamper outputs and the
+                  policy applied above them, see spool.py
+    :param parse_workers: (optional) parse completed outputs in this many
+                          processes instead of in the aggregation thread.
+                          Parsed files are buffered in seq order up to the
+                          oldest seq still being parsed.
+    :param target_tracker: (optional) evicts endpoints that stop answering
+                           from their hop group and re-probes them in the
+                           background, see target_tracker.py
+    :param route_monitor: (optional) re-traceroutes targets whose replies come
+                          from the wrong hop and moves them to the probe
+                          groups of their new TTLs, see route_drift.py
+    """
+    def flush_buffer(stream: str):
         nonlocal endpoint_header_written, seclast_header_written
 
+        buffer = buffers[stream]
+        if len(buffer) == 0:
+            return
+        df_batch = buffer.to_frame()
+
+        if partition_writers is not None:
+            bytes_written = partition_writers[stream].write(df_batch)
+        else:
+            if stream == 'endpoint':
+                stream_output_file, header = endpoint_output_file, not endpoint_header_written
+                endpoint_header_written = True
+            else:
+                stream_output_file, header = sec_last_output_file, not seclast_header_written
+                seclast_header_written = True
+            size_before = os.path.getsize(stream_output_file) if os.path.exists(stream_output_file) else 0
+            df_batch.to_csv(
+                stream_output_file,
+                mode='a',
+                header=header,
+                index=False
+            )
+            bytes_written = os.path.getsize(stream_output_file) - size_before
+        if metrics is not None:
+            metrics.record_batch(
+                stream, df_batch, buffered_files[stream],
+                parse_seconds[stream], bytes_written,
+            )
+        buffer.clear()
+        buffered_files[stream] = 0
+        parse_seconds[stream] = 0
+
+    def observe_replies(task_type: str, stream: str, seq: int, dsts, ips, rtts):
+        if target_tracker is not None and task_type == 'endpoint':
+            target_tracker.observe(dsts, rtts)
+        if route_monitor is not None:
+            route_monitor.observe(task_type, stream, seq, dsts, ips)
+
+    def parse_output(p: dict):
+        observe = target_tracker is not None or route_monitor is not None
+        for stream, f_info in get_stream_infos(p):
+            dsts, ips, rtts = [], [], []
+            parse_start = time.time()
+            for row in iter_ttl_rows(f_info):
+                if observe:
+                    dsts.append(row[DST_COLUMN])
+                    ips.append(row[IP_AT_TTL_COLUMN])
+                    rtts.append(row[RTT_COLUMN])
+                if buffers[stream].append(row):
+                    parse_seconds[stream] += time.time() - parse_start
+                    flush_buffer(stream)
+                    parse_start = time.time()
+            parse_seconds[stream] += time.time() - parse_start
+            buffered_files[stream] += 1
+            if observe:
+                observe_replies(p['type'], stream, p['seq'], dsts, ips, rtts)
+
+    def buffer_columns(stream: str, task_type: str, seq: int, arrays: list, seconds: float):
+        observe_replies(
+            task_type, stream, seq,
+            arrays[DST_COLUMN], arrays[IP_AT_TTL_COLUMN], arrays[RTT_COLUMN],
+        )
+        parse_seconds[stream] += seconds
+        start = 0
+        while True:
+            start = buffers[stream].extend(arrays, start)
+            if start == len(arrays[0]):
+                break
+            flush_buffer(stream)
+        buffered_files[stream] += 1
+
+    def remove_outputs(output_files: list):
+        for output_file_name in output_files:
+            try:
+                os.remove(output_file_name)
+            except FileNotFoundError:
+                pass
+            if spool is not None:
+                spool.release(output_file_name)
+
+    def aggregation_worker():
+        last_flush = time.time()
+        # scamper outputs are removed once their rows are written
+        parsed_files = []
+
         while not stop_event.is_set() or not aggregation_queue.empty():
-            time.sleep(10)
+            try:
+                p = aggregation_queue.get(timeout=1)
+            except queue.Empty:
+                p = None
+            if p is not None:
+                try:
+                    parse_output(p)
+                except Exception as e:
+                    # skip the file, rows buffered before the error are kept
+                    print(f"Could not parse {p['type']} output of seq {p['seq']}: {p['output_file']}: {e!r}")
+                parsed_files.append(p['output_file'])
 
-            batch = []
-            while not aggregation_queue.empty():
+            if time.time() - last_flush < flush_interval:
+                continue
+            for stream in buffers:
+                flush_buffer(stream)
+            last_flush = time.time()
+            remove_outputs(parsed_files)
+            parsed_files = []
+
+        for stream in buffers:
+            flush_buffer(stream)
+        remove_outputs(parsed_files)
+
+    def parallel_aggregation_worker(pool: concurrent.futures.Executor):
+        last_flush = time.time()
+        parsed_files = []
+        # future -> (stream, task type, seq, output_file) of the files being parsed
+        pending = {}
+        # parsed files waiting for older seqs, as (seq, order, stream, task type, output_file, result)
+        parsed = []
+        order = itertools.count()
+        # output_file -> streams of it not yet buffered; combined outputs are
+        # parsed once per stream and removed only after both
+        unparsed_streams = {}
+
+        while not stop_event.is_set() or not aggregation_queue.empty() or pending:
+            # keep every process busy with a bounded number of files queued
+            while len(pending) < 2 * parse_workers:
                 try:
-                    batch.append(aggregation_queue.get_nowait())
+                    p = aggregation_queue.get(block=not pending, timeout=1)
                 except queue.Empty:
                     break
-
-            if not batch:
+                stream_infos = get_stream_infos(p)
+                unparsed_streams[p['output_file']] = len(stream_infos)
+                for stream, f_info in stream_infos:
+                    future = pool.submit(parse_ttl_columns, f_info)
+                    pending[future] = (stream, p['type'], p['seq'], p['output_file'])
+
+            if pending:
+                done, _ = concurrent.futures.wait(
+                    pending, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in done:
+                    stream, task_type, seq, output_file_name = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # skip the file, its rows are lost but later files are not
+                        print(f"Could not parse {stream} output of seq {seq}: {output_file_name}: {e!r}")
+                        result = None
+                    heapq.heappush(parsed, (seq, next(order), stream, task_type, output_file_name, result))
+
+            oldest_pending_seq = min((seq for _, _, seq, _ in pending.values()), default=None)
+            while parsed and (oldest_pending_seq is None or parsed[0][0] <= oldest_pending_seq):
+                seq, _, stream, task_type, output_file_name, result = heapq.heappop(parsed)
+                if result is not None:
+                    arrays, seconds = result
+                    buffer_columns(stream, task_type, seq, arrays, seconds)
+                unparsed_streams[output_file_name] -= 1
+                if unparsed_streams[output_file_name] == 0:
+                    del unparsed_streams[output_file_name]
+                    parsed_files.append(output_file_name)
+
+            if time.time() - last_flush < flush_interval:
                 continue
+            for stream in buffers:
+                flush_buffer(stream)
+            last_flush = time.time()
+            remove_outputs(parsed_files)
+            parsed_files = []
 
-            endpoint_batch = [p for p in batch if p['type'] == 'endpoint']
-            seclast_batch = [p for p in batch if p['type'] == 'seclast']
+        for stream in buffers:
+            flush_buffer(stream)
+        remove_outputs(parsed_files)
 
-            if endpoint_batch:
-                df_batch = aggregate_data(endpoint_batch)
-                df_batch.to_csv(
-                    endpoint_output_file,
-                    mode='a',
-                    header=not endpoint_header_written,
-                    index=False
-                )
-                endpoint_header_written = True
-
-            if seclast_batch:
-                df_batch = aggregate_data(seclast_batch)
-                df_batch.to_csv(
-                    sec_last_output_file,
-                    mode='a',
-                    header=not seclast_header_written,
-                    index=False
-                )
-                seclast_header_written = True
+    def write_input_file(ips: list) -> str:
+        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as tmp:
+            num_targets[tmp.name] = len(ips)
+            for ip in ips:
+                tmp.write(ip + '\n')
+        return tmp.name
+
+    def write_group_file(input_files: dict, group, ips: list):
+        # running tasks keep reading the old file until they finish
+        if group in input_files:
+            retired_input_files.add(input_files.pop(group))
+        if ips:
+            input_files[group] = write_input_file(ips)
+
+    def probed_endpoints(hop: int) -> list:
+        return sorted(
+            dst for dst in endpoint_groups.get(hop, [])
+            if not (target_tracker is not None and target_tracker.is_evicted(dst))
+            and not (route_monitor is not None and route_monitor.is_suspended('endpoint', dst))
+        )
 
-            # cleanup JSON immediately
-            for p in batch:
-                try:
-                    os.remove(p['output_file'])
-                except FileNotFoundError:
-                    pass
+    def probed_presat_endpoints(group: tuple) -> list:
+        return sorted(
+            dst for dst in presat_groups.get(group, [])
+            if not (route_monitor is not None and route_monitor.is_suspended('seclast', dst))
+        )
 
     flush_interval = 10  # seconds
 
@@ -130,74 +563,72 @@ def modified_concurrent_ttl_ping_by_grouping(
     if grouping == Grouping.SECLAST and sample_size is None:
         raise ValueError("SECLAST grouping must be provided a 'sample_size'")
 
-    tmp_output_dir = os.path.join(output_dir, f"tmp_output_{asn}")
-    os.makedirs(tmp_output_dir, exist_ok=True)
+    if compression is not None and rotate_seconds is None and rotate_bytes is None:
+        raise ValueError("compression requires 'rotate_seconds' or 'rotate_bytes'")
 
-    endpoint_ip_input_file = {}
-    presat_ip_input_file = {}
+    if spool is not None and spool.policy == 'throttle' and anchor_time is not None:
+        raise ValueError("the 'throttle' spool policy cannot keep to an 'anchor_time', use 'coarsen'")
 
-    ###########################################################################
-    # Sampling
-    ###########################################################################
-    if grouping == Grouping.SUBNET:
-        df['subnet'] = df['dst'].apply(
-            lambda x: ipaddress.IPv4Network(x + f"/{slash}", strict=False)
-        )
-        df_sampled = df.groupby('subnet', group_keys=False).head(sample_size)
-    elif grouping == Grouping.SECLAST:
-        df_sampled = df.groupby('sec_last_ip', group_keys=False).head(sample_size)
-    else:
-        df_sampled = df
+    tmp_output_dir = os.path.join(output_dir, f"tmp_output_{asn}")
+    os.makedirs(tmp_output_dir, exist_ok=True)
 
     ###########################################################################
-    # Endpoint grouping
+    # Resume from checkpoint (continuous mode)
     ###########################################################################
-    endpoints_grouped = (
-        df_sampled
-        .groupby('hop_count')['dst']
-        .apply(set)
-        .reset_index()
-    )
-
-    for _, row in endpoints_grouped.iterrows():
-        ips = row['dst']
-        hop = int(row['hop_count'])
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as tmp:
-            endpoint_ip_input_file[hop] = tmp.name
-            for ip in ips:
-                tmp.write(ip + '\n')
+    checkpoint_file = get_checkpoint_file(output_dir, asn)
+    plan_file = get_plan_file(output_dir, asn)
+    checkpoint = None
+    plan = None
+    if num_probes == 0:
+        checkpoint = read_checkpoint(checkpoint_file)
+        if checkpoint is not None and checkpoint['output_file'] != output_file:
+            print(f"checkpoint is for {checkpoint['output_file']}, starting a new campaign")
+            checkpoint = None
+        if checkpoint is not None and checkpoint.get('wait_probe') != wait_probe:
+            # seqs since the anchor are counted in probe intervals, so a new
+            # campaign in the same output would repeat the checkpoint's seqs
+            raise ValueError(
+                f"checkpoint for {output_file} probes every {checkpoint.get('wait_probe')} s, "
+                f"not {wait_probe} s, write the new campaign to a new output file"
+            )
+        if checkpoint is not None and os.path.exists(plan_file):
+            plan = read_probe_plan(plan_file)
+            if get_plan_hash(plan) != checkpoint['plan_hash'] or plan.get('combined', False) != combined:
+                print(f"plan does not match checkpoint: {plan_file}, replanning")
+                plan = None
 
     ###########################################################################
-    # Presat grouping
+    # Sampling and grouping
     ###########################################################################
-    presat_endpoints = (
-        df_sampled
-        .groupby(['sec_last_ip', 'sec_last_hop'])['dst']
-        .first()
-        .reset_index()
-    )
-
-    presat_endpoints = presat_endpoints.merge(
-        df_sampled[['dst', 'sec_last_ip', 'sec_last_hop', 'hop_count']],
-        how='left',
-        on=['dst', 'sec_last_ip', 'sec_last_hop']
-    )
-
-    presat_endpoint_grouped = (
-        presat_endpoints
-        .groupby(['sec_last_hop', 'hop_count'])['dst']
-        .apply(set)
-        .reset_index()
-    )
+    if plan is None:
+        plan = build_probe_plan(df, grouping, sample_size, slash, combined=combined)
+        if num_probes == 0:
+            write_probe_plan(plan, plan_file)
 
-    for _, row in presat_endpoint_grouped.iterrows():
-        ips = row['dst']
-        hop = int(row['sec_last_hop'])
-        endpoint_hop = int(row['hop_count'])
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as tmp:
-            presat_ip_input_file[(hop, endpoint_hop)] = tmp.name
-            for ip in ips:
-                tmp.write(ip + '\n')
+    endpoint_ip_input_file = {}
+    presat_ip_input_file = {}
+    num_targets = {}
+
+    for hop, ips in plan['endpoint']:
+        endpoint_ip_input_file[hop] = write_input_file(ips)
+
+    for hop, endpoint_hop, ips in plan['seclast']:
+        presat_ip_input_file[(hop, endpoint_hop)] = write_input_file(ips)
+
+    # probe group membership, which changes with evictions and route drift
+    endpoint_groups = {hop: set(ips) for hop, ips in plan['endpoint']}
+    presat_groups = {(hop, endpoint_hop): set(ips) for hop, endpoint_hop, ips in plan['seclast']}
+    # input files replaced between rounds, removed once no task reads them
+    retired_input_files = set()
+    if target_tracker is not None:
+        target_tracker.track(plan['endpoint'])
+    if route_monitor is not None:
+        # pre-sat hops of the plan were validated at discovery
+        known_asn_df = pd.DataFrame({'ip': df['sec_last_ip'].dropna().unique(), 'asn': asn})
+        route_monitor.track(
+            plan,
+            lambda dsts: retrace_targets(dsts, tmp_output_dir, asn, asn_df=known_asn_df),
+        )
 
     ###########################################################################
     # Streaming Ping Loop
@@ -214,19 +645,126 @@ def modified_concurrent_ttl_ping_by_grouping(
     endpoint_header_written = os.path.exists(endpoint_output_file)
     seclast_header_written = os.path.exists(sec_last_output_file)
 
+    # parsed rows are accumulated in preallocated columns and written when a
+    # buffer fills up or every `flush_interval` seconds
+    buffers = {
+        'endpoint': ColumnBuffer(TTL_OUTPUT_DTYPES, buffer_rows),
+        'seclast': ColumnBuffer(TTL_OUTPUT_DTYPES, buffer_rows),
+    }
+    buffered_files = {'endpoint': 0, 'seclast': 0}
+    parse_seconds = {'endpoint': 0, 'seclast': 0}
+
+    partition_writers = None
+    if rotate_seconds is not None or rotate_bytes is not None:
+        partition_writers = {
+            stream: PartitionedWriter(
+                output_file, file_stream,
+                rotate_seconds=rotate_seconds,
+                rotate_bytes=rotate_bytes,
+                compression=compression,
+            )
+            for stream, file_stream in [('endpoint', 'endpoint'), ('seclast', 'sec_last')]
+        }
+
+    paced_to_anchor = anchor_time is not None
     if num_probes == 0:
-        seq_iter = itertools.count()
+        if checkpoint is not None:
+            # continue after the last seq, skipping the seqs missed while down
+            # so seq stays aligned with the wall clock
+            anchor_time = checkpoint['anchor_time']
+            elapsed_seq = int((time.time() - anchor_time) // wait_probe)
+            start_seq = max(checkpoint['last_seq'] + 1, elapsed_seq)
+            print(f"resuming from checkpoint at seq {start_seq} (last seq {checkpoint['last_seq']})")
+        elif anchor_time is not None:
+            start_seq = get_next_seq(anchor_time, wait_probe)
+        else:
+            anchor_time = time.time()
+            start_seq = 0
+        plan_hash = get_plan_hash(plan)
+        seq_iter = itertools.count(start_seq)
+    elif anchor_time is not None:
+        seq_iter = range(get_next_seq(anchor_time, wait_probe), num_probes)
     else:
         seq_iter = range(num_probes)
 
-    worker_thread = threading.Thread(target=aggregation_worker, daemon=True)
+    # outputs of tasks that were in flight when the resumed run stopped; those
+    # of any other run have unrelated seqs and are set aside
+    if checkpoint is not None:
+        for f_info in recover_tmp_outputs(tmp_output_dir):
+            aggregation_queue.put(f_info)
+            if spool is not None:
+                spool.add(f_info['output_file'])
+    else:
+        set_aside_tmp_outputs(tmp_output_dir)
+
+    parse_pool = None
+    if parse_workers:
+        # spawned rather than forked, since the probing loop runs alongside threads
+        parse_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=parse_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        worker_thread = threading.Thread(target=parallel_aggregation_worker, args=(parse_pool,), daemon=True)
+    else:
+        worker_thread = threading.Thread(target=aggregation_worker, daemon=True)
     worker_thread.start()
 
     for seq in seq_iter:
+        if not worker_thread.is_alive():
+            # nothing would be written while outputs pile up in tmp_output_dir
+            raise RuntimeError(f"aggregation thread stopped, outputs are left in {tmp_output_dir}")
+        if paced_to_anchor:
+            to_sleep = anchor_time + seq * wait_probe - time.time()
+            if to_sleep > 0:
+                time.sleep(to_sleep)
         start_time = time.time()
 
+        # swap in the input files of probe groups with evicted, reinstated,
+        # drifted or re-tracerouted targets
+        changed_hops, changed_presat_groups = set(), set()
+        if target_tracker is not None:
+            changed_hops |= target_tracker.take_changes()
+        if route_monitor is not None:
+            suspended, moves = route_monitor.poll(seq)
+            for role, dst, group in suspended:
+                if role == 'endpoint':
+                    changed_hops.add(group)
+                else:
+                    changed_presat_groups.add(group)
+            for role, dst, old_group, new_group in moves:
+                if role == 'endpoint':
+                    endpoint_groups[old_group].discard(dst)
+                    endpoint_groups.setdefault(new_group, set()).add(dst)
+                    if target_tracker is not None:
+                        target_tracker.move(dst, new_group)
+                    changed_hops |= {old_group, new_group}
+                else:
+                    presat_groups[old_group].discard(dst)
+                    presat_groups.setdefault(new_group, set()).add(dst)
+                    changed_presat_groups |= {old_group, new_group}
+        for hop in changed_hops:
+            write_group_file(endpoint_ip_input_file, hop, probed_endpoints(hop))
+        for group in changed_presat_groups:
+            write_group_file(presat_ip_input_file, group, probed_presat_endpoints(group))
+
+        overflowing = spool is not None and spool.check()
+        if spool is not None and spool.skip_round(seq):
+            round_endpoint_files, round_presat_files = [], {}
+        else:
+            round_endpoint_files = list(endpoint_ip_input_file.items())
+            round_presat_files = presat_ip_input_file
+            if target_tracker is not None:
+                for hop, ips in target_tracker.reprobe_targets(seq).items():
+                    reprobe_file = write_input_file(ips)
+                    retired_input_files.add(reprobe_file)
+                    round_endpoint_files.append((hop, reprobe_file))
+        round_probes = (
+            sum(num_targets[file] for _, file in round_endpoint_files)
+            + sum(num_targets[file] for file in round_presat_files.values())
+        )
+
         # Spawn endpoint probes
-        for hop, file in endpoint_ip_input_file.items():
+        for hop, file in round_endpoint_files:
             if multiple_src_ips:
                 src_ip = SRC_IPS[hop % len(SRC_IPS)]
 
@@ -238,7 +776,10 @@ def modified_concurrent_ttl_ping_by_grouping(
                 file
             ]
 
-            proc = subprocess.Popen(cmd)
+            spawn_start = time.time()
+            proc = scamper_popen(cmd)
+            if metrics is not None:
+                metrics.record_spawn('endpoint', time.time() - spawn_start)
 
             running_procs.append({
                 'proc': proc,
@@ -247,34 +788,45 @@ def modified_concurrent_ttl_ping_by_grouping(
                 'hop': hop,
                 'input_file': file,        # ← restore this
                 'output_file': temp_out,
+                'spawn_time': spawn_start,
             })
 
         # Spawn presat probes
-        for (hop, endpoint_hop), file in presat_ip_input_file.items():
+        presat_type = 'combined' if combined else 'seclast'
+        for (hop, endpoint_hop), file in round_presat_files.items():
             if multiple_src_ips:
                 src_ip = SRC_IPS[endpoint_hop % len(SRC_IPS)]
 
-            temp_out = f"{tmp_output_dir}/seclast_{seq}_{uuid.uuid4().hex}.json"
+            temp_out = f"{tmp_output_dir}/{presat_type}_{seq}_{uuid.uuid4().hex}.json"
+            max_hop = endpoint_hop if combined else hop
+            # a lost pre-sat reply delays the endpoint TTL by the wait timeout
+            wait = f" -w {combined_wait_timeout}" if combined else ""
 
             cmd = [
                 scamper, "-O", "json", "-o", temp_out, "-p", str(pps),
-                "-c", f"trace -P icmp-paris -S {src_ip} -q 1 -f {hop} -m {hop}",
+                "-c", f"trace -P icmp-paris -S {src_ip} -q 1{wait} -f {hop} -m {max_hop}",
                 file
             ]
 
-            proc = subprocess.Popen(cmd)
+            spawn_start = time.time()
+            proc = scamper_popen(cmd)
+            if metrics is not None:
+                metrics.record_spawn(presat_type, time.time() - spawn_start)
 
             running_procs.append({
                 'proc': proc,
-                'type': 'seclast',
+                'type': presat_type,
                 'seq': seq,
                 'hop': hop,
                 'input_file': file,        # ← restore this
                 'output_file': temp_out,
+                'spawn_time': spawn_start,
             })
 
         # Maintain probe rate
         to_sleep = wait_probe - (time.time() - start_time)
+        if overflowing and spool.policy == 'throttle':
+            to_sleep += wait_probe
         if to_sleep > 0:
             time.sleep(to_sleep)
 
@@ -282,8 +834,48 @@ def modified_concurrent_ttl_ping_by_grouping(
         completed = [p for p in running_procs if p['proc'].poll() is not None]
 
         for p in completed:
-            aggregation_queue.put(p)
             running_procs.remove(p)
+            if spool is None:
+                aggregation_queue.put(p)
+            elif overflowing and spool.policy == 'drop':
+                spool.drop(p['output_file'], num_targets[p['input_file']])
+            else:
+                spool.add(p['output_file'])
+                aggregation_queue.put(p)
+        if spool is not None:
+            spool.record_policy_round()
+
+        in_use = {p['input_file'] for p in running_procs}
+        for file in retired_input_files - in_use:
+            os.remove(file)
+            del num_targets[file]
+        retired_input_files &= in_use
+
+        if num_probes == 0:
+            write_checkpoint(checkpoint_file, {
+                'output_file': output_file,
+                'plan_hash': plan_hash,
+                'anchor_time': anchor_time,
+                'wait_probe': wait_probe,
+                'last_seq': seq,
+            })
+
+        if metrics is not None:
+            now = time.time()
+            for p in completed:
+                metrics.record_task(p['type'], now - p['spawn_time'])
+            metrics.record_round(
+                seq, round_probes, now - start_time,
+                len(running_procs), aggregation_queue.qsize(),
+            )
+            if spool is not None:
+                spool.publish(metrics)
+            if target_tracker is not None:
+                target_tracker.publish(metrics)
+            if route_monitor is not None:
+                route_monitor.publish(metrics)
+            if metrics_file is not None:
+                write_metrics_file(metrics, metrics_file)
 
     ###########################################################################
     # Final flush (for finite mode)
@@ -291,9 +883,22 @@ def modified_concurrent_ttl_ping_by_grouping(
     for p in running_procs:
         p['proc'].wait()
         aggregation_queue.put(p)
+        if spool is not None:
+            spool.add(p['output_file'])
+        if metrics is not None:
+            metrics.record_task(p['type'], time.time() - p['spawn_time'])
+
+    if metrics is not None:
+        metrics.set("in_flight_tasks", 0)
 
     stop_event.set()
     worker_thread.join()
+    if parse_pool is not None:
+        parse_pool.shutdown()
+
+    if partition_writers is not None:
+        for writer in partition_writers.values():
+            writer.close()
 
     ###########################################################################
     # Cleanup input temp files
@@ -304,6 +909,9 @@ def modified_concurrent_ttl_ping_by_grouping(
     for file in presat_ip_input_file.values():
         os.remove(file)
 
+    for file in retired_input_files:
+        os.remove(file)
+
     print("Finished streaming aggregation.")
 
 def concurrent_ttl_ping_by_grouping(
@@ -399,7 +1007,7 @@ def concurrent_ttl_ping_by_grouping(
                 scamper, "-O", "json", "-o", temp_endpoint_out, "-p", str(pps), 
                 "-c", f"trace -P icmp-paris -S {src_ip} -q 1 -f {hop} -m {hop}", file
             ]
-            proc = subprocess.Popen(cmd_list)
+            proc = scamper_popen(cmd_list)
             procs.append(proc)
             endpoint_output_files.append({
                 'seq': seq,
@@ -417,7 +1025,7 @@ def concurrent_ttl_ping_by_grouping(
                 scamper, "-O", "json", "-o", temp_sec_last_out, "-p", str(pps), 
                 "-c", f"trace -P icmp-paris -S {src_ip} -q 1 -f {hop} -m {hop}", file
             ]
-            proc = subprocess.Popen(cmd_list)
+            proc = scamper_popen(cmd_list)
             procs.append(proc)
             presat_output_files.append({
                 'seq': seq,
@@ -544,9 +1152,14 @@ def concurrent_ttl_ping(
                 scamper, "-O", "json", "-o", temp_endpoint_out, "-p", str(pps), 
                 "-c", f"trace -P icmp-paris -S {src_ip} -q 1 -f {hop} -m {hop}", file
             ]
-            proc = subprocess.Popen(cmd_list)
+            proc = scamper_popen(cmd_list)
             procs.append(proc)
-            endpoint_temp_files.append(temp_endpoint_out)
+            endpoint_temp_files.append({
+                'seq': seq,
+                'hop': hop,
+                'input_file': file,
+                'output_file': temp_endpoint_out,
+            })
 
         for hop, file in presat_ip_input_file.items():
             # ping presats
@@ -555,9 +1168,14 @@ def concurrent_ttl_ping(
                 scamper, "-O", "json", "-o", temp_sec_last_out, "-p", str(pps), 
                 "-c", f"trace -P icmp-paris -S {src_ip} -q 1 -f {hop} -m {hop}", file
             ]
-            proc = subprocess.Popen(cmd_list)
+            proc = scamper_popen(cmd_list)
             procs.append(proc)
-            presat_temp_files.append(temp_sec_last_out)
+            presat_temp_files.append({
+                'seq': seq,
+                'hop': hop,
+                'input_file': file,
+                'output_file': temp_sec_last_out,
+            })
 
         to_sleep = wait_probe - (time.time() - start_time)
         if to_sleep > 0:
@@ -580,11 +1198,11 @@ def concurrent_ttl_ping(
     for file in presat_ip_input_file.values():
         os.remove(file)
 
-    for file in endpoint_temp_files:
-        os.remove(file)
+    for file_info in endpoint_temp_files:
+        os.remove(file_info['output_file'])
 
-    for file in presat_temp_files:
-        os.remove(file)
+    for file_info in presat_temp_files:
+        os.remove(file_info['output_file'])
 
     return
 
@@ -660,9 +1278,14 @@ def round_robin_ttl_ping(
                             "-c", f"trace -P icmp-paris -S {src_ip} -q 1 -f {to_ping_info["endpoint_hop"]} -m {to_ping_info["endpoint_hop"]}", 
                             to_ping_info["file_name"],
                         ]
-                        endpoint_p = subprocess.Popen(cmd_list)
+                        endpoint_p = scamper_popen(cmd_list)
                         process["endpoint_process"] = endpoint_p
-                        endpoint_temp_files.append(temp_endpoint_out)
+                        endpoint_temp_files.append({
+                            'seq': seq,
+                            'hop': to_ping_info["endpoint_hop"],
+                            'input_file': to_ping_info["file_name"],
+                            'output_file': temp_endpoint_out,
+                        })
 
                     # start second-to-last processes
                     temp_sec_last_out = f"{output_dir}/presat_{seq}_{uuid.uuid4().hex}.json"
@@ -671,9 +1294,14 @@ def round_robin_ttl_ping(
                         "-c", f"trace -P icmp-paris -S {src_ip} -q 1 -f {to_ping_info["sec_last_hop"]} -m {to_ping_info["sec_last_hop"]}", 
                         to_ping_info["file_name"],
                     ]
-                    sec_last_p = subprocess.Popen(cmd_list)
+                    sec_last_p = scamper_popen(cmd_list)
                     process["sec_last_process"] = sec_last_p
-                    sec_last_temp_files.append(temp_sec_last_out)
+                    sec_last_temp_files.append({
+                        'seq': seq,
+                        'hop': to_ping_info["sec_last_hop"],
+                        'input_file': to_ping_info["file_name"],
+                        'output_file': temp_sec_last_out,
+                    })
 
                     processes.append(process)
                 except ValueError as e:
@@ -704,8 +1332,8 @@ def round_robin_ttl_ping(
     for file in ip_input_files.values():
         os.remove(file)
 
-    for file in endpoint_temp_files:
-        os.remove(file)
+    for file_info in endpoint_temp_files:
+        os.remove(file_info['output_file'])
 
-    for file in sec_last_temp_files:
-        os.remove(file)
+    for file_info in sec_last_temp_files:
+        os.remove(file_info['output_file'])
@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+
+"""
+Builders for scamper json records. Kept free of pandas/numpy so the fake
+scamper binary starts as quickly as the real one.
+"""
+
+def make_hop(addr: str, probe_ttl: int, rtt: float, tx_sec: int, tx_usec: int, reply: bool) -> dict:
+    return {
+        'addr': addr,
+        'probe_ttl': int(probe_ttl),
+        'probe_id': 1,
+        'probe_size': 44,
+        'tx': {'sec': int(tx_sec), 'usec': int(tx_usec)},
+        'rtt': round(float(rtt), 3),
+        'reply_ttl': 52 if reply else 250,
+        'reply_tos': 0,
+        'reply_ipid': 0,
+        'reply_size': 44 if reply else 56,
+        'icmp_type': 0 if reply else 11,
+        'icmp_code': 0,
+        'icmp_q_ttl': 1,
+        'icmp_q_ipl': 44,
+        'icmp_q_tos': 0,
+    }
+
+def make_trace_record(
+        dst: str,
+        src: str,
+        first_hop: int,
+        max_hop: int,
+        start_sec: int,
+        start_usec: int,
+        hops: list,
+) -> dict:
+    """
+    Builds a scamper `trace -P icmp-paris -q 1 -f first_hop -m max_hop` record.
+    """
+    reached = len(hops) > 0 and hops[-1]['addr'] == dst
+    record = {
+        'type': 'trace',
+        'version': '0.1',
+        'userid': 0,
+        'method': 'icmp-echo-paris',
+        'src': src,
+        'dst': dst,
+        'icmp_sum': 0,
+        'stop_reason': 'COMPLETED' if reached else 'HOPLIMIT',
+        'stop_data': 0,
+        'start': {
+            'sec': int(start_sec),
+            'usec': int(start_usec),
+            'ftime': datetime.fromtimestamp(
+                int(start_sec), tz=timezone.utc,
+            ).strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        # like scamper, the last TTL probed, which is the dst's TTL once reached
+        'hop_count': int(hops[-1]['probe_ttl']) if reached else int(max_hop),
+        'attempts': 1,
+        'hoplimit': int(max_hop),
+        'firsthop': int(first_hop),
+        'wait': 5,
+        'wait_probe': 0,
+        'tos': 0,
+        'probe_size': 44,
+        'probe_count': int(max_hop - first_hop + 1),
+    }
+    if hops:
+        record['hops'] = hops
+    return record
+
+def cycle_records(start_sec: int, stop_sec: int) -> tuple:
+    start = {
+        'type': 'cycle-start', 'list_name': 'default', 'id': 1,
+        'hostname': 'synthetic', 'start_time': int(start_sec),
+    }
+    stop = {
+        'type': 'cycle-stop', 'list_name': 'default', 'id': 1,
+        'hostname': 'synthetic', 'stop_time': int(stop_sec),
+    }
+    return start, stop
@@ -12,7 +12,10 @@ def get_censys_exposed_services(asn: Union[int, List[int]], ipv: int = None, ) -
     :param asn: the autonomous system number to query
     :param ipv: (optional) specify 4 or 6 to filter for IP version
     :param bq: (optional) the BigQuery table to pull data from
-    :return: dataframe of exposed services information
+    :return: dataframe of exposed services information, with list columns
+             flattened so they are stored as typed columns in the output CSV:
+             'dns_name' (first reverse DNS name), 'port' (space-separated
+             ports) and 'pep_link' (whether any service has a Peplink cert)
     """
 
     if isinstance(asn, list):
@@ -29,16 +32,14 @@ def get_censys_exposed_services(asn: Union[int, List[int]], ipv: int = None, ) -
             '    {ip_col} as ip, '
             '    CURRENT_DATE() as date, '
             '    autonomous_system.asn as asn, '
-            '    dns.reverse_dns.names as dns_name, '
-            '    ports_list as port, '
-            '    ARRAY( '
-            '     SELECT '
-            '      CASE '
-            '        WHEN LOWER(service.tls.certificates.leaf_data.subject_dn) LIKE "%peplink%" '
-            '        THEN TRUE '
-            '        ELSE FALSE '
-            '      END '
+            '    dns.reverse_dns.names[SAFE_OFFSET(0)] as dns_name, '
+            '    ARRAY_TO_STRING( '
+            '     ARRAY(SELECT CAST(p AS STRING) FROM UNNEST(ports_list) AS p), " " '
+            '   ) as port, '
+            '    EXISTS( '
+            '     SELECT 1 '
             '     FROM UNNEST(services) AS service '
+            '     WHERE LOWER(service.tls.certificates.leaf_data.subject_dn) LIKE "%peplink%" '
             '   ) AS pep_link '
             'FROM `{table}` '
             'WHERE '
@@ -0,0 +1,131 @@
+import os
+import threading
+from collections import defaultdict
+
+"""
+Watermarks on the scamper outputs held in `tmp_output_{asn}`, from the time
+their task completes until their rows are written out (so at least
+`flush_interval` seconds of outputs are always held).
+
+Once the queued files or bytes reach a high watermark the spool is
+overflowing, and the probing loop applies the spool's policy until both drop
+back to their low watermarks:
+- 'throttle': wait one extra probe interval after each round, so rounds are
+  spread out while seq numbering stays consecutive
+- 'coarsen': only probe every `coarsen_factor`-th seq, so seq stays aligned
+  with the wall clock but rounds are sparser
+- 'drop': keep probing but delete completed outputs instead of queueing them,
+  counting the dropped files and probes
+"""
+
+POLICIES = ['throttle', 'coarsen', 'drop']
+
+class Spool:
+    """
+    Tracks queued scamper outputs against high and low watermarks.
+
+    :param high_files: (optional) queued files at which the spool overflows
+    :param low_files: (optional) queued files at which it recovers,
+                      default half of `high_files`
+    :param high_bytes: (optional) queued bytes at which the spool overflows
+    :param low_bytes: (optional) queued bytes at which it recovers,
+                      default half of `high_bytes`
+    :param policy: (optional) 'throttle', 'coarsen' or 'drop'
+    :param coarsen_factor: (optional) probe one in this many seqs under 'coarsen'
+    """
+    def __init__(
+            self,
+            high_files: int = None,
+            low_files: int = None,
+            high_bytes: int = None,
+            low_bytes: int = None,
+            policy: str = 'throttle',
+            coarsen_factor: int = 4,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, got: {policy}")
+        if high_files is None and high_bytes is None:
+            raise ValueError("Spool must be provided 'high_files' or 'high_bytes'")
+
+        self.high_files = high_files
+        self.low_files = low_files if low_files is not None else (high_files // 2 if high_files else None)
+        self.high_bytes = high_bytes
+        self.low_bytes = low_bytes if low_bytes is not None else (high_bytes // 2 if high_bytes else None)
+        self.policy = policy
+        self.coarsen_factor = coarsen_factor
+
+        self.lock = threading.Lock()
+        self.file_sizes = {}
+        self.num_bytes = 0
+        self.overflowing = False
+        self.policy_rounds = defaultdict(int)
+        self.dropped_files = 0
+        self.dropped_probes = 0
+
+    def add(self, output_file: str):
+        try:
+            size = os.path.getsize(output_file)
+        except FileNotFoundError:
+            size = 0
+        with self.lock:
+            self.num_bytes += size - self.file_sizes.get(output_file, 0)
+            self.file_sizes[output_file] = size
+
+    def release(self, output_file: str):
+        with self.lock:
+            self.num_bytes -= self.file_sizes.pop(output_file, 0)
+
+    def drop(self, output_file: str, num_probes: int):
+        try:
+            os.remove(output_file)
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.dropped_files += 1
+            self.dropped_probes += num_probes
+
+    def check(self) -> bool:
+        """
+        Updates and returns whether the spool is overflowing, with hysteresis
+        between the high and low watermarks.
+        """
+        with self.lock:
+            num_files, num_bytes = len(self.file_sizes), self.num_bytes
+        above_high = (
+            (self.high_files is not None and num_files >= self.high_files)
+            or (self.high_bytes is not None and num_bytes >= self.high_bytes)
+        )
+        below_low = (
+            (self.low_files is None or num_files <= self.low_files)
+            and (self.low_bytes is None or num_bytes <= self.low_bytes)
+        )
+        if not self.overflowing and above_high:
+            self.overflowing = True
+            print(f"spool overflowing ({num_files} files, {num_bytes / 2**20:.1f} MB), applying policy: {self.policy}")
+        elif self.overflowing and below_low:
+            self.overflowing = False
+            print(f"spool recovered ({num_files} files, {num_bytes / 2**20:.1f} MB)")
+        return self.overflowing
+
+    def skip_round(self, seq: int) -> bool:
+        """
+        Returns whether the round `seq` sends no probes under 'coarsen'.
+        """
+        return self.overflowing and self.policy == 'coarsen' and seq % self.coarsen_factor != 0
+
+    def record_policy_round(self):
+        if self.overflowing:
+            self.policy_rounds[self.policy] += 1
+
+    def publish(self, metrics):
+        """
+        Sets the spool gauges and policy counters on a `CollectorMetrics`.
+        """
+        with self.lock:
+            metrics.set("spool_files", len(self.file_sizes))
+            metrics.set("spool_bytes", self.num_bytes)
+            metrics.set("spool_overflowing", int(self.overflowing))
+            for policy in POLICIES:
+                metrics.set(f"spool_{policy}_rounds_total", self.policy_rounds[policy])
+            metrics.set("spool_dropped_files_total", self.dropped_files)
+            metrics.set("spool_dropped_probes_total", self.dropped_probes)
@@ -0,0 +1,259 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+
+from scamper_records import cycle_records, make_hop, make_trace_record
+
+"""
+Generates synthetic scamper outputs and Roman HitchHiking CSVs, so parsing
+and analysis can be exercised at scale without a measurement campaign.
+"""
+
+CAMPAIGN_COLUMNS = [
+    'date', 'seq', 'dst', 'stop_reason', 'start_time', 'start_sec',
+    'hop_count', 'ip_at_ttl', 'probe_ttl', 'rtt',
+]
+
+def int_to_ips(ints: np.ndarray) -> np.ndarray:
+    ints = np.asarray(ints, dtype='int64')
+    octets = [(ints >> shift) & 0xFF for shift in (24, 16, 8, 0)]
+    return np.array([
+        f"{a}.{b}.{c}.{d}" for a, b, c, d in zip(*octets)
+    ], dtype=object)
+
+def generate_endpoints(
+        num_endpoints: int,
+        dsts_per_presat: int = 40,
+        seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Generates customer endpoints behind pre-satellite hops, formatted like the
+    output of `get_last_hops_from_paris_tr`.
+
+    :param num_endpoints: number of customer endpoints
+    :param dsts_per_presat: (optional) average number of endpoints per pre-sat hop
+    :param seed: (optional) random seed
+    :return: dataframe with columns
+             'dst', 'stop_reason', 'hop_count', 'sec_last_ip', 'sec_last_hop'
+    """
+    rng = np.random.default_rng(seed)
+    num_presats = max(1, num_endpoints // dsts_per_presat)
+
+    # customers in 129.222.0.0/16 and up, pre-sat hops in 206.224.0.0/16
+    dst_ints = (129 << 24) + (222 << 16) + rng.choice(
+        1 << 22, size=num_endpoints, replace=False,
+    )
+    presat_ints = (206 << 24) + (224 << 16) + np.arange(num_presats)
+    presat_of_dst = rng.integers(0, num_presats, size=num_endpoints)
+    presat_hop = rng.integers(9, 15, size=num_presats)
+
+    sec_last_hop = presat_hop[presat_of_dst]
+    return pd.DataFrame({
+        'dst': int_to_ips(dst_ints),
+        'stop_reason': 'COMPLETED',
+        'hop_count': sec_last_hop + 1,
+        'sec_last_ip': int_to_ips(presat_ints)[presat_of_dst],
+        'sec_last_hop': sec_last_hop,
+    })
+
+def get_asn_df(endpoints_df: pd.DataFrame, asn: str = "AS14593") -> pd.DataFrame:
+    """
+    Returns an IP to ASN mapping for the pre-sat hops of `endpoints_df`,
+    formatted like `get_all_asn`.
+    """
+    return pd.DataFrame({
+        'ip': endpoints_df['sec_last_ip'].unique(),
+        'asn': asn,
+    })
+
+def write_paris_trs(
+        endpoints_df: pd.DataFrame,
+        output_file: str,
+        src: str = "192.0.2.1",
+        start_sec: int = 1748349926,
+        seed: int = 0,
+) -> str:
+    """
+    Writes one full ICMP paris-traceroute per endpoint, in the scamper json
+    format read by `paris_tr_to_df` and `get_last_hops_from_paris_tr`.
+    """
+    rng = np.random.default_rng(seed)
+    with open(output_file, 'w') as f:
+        cycle_start, cycle_stop = cycle_records(start_sec, start_sec + 1)
+        f.write(json.dumps(cycle_start) + '\n')
+        for row in endpoints_df.itertuples(index=False):
+            hop_count = int(row.hop_count)
+            rtts = np.sort(rng.uniform(1, 20, size=hop_count))
+            rtts[-1] += rng.uniform(20, 60)  # the satellite link
+            hops = [
+                make_hop(f"10.0.{ttl}.1", ttl, rtts[ttl - 1], start_sec, 0, False)
+                for ttl in range(1, hop_count - 1)
+            ]
+            hops.append(make_hop(row.sec_last_ip, hop_count - 1, rtts[-2], start_sec, 0, False))
+            hops.append(make_hop(row.dst, hop_count, rtts[-1], start_sec, 0, True))
+            record = make_trace_record(row.dst, src, 1, hop_count, start_sec, 0, hops)
+            f.write(json.dumps(record) + '\n')
+        f.write(json.dumps(cycle_stop) + '\n')
+    return output_file
+
+def get_outage_mask(
+        num_endpoints: int,
+        num_seqs: int,
+        outage_rate: float,
+        min_outage_len: int = 5,
+        max_outage_len: int = 75,
+        seed: int = 0,
+) -> np.ndarray:
+    """
+    Returns a (num_endpoints, num_seqs) mask of seqs where each endpoint is in
+    an outage. `outage_rate` of the endpoints get one outage each.
+    """
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((num_endpoints, num_seqs), dtype=bool)
+    with_outage = np.flatnonzero(rng.random(num_endpoints) < outage_rate)
+    lengths = rng.integers(min_outage_len, max_outage_len + 1, size=len(with_outage))
+    lengths = np.minimum(lengths, num_seqs)
+    starts = rng.integers(0, np.maximum(num_seqs - lengths, 0) + 1)
+    seqs = np.arange(num_seqs)
+    mask[with_outage] = (
+        (seqs >= starts[:, None]) & (seqs < (starts + lengths)[:, None])
+    )
+    return mask
+
+def write_ttl_outputs(
+        endpoints_df: pd.DataFrame,
+        output_dir: str,
+        num_seqs: int,
+        loss_rate: float = 0.01,
+        outage_rate: float = 0.05,
+        src: str = "192.0.2.1",
+        start_sec: int = 1748349926,
+        seed: int = 0,
+) -> tuple:
+    """
+    Writes the json outputs of single-TTL endpoint and pre-sat probes, one file
+    per (seq, hop group), as produced by `modified_concurrent_ttl_ping_by_grouping`.
+
+    :return: (endpoint_files_info, seclast_files_info) lists in the format
+             expected by `aggregate_data`
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    outage_mask = get_outage_mask(len(endpoints_df), num_seqs, outage_rate, seed=seed)
+
+    endpoint_files_info = []
+    seclast_files_info = []
+    groups = endpoints_df.reset_index(drop=True).groupby('hop_count')
+    for hop, group in groups:
+        hop = int(hop)
+        dsts = group['dst'].to_numpy()
+        sec_last_ips = group['sec_last_ip'].to_numpy()
+        sec_last_hops = group['sec_last_hop'].to_numpy()
+        input_file = f"{output_dir}/targets_{hop}.txt"
+        with open(input_file, 'w') as f:
+            f.write('\n'.join(dsts) + '\n')
+
+        for seq in range(num_seqs):
+            sec = start_sec + seq
+            usecs = rng.integers(0, 1000000, size=len(dsts))
+            seclast_rtts = rng.uniform(2, 20, size=len(dsts))
+            endpoint_rtts = seclast_rtts + rng.uniform(20, 60, size=len(dsts))
+            seclast_ok = rng.random(len(dsts)) >= loss_rate
+            endpoint_ok = (
+                (rng.random(len(dsts)) >= loss_rate)
+                & ~outage_mask[group.index.to_numpy(), seq]
+            )
+
+            for stream, files_info in [('endpoint', endpoint_files_info), ('seclast', seclast_files_info)]:
+                output_file = f"{output_dir}/{stream}_{seq}_{hop}.json"
+                with open(output_file, 'w') as f:
+                    cycle_start, cycle_stop = cycle_records(sec, sec + 1)
+                    f.write(json.dumps(cycle_start) + '\n')
+                    for i, dst in enumerate(dsts):
+                        if stream == 'endpoint':
+                            ttl, ok, addr, rtt = hop, endpoint_ok[i], dst, endpoint_rtts[i]
+                        else:
+                            ttl, ok, addr, rtt = sec_last_hops[i], seclast_ok[i], sec_last_ips[i], seclast_rtts[i]
+                        hops = [make_hop(addr, ttl, rtt, sec, usecs[i], stream == 'endpoint')] if ok else []
+                        record = make_trace_record(dst, src, ttl, ttl, sec, usecs[i], hops)
+                        f.write(json.dumps(record) + '\n')
+                    f.write(json.dumps(cycle_stop) + '\n')
+                files_info.append({
+                    'type': stream,
+                    'seq': seq,
+                    'hop': hop,
+                    'input_file': input_file,
+                    'output_file': output_file,
+                })
+
+    return endpoint_files_info, seclast_files_info
+
+def write_campaign_csvs(
+        endpoints_df: pd.DataFrame,
+        output_file: str,
+        num_seqs: int,
+        loss_rate: float = 0.01,
+        outage_rate: float = 0.05,
+        roman: bool = False,
+        start_sec: int = 1748349926,
+        seed: int = 0,
+) -> tuple:
+    """
+    Writes `{output_file}_endpoint.csv` and `{output_file}_sec_last.csv` in the
+    format read by `import_and_clean_df`, one seq at a time so large campaigns
+    do not need to fit in memory.
+
+    :param roman: (optional) probe only one representative endpoint per pre-sat
+                  hop and write the `{output_file}_sec_last_actual_vs_expected.csv`
+                  mapping used with `modified=True`
+    :return: (endpoint_file, seclast_file, mapping_file or None)
+    """
+    rng = np.random.default_rng(seed)
+    endpoints_df = endpoints_df.reset_index(drop=True)
+    outage_mask = get_outage_mask(len(endpoints_df), num_seqs, outage_rate, seed=seed)
+
+    if roman:
+        presat_df = endpoints_df.groupby('sec_last_ip', as_index=False).first()
+        mapping_file = f"{output_file}_sec_last_actual_vs_expected.csv"
+        endpoints_df[['dst', 'sec_last_ip']].to_csv(mapping_file, index=False)
+    else:
+        presat_df = endpoints_df
+        mapping_file = None
+
+    endpoint_file = f"{output_file}_endpoint.csv"
+    seclast_file = f"{output_file}_sec_last.csv"
+    row_offsets = {endpoint_file: 0, seclast_file: 0}
+    for seq in range(num_seqs):
+        sec = start_sec + seq
+        start_time = datetime.fromtimestamp(sec, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        for stream_file, df in [(endpoint_file, endpoints_df), (seclast_file, presat_df)]:
+            n = len(df)
+            if stream_file == endpoint_file:
+                ok = (rng.random(n) >= loss_rate) & ~outage_mask[:, seq]
+                ttl = df['hop_count'].to_numpy()
+                addr = df['dst'].to_numpy()
+                rtt = rng.uniform(25, 80, size=n)
+            else:
+                ok = rng.random(n) >= loss_rate
+                ttl = df['sec_last_hop'].to_numpy()
+                addr = df['sec_last_ip'].to_numpy()
+                rtt = rng.uniform(2, 20, size=n)
+            seq_df = pd.DataFrame({
+                'date': start_time.split()[0],
+                'seq': seq,
+                'dst': df['dst'].to_numpy(),
+                'stop_reason': np.where(ok, 'COMPLETED', 'HOPLIMIT'),
+                'start_time': start_time,
+                'start_sec': sec,
+                'hop_count': ttl,
+                'ip_at_ttl': np.where(ok, addr, None),
+                'probe_ttl': np.where(ok, ttl, np.nan),
+                'rtt': np.where(ok, rtt.round(3), np.nan),
+            }, columns=CAMPAIGN_COLUMNS)
+            seq_df.index = np.arange(n) + row_offsets[stream_file]
+            row_offsets[stream_file] += n
+            seq_df.to_csv(stream_file, mode='w' if seq == 0 else 'a', header=seq == 0)
+
+    return endpoint_file, seclast_file, mapping_file
@@ -0,0 +1,121 @@
+import math
+import threading
+
+"""
+Response history of the endpoints probed by a running campaign.
+
+An endpoint that has not answered its last `evict_after` probes is evicted
+from its hop group's input file, so later rounds stop spending probes on it.
+Evicted endpoints are re-probed every `reprobe_every` seqs and reinstated in
+their hop group as soon as one of their probes is answered again. The probing
+loop swaps in the new input files between rounds.
+"""
+
+class TargetTracker:
+    """
+    Tracks consecutive unanswered probes per endpoint.
+
+    :param evict_after: (optional) consecutive unanswered probes after which an
+                        endpoint is evicted
+    :param reprobe_every: (optional) seqs between re-probes of evicted endpoints
+    """
+    def __init__(
+            self,
+            evict_after: int = 10,
+            reprobe_every: int = 60,
+    ):
+        if evict_after < 1 or reprobe_every < 1:
+            raise ValueError("'evict_after' and 'reprobe_every' must be at least 1")
+
+        self.evict_after = evict_after
+        self.reprobe_every = reprobe_every
+
+        self.lock = threading.Lock()
+        self.hop_of_dst = {}
+        self.evicted = set()
+        self.misses = {}
+        self.changed_hops = set()
+        self.evictions = 0
+        self.reinstatements = 0
+
+    def track(self, endpoint_groups: list):
+        """
+        Starts tracking the endpoints of a probe plan.
+
+        :param endpoint_groups: 'endpoint' of a plan from `build_probe_plan`,
+                                a list of [hop_count, dsts]
+        """
+        with self.lock:
+            for hop, dsts in endpoint_groups:
+                for dst in dsts:
+                    self.hop_of_dst[dst] = hop
+                    self.misses[dst] = 0
+
+    def observe(self, dsts: list, rtts: list):
+        """
+        Records the replies of one parsed endpoint output, a reply being a
+        row with an rtt. Untracked dsts, e.g. pre-sat representatives, are
+        ignored.
+        """
+        with self.lock:
+            for dst, rtt in zip(dsts, rtts):
+                hop = self.hop_of_dst.get(dst)
+                if hop is None:
+                    continue
+                responded = rtt is not None and not math.isnan(rtt)
+                if responded:
+                    self.misses[dst] = 0
+                    if dst in self.evicted:
+                        self.evicted.remove(dst)
+                        self.changed_hops.add(hop)
+                        self.reinstatements += 1
+                elif dst not in self.evicted:
+                    self.misses[dst] += 1
+                    if self.misses[dst] >= self.evict_after:
+                        self.evicted.add(dst)
+                        self.changed_hops.add(hop)
+                        self.evictions += 1
+
+    def is_evicted(self, dst: str) -> bool:
+        with self.lock:
+            return dst in self.evicted
+
+    def move(self, dst: str, hop: int):
+        """
+        Moves `dst` to the hop group of `hop`, keeping its response history.
+        """
+        with self.lock:
+            self.hop_of_dst[dst] = hop
+
+    def take_changes(self) -> set:
+        """
+        Returns the hop groups with endpoints evicted or reinstated since the
+        last call.
+        """
+        with self.lock:
+            changes = self.changed_hops
+            self.changed_hops = set()
+        return changes
+
+    def reprobe_targets(self, seq: int) -> dict:
+        """
+        Returns the evicted endpoints to re-probe in round `seq`, as hop_count
+        to sorted dsts.
+        """
+        if seq % self.reprobe_every != 0:
+            return {}
+        targets = {}
+        with self.lock:
+            for dst in sorted(self.evicted):
+                targets.setdefault(self.hop_of_dst[dst], []).append(dst)
+        return targets
+
+    def publish(self, metrics):
+        """
+        Sets the target gauges and counters on a `CollectorMetrics`.
+        """
+        with self.lock:
+            metrics.set("targets_active", len(self.hop_of_dst) - len(self.evicted))
+            metrics.set("targets_evicted", len(self.evicted))
+            metrics.set("target_evictions_total", self.evictions)
+            metrics.set("target_reinstatements_total", self.reinstatements)
@@ -0,0 +1,126 @@
+import argparse
+import glob
+import os
+import re
+
+from .src.analysis import analyze_measurements, write_analysis
+
+"""
+Analyzes one collection output directory in a single pass: the latency
+table, outage segments, loss per dst and per pre-sat hop, and summary stats,
+written as parquet files (see src/analysis.py). Run from the paper/ directory:
+    python -m scripts.analyze data/roman-hh-may27
+    python -m scripts.analyze ../data_collection/roman-hh/20250527 --output-dir /tmp/may27
+"""
+
+STREAM_SUFFIXES = ['.manifest.json', '.csv']
+
+def get_stream_file(prefix: str, stream: str) -> str:
+    """
+    Returns the manifest of rotated segments or the csv of a stream written
+    with output prefix `prefix`, or None if there is neither.
+    """
+    for suffix in STREAM_SUFFIXES:
+        if os.path.exists(f"{prefix}_{stream}{suffix}"):
+            return f"{prefix}_{stream}{suffix}"
+    return None
+
+def get_prefixes(data_dir: str) -> list:
+    prefixes = set()
+    for suffix in STREAM_SUFFIXES:
+        for file in glob.glob(os.path.join(data_dir, f"*_endpoint{suffix}")):
+            prefixes.add(file[:-len(f"_endpoint{suffix}")])
+    return sorted(prefixes)
+
+def find_collection_files(data_dir: str, prefix: str = None) -> dict:
+    """
+    Finds the files of one collection output: the endpoint and sec_last
+    streams written by run_roman_hitchhiking.py, coordinator.py or the paper
+    datasets, the dst to pre-sat hop mapping and the Censys exposed services.
+
+    :param data_dir: directory holding the streams
+    :param prefix: (optional) output prefix of the streams, relative to
+                   `data_dir`, if it holds several
+    :return: dict with 'endpoint', 'sec_last', 'mapping' and 'censys' files,
+             'mapping' and 'censys' None if not found
+    """
+    if prefix is not None:
+        prefixes = [os.path.join(data_dir, prefix)]
+    else:
+        prefixes = get_prefixes(data_dir)
+        if len(prefixes) > 1:
+            names = [os.path.basename(p) for p in prefixes]
+            raise ValueError(f"{data_dir} holds several outputs, pick one with --prefix: {', '.join(names)}")
+    if not prefixes or get_stream_file(prefixes[0], 'endpoint') is None:
+        raise ValueError(f"no endpoint output in {data_dir}")
+    prefix = prefixes[0]
+    if get_stream_file(prefix, 'sec_last') is None:
+        raise ValueError(f"no sec_last output for {prefix}")
+
+    name = os.path.basename(prefix)
+    parent_dir = os.path.dirname(os.path.abspath(data_dir))
+    asn = re.search(r'AS\d+', name)
+    mapping_files = [
+        # paper datasets and coordinator.py merges
+        f"{prefix}_sec_last_actual_vs_expected.csv",
+        # run_roman_hitchhiking.py writes the day's streams below its output dir
+        os.path.join(parent_dir, f"sec_last_{name}.csv"),
+    ]
+    censys_files = [] if asn is None else [
+        os.path.join(d, f"censys_exposed_services_{asn.group()}.csv")
+        for d in [data_dir, parent_dir]
+    ]
+    return {
+        'endpoint': get_stream_file(prefix, 'endpoint'),
+        'sec_last': get_stream_file(prefix, 'sec_last'),
+        'mapping': next((f for f in mapping_files if os.path.exists(f)), None),
+        'censys': next((f for f in censys_files if os.path.exists(f)), None),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze one collection output directory in a single pass")
+    parser.add_argument("data_dir", help="Directory holding the endpoint and sec_last outputs")
+    parser.add_argument("--prefix", type=str, default=None,
+                        help="Output prefix of the streams (e.g. 'AS14593'), if the directory holds several")
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="Directory for the parquet tables (default: {data_dir}/analysis)")
+    parser.add_argument("--mapping-file", type=str, default=None,
+                        help="dst to sec_last_ip mapping (default: found next to the outputs)")
+    parser.add_argument("--naive", action="store_true",
+                        help="Join pre-sat hops on dst, for outputs without a mapping (naive HitchHiking)")
+    parser.add_argument("--censys-file", type=str, default=None,
+                        help="Censys exposed services (default: found next to the outputs)")
+    parser.add_argument("--no-censys", action="store_true", help="Do not join Censys and GeoIP metadata")
+    parser.add_argument("--no-filter", action="store_true", help="Keep the dsts with outlying loss")
+    parser.add_argument("--min-outage-len", type=int, default=1, help="Shortest outage kept, in seqs")
+    parser.add_argument("--first-seq", type=int, default=None, help="Optional first seq to analyze")
+    parser.add_argument("--last-seq", type=int, default=None, help="Optional last seq to analyze")
+    args = parser.parse_args()
+
+    files = find_collection_files(args.data_dir, args.prefix)
+    mapping_file = None if args.naive else (args.mapping_file or files['mapping'])
+    censys_file = None if args.no_censys else (args.censys_file or files['censys'])
+    seq_range = None
+    if args.first_seq is not None or args.last_seq is not None:
+        seq_range = (
+            args.first_seq if args.first_seq is not None else float('-inf'),
+            args.last_seq if args.last_seq is not None else float('inf'),
+        )
+    print(f"endpoint: {files['endpoint']}")
+    print(f"sec_last: {files['sec_last']}")
+    print(f"mapping:  {mapping_file}")
+    print(f"censys:   {censys_file}")
+
+    tables = analyze_measurements(
+        files['sec_last'],
+        files['endpoint'],
+        mapping_file=mapping_file,
+        censys_file=censys_file,
+        filter=not args.no_filter,
+        min_outage_len=args.min_outage_len,
+        seq_range=seq_range,
+    )
+    output_dir = args.output_dir or os.path.join(args.data_dir, "analysis")
+    for file in write_analysis(tables, output_dir):
+        print(f"wrote {file}")
+    print(tables['summary'].T.to_string(header=False))
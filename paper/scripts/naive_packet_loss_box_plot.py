@@ -1,9 +1,7 @@
-import os
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
 
 from .src.config import FIG_OUTPUT_DIR, PATH
+from .src.pipeline import Stage, run_stages
 
 def packets_received_box_plot(
         probes_to_packet: pd.DataFrame, 
@@ -66,6 +64,9 @@ def packets_received_box_plot(
     )
 
     # Plot % of Packets Lost
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.figure(figsize=(5, 3))
     ax = sns.boxplot(data=probes_to_packet_seq, x='dst_bin', y='seq_loss_perc')
     plt.xlabel('# of Customers that Share a Pre-Satellite Hop Router')
@@ -76,16 +77,16 @@ def packets_received_box_plot(
     fig_name = f'{fig_output_dir}/naive_packet_loss_per_seclast.png'
     print(f'saving to {fig_name}')
     plt.savefig(fig_name)
+    plt.close()
 
 
 
 naive_dir = f"{PATH}/data/naive"
 naive_seclast_file = f"{naive_dir}/concurrent_AS14593_sec_last.csv"
+probes_to_packet_file = f"{naive_dir}/probes_to_pkt_rate.csv"
 
-if os.path.exists(f"{naive_dir}/probes_to_pkt_rate.csv"):
-    probes_to_packet = pd.read_csv(f"{naive_dir}/probes_to_pkt_rate.csv")
-else:
-    naive_df = pd.read_csv(naive_seclast_file)
+def count_packets_received(seclast_file: str, output_file: str):
+    naive_df = pd.read_csv(seclast_file)
     naive_df = naive_df.dropna(subset=['rtt'])
     print(naive_df)
 
@@ -95,7 +96,32 @@ else:
         .nunique()
         .reset_index()
     )
-    probes_to_packet.to_csv(f"{naive_dir}/probes_to_pkt_rate.csv", index=False)
+    probes_to_packet.to_csv(output_file, index=False)
+
+def plot_packets_received(probes_to_packet_file: str, fig_output_dir: str):
+    # plot packets received for concurrent measurements
+    packets_received_box_plot(pd.read_csv(probes_to_packet_file), fig_output_dir)
+
+def get_stages() -> list:
+    return [
+        Stage(
+            "import:naive_probes_to_pkt_rate",
+            count_packets_received,
+            args=(naive_seclast_file, probes_to_packet_file),
+            inputs=[naive_seclast_file],
+            outputs=[probes_to_packet_file],
+        ),
+        Stage(
+            "plot:naive_packet_loss_per_seclast",
+            plot_packets_received,
+            args=(probes_to_packet_file, FIG_OUTPUT_DIR),
+            inputs=[probes_to_packet_file],
+            outputs=[f'{FIG_OUTPUT_DIR}/naive_packet_loss_per_seclast.png'],
+        ),
+    ]
+
+def main():
+    run_stages(get_stages())
 
-# plot packets received for concurrent measurements
-packets_received_box_plot(probes_to_packet, FIG_OUTPUT_DIR)
+if __name__ == "__main__":
+    main()
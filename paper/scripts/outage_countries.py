@@ -1,14 +1,17 @@
-import os
-import geopandas as gpd
-import matplotlib.pyplot as plt
 import pandas as pd
 
-from .src.import_data import get_endpoint_file, get_seclast_file, import_and_clean_df
-from .src.config import FIG_OUTPUT_DIR, PATH
-from .src.outage_analysis import get_consecutive_df
+from .src.config import CACHE_DIR, FIG_OUTPUT_DIR, PATH, SHAPEFILE_DIR
+from .src.datasets import (
+    ROMAN_HH_DAYS, get_consecutive_file, get_day_stages, get_location_file,
+    get_stage_label,
+)
+from .src.outage_analysis import find_correlated_outages
+from .src.outage_index import add_outages, is_day_stale
+from .src.parse_geolocation import cache_country_shapes, read_country_shapes
+from .src.pipeline import Stage, run_stages
 
-# Merge grouped_counts with countries GeoDataFrame on country name (adjust as needed)
-geopandas_data = "" # FIXME
+COUNTRY_SHAPEFILE = f'{SHAPEFILE_DIR}/ne_110m_admin_0_countries.shp'
+COUNTRY_SHAPES_FILE = f'{CACHE_DIR}/ne_110m_admin_0_countries.pkl'
 
 """
 [
@@ -22,6 +25,7 @@ def investigate_spike(
         spike_intervals, 
         label: str, 
         fig_output_dir: str,
+        country_shapes_file: str = COUNTRY_SHAPES_FILE,
 ):
     outages_at_spike = pd.DataFrame()
     for spike_interval in spike_intervals:
@@ -36,18 +40,19 @@ def investigate_spike(
         how='left',
         on='dst',
     )
-    spike_explode_df = spike_df.explode('seqs')
-
     country_counts = (
-        spike_explode_df
+        spike_df
         .groupby('country')['dst']
         .nunique()
         .reset_index()
         .rename(columns={'dst': 'unique_dst_count'})
     )
-    countries = gpd.read_file(f'{geopandas_data}/ne_110m_admin_0_countries.shp')
+    # read once per process from the cache built by the 'import:country_shapes' stage
+    countries = read_country_shapes(country_shapes_file)
     countries = countries.merge(country_counts, left_on='ISO_A2', right_on='country', how='left')
 
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(8, 4))
 
     # Plot countries without data as grey
@@ -70,89 +75,116 @@ def investigate_spike(
     # Style
     ax.axis('off')
     plt.tight_layout()
-    plt.savefig(f"{fig_output_dir}/spike_country_choropleth_{label}_{start}_{end}.png")
+    plt.savefig(get_spike_figure(fig_output_dir, label, spike_intervals))
     plt.show()
+    plt.close(fig)
+
+def get_spike_figure(fig_output_dir: str, label: str, spike_intervals) -> str:
+    # named after the last interval
+    start, end = spike_intervals[-1]['start'], spike_intervals[-1]['end']
+    return f"{fig_output_dir}/spike_country_choropleth_{label}_{start}_{end}.png"
+
 
 
+outage_index_dir = f'{PATH}/data/outage_index'
+min_correlated_customers = 3
 
-censys_file = f'{PATH}/data/censys_exposed_services_AS14593.csv'
-data_list = [
+# spikes of the outage length distribution, see outage_lengths.py
+spikes = [
     {
-        'data_dir': f'{PATH}/data/roman-hh-may27',
-        'sample_size': 300,
         'label': 'May 27',
+        'intervals': [ { 'start': 70, 'end': 75+1 } ],
     },
     {
-        'data_dir': f'{PATH}/data/roman-hh-may28',
-        'sample_size': 300,
-        'label': 'May 28',
-    },
-    {
-        'data_dir': f'{PATH}/data/roman-hh-may29',
-        'sample_size': 300,
         'label': 'May 29',
+        'intervals': [
+            { 'start': 50, 'end': 55+1 },
+            { 'start': 70, 'end': 75+1 },
+        ],
     },
 ]
 
-min_outage_len = 5
-dfs_and_labels = []
-for d in data_list:
-    OUTPUT_DIR = d['data_dir']
-    INPUT_DIR = d['data_dir']
-    sample_size = d['sample_size']
-
-    if (os.path.exists(f"{OUTPUT_DIR}/consecutive_outages.csv") 
-        and os.path.exists(f"{OUTPUT_DIR}/dst_locations.csv")
-    ):
-        consec_df = pd.read_csv(f"{OUTPUT_DIR}/consecutive_outages.csv")
-        location_df = pd.read_csv(f"{OUTPUT_DIR}/dst_locations.csv")
-
-    else:
-        endpoint_file = get_endpoint_file(INPUT_DIR, sample_size)
-        seclast_file = get_seclast_file(INPUT_DIR, sample_size)
-        outages_df, latency_df, _ = import_and_clean_df(
-                seclast_file, 
-                endpoint_file,
-                censys_file, 
-                OUTPUT_DIR,
-                modified=True,
-                seclast_mapping = f'{INPUT_DIR}/modified_concurrent_AS14593_{sample_size}_sec_last_actual_vs_expected.csv',
-                merge_censys = True,
-        )
-        consec_df = get_consecutive_df(outages_df)
-        consec_df = consec_df[consec_df['len'] > min_outage_len]
-        consec_df.to_csv(f"{OUTPUT_DIR}/consecutive_outages.csv", index=False)
-
-        location_df = latency_df[[
-            'dst', 'sec_last_ip', 'dns_trunc', 'subnet', 'country', 'region',
-        ]].drop_duplicates().dropna(subset=['dst', 'country'])
-
-        location_df.to_csv(f"{OUTPUT_DIR}/dst_locations.csv", index=False)
-
-    dfs_and_labels.append({
-        'df': consec_df,
-        'location_df': location_df,
-        'label': d['label'],
-        'output': FIG_OUTPUT_DIR,
-    })
-
-may_27_data = dfs_and_labels[0]
-may_29_data = dfs_and_labels[2]
-investigate_spike(
-    may_27_data['df'], 
-    may_27_data['location_df'],
-    [ { 'start': 70, 'end': 75+1 } ],
-    may_27_data['label'], 
-    may_27_data['output'], 
-) 
-
-investigate_spike(
-    may_29_data['df'], 
-    may_29_data['location_df'],
-    [ 
-         { 'start': 50, 'end': 55+1 },
-         { 'start': 70, 'end': 75+1 },
-    ],
-    may_29_data['label'], 
-    may_29_data['output'], 
-) 
+def correlate_outages(
+        label: str,
+        consecutive_file: str,
+        location_file: str,
+        correlated_file: str,
+):
+    consec_df = pd.read_csv(consecutive_file)
+    location_df = pd.read_csv(location_file)
+
+    # days are indexed as they are added, see src/outage_index.py
+    if is_day_stale(outage_index_dir, label, consecutive_file):
+        add_outages(outage_index_dir, consec_df, label, source_file=consecutive_file)
+
+    # every window in which customers of a pre-sat hop, PoP, region or
+    # country were out together, not only the hand-picked spikes below
+    correlated_df = find_correlated_outages(consec_df, location_df, min_customers=min_correlated_customers)
+    correlated_df.to_csv(correlated_file, index=False)
+    print(f"{label}: {len(correlated_df)} correlated outage events")
+    print(
+        correlated_df[correlated_df['level'].isin(['region', 'country'])]
+        .sort_values('customers', ascending=False)
+        .head(10)
+        .drop(columns=['dsts'])
+    )
+
+def plot_spike(
+        consecutive_file: str,
+        location_file: str,
+        spike_intervals,
+        label: str,
+        fig_output_dir: str,
+        country_shapes_file: str,
+):
+    investigate_spike(
+        pd.read_csv(consecutive_file),
+        pd.read_csv(location_file),
+        spike_intervals,
+        label,
+        fig_output_dir,
+        country_shapes_file=country_shapes_file,
+    )
+
+def get_stages() -> list:
+    stages = [stage for day in ROMAN_HH_DAYS for stage in get_day_stages(day)]
+    for day in ROMAN_HH_DAYS:
+        consecutive_file = get_consecutive_file(day['data_dir'])
+        location_file = get_location_file(day['data_dir'])
+        stages.append(Stage(
+            f"enrich:{get_stage_label(day['label'])}_correlated",
+            correlate_outages,
+            args=(day['label'], consecutive_file, location_file, f"{day['data_dir']}/correlated_outages.csv"),
+            inputs=[consecutive_file, location_file],
+            outputs=[f"{day['data_dir']}/correlated_outages.csv"],
+        ))
+
+    # shared by every choropleth
+    stages.append(Stage(
+        "import:country_shapes",
+        cache_country_shapes,
+        args=(COUNTRY_SHAPEFILE, COUNTRY_SHAPES_FILE),
+        inputs=[COUNTRY_SHAPEFILE],
+        outputs=[COUNTRY_SHAPES_FILE],
+    ))
+    data_dirs = {day['label']: day['data_dir'] for day in ROMAN_HH_DAYS}
+    for spike in spikes:
+        data_dir = data_dirs[spike['label']]
+        figure = get_spike_figure(FIG_OUTPUT_DIR, spike['label'], spike['intervals'])
+        stages.append(Stage(
+            f"plot:spike_{get_stage_label(spike['label'])}",
+            plot_spike,
+            args=(
+                get_consecutive_file(data_dir), get_location_file(data_dir),
+                spike['intervals'], spike['label'], FIG_OUTPUT_DIR, COUNTRY_SHAPES_FILE,
+            ),
+            inputs=[get_consecutive_file(data_dir), get_location_file(data_dir), COUNTRY_SHAPES_FILE],
+            outputs=[figure],
+        ))
+    return stages
+
+def main():
+    run_stages(get_stages())
+
+if __name__ == "__main__":
+    main()
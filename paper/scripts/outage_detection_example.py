@@ -1,14 +1,17 @@
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import pandas as pd
-import os
 
 from .src.config import FIG_OUTPUT_DIR, PATH
-from .src.import_data import import_and_clean_df
+from .src.datasets import CENSYS_FILE
+from .src.import_data import get_outage_data_points, import_and_clean_df
+from .src.outage_analysis import compare_methodologies, get_detection_bits, get_detection_masks
+from .src.measurement_index import build_measurement_index, query_measurements
+from .src.pipeline import Stage, run_stages
 
 def plot_detected_outages_by_methodology(
         count_df: list,
+        outage_dfs: list,
         labels: list,
+        target_dst: str,
         fig_output_dir: str,
         outage_len: int = 5,
 ):
@@ -25,7 +28,9 @@ def plot_detected_outages_by_methodology(
             grouped.append(current_group)
         return grouped
 
-    fig, axs = plt.subplots(2, 1, figsize=(10, 3), sharex=True, constrained_layout=True)
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+
     fig, axs = plt.subplots(2, 1, figsize=(10, 3), sharex=True, constrained_layout=True)
 
     # Line plot
@@ -74,17 +79,11 @@ def plot_detected_outages_by_methodology(
 
 
 DATA = f"{PATH}/data/naive_roman_rl"
-censys_file = f'{PATH}/data/censys_exposed_services_AS14593.csv'
-
 
 NAIVE_OUTPUT_PATH = f"{DATA}/naive"
 ROMAN_OUTPUT_PATH = f"{DATA}/roman"
 RL_OUTPUT_PATH = f"{DATA}/roman_large"
 
-os.makedirs(NAIVE_OUTPUT_PATH, exist_ok=True)
-os.makedirs(ROMAN_OUTPUT_PATH, exist_ok=True)
-os.makedirs(RL_OUTPUT_PATH, exist_ok=True)
-
 NAIVE_SECLAST_FILE = f"{DATA}/modified_concurrent_AS14593_4_naive_sec_last.csv"
 NAIVE_ENDPOINT_FILE = f"{DATA}/modified_concurrent_AS14593_4_naive_endpoint.csv"
 
@@ -124,51 +123,107 @@ data_files = [
 ]
 
 target_dst = '129.222.5.64'
-outage_dfs = []
-
-for data_f in data_files:
-    if (os.path.exists("{data_f['output_dir']}/naive_roman_rl_outage_{target_dst}.csv")):
-        outage_df = pd.read_csv(f"{data_f['output_dir']}/naive_roman_rl_outage_{target_dst}.csv")
-        outage_dfs.append(outage_df)
-    else:
-        outage_df, latency_df, _ = import_and_clean_df(
-            seclast_file=data_f['seclast_file'],
-            endpoint_file=data_f['endpoint_file'],
-            censys_file=censys_file,
-            output_dir=data_f['output_dir'],
-            modified=data_f['modified'],
-            filter=True,
-            seclast_mapping=data_f['mapping_file'],
-            merge_censys=True
-        )
-        outage_df = outage_df.sort_values(['dst', 'seq'])
-        outage_df = outage_df[outage_df['dst'] == target_dst]
-        outage_df.to_csv(
-            f"{data_f['output_dir']}/naive_roman_rl_outage_{target_dst}.csv", 
-            index=False,
-        )
-        outage_dfs.append(outage_df)
-
-
-
-seqs_per_df = [set(df['seq']) for df in outage_dfs]
-all_seqs = sorted(set().union(*seqs_per_df))
-
-# Get the seqs present in the LAST dataframe (Roman Large)
-last_df_seqs = set(outage_dfs[-1][outage_dfs[-1]['dst'] == target_dst]['seq'])
-
-data = []
-for seq in all_seqs:
-    count = sum(seq in df_seqs for df_seqs in seqs_per_df)
-    in_last_df = seq in last_df_seqs
-    data.append((seq, count, in_last_df))
-
-count_df = pd.DataFrame(data, columns=['seq', 'count', 'is_in_last_df']).sort_values('seq')
-count_df['count'] = count_df['count'].astype(int)
-
-labels = [r"Naive", r"Roman", r"Roman Large"]
-plot_detected_outages_by_methodology(
-    count_df, labels, FIG_OUTPUT_DIR
-)
-
-
+comparison_tables = ['agreement', 'recall', 'dst_recall', 'boundaries']
+
+def get_target_outage_file(output_dir: str, target_dst: str) -> str:
+    return f"{output_dir}/naive_roman_rl_outage_{target_dst}.csv"
+
+def clean_methodology(data_f: dict):
+    import_and_clean_df(
+        seclast_file=data_f['seclast_file'],
+        endpoint_file=data_f['endpoint_file'],
+        censys_file=CENSYS_FILE,
+        output_dir=data_f['output_dir'],
+        modified=data_f['modified'],
+        filter=True,
+        seclast_mapping=data_f['mapping_file'],
+        merge_censys=True
+    )
+
+def get_target_outages(output_dir: str, target_dst: str):
+    latency_file = f"{output_dir}/latency.csv"
+    index_dir = f"{output_dir}/latency_index"
+    build_measurement_index(latency_file, index_dir)
+
+    # only read the blocks holding the target customer
+    outage_df = get_outage_data_points(
+        query_measurements(index_dir, dst=target_dst)
+    )
+    outage_df = outage_df.sort_values(['dst', 'seq'])
+    outage_df.to_csv(get_target_outage_file(output_dir, target_dst), index=False)
+
+def compare_outages(outage_files: list, labels: list, output_dir: str):
+    # compare the methodologies over every customer
+    comparison = compare_methodologies(
+        [pd.read_csv(f) for f in outage_files],
+        labels,
+        min_len=5,
+    )
+    for name in comparison_tables:
+        comparison[name].to_csv(f"{output_dir}/methodology_{name}.csv", index=False)
+    print(comparison['recall'])
+
+def plot_target_outages(outage_files: list, labels: list, target_dst: str, fig_output_dir: str):
+    outage_dfs = [pd.read_csv(f) for f in outage_files]
+    masks_df = get_detection_masks(outage_dfs)
+    masks_df = masks_df[masks_df['dst'] == target_dst]
+    bits = get_detection_bits(masks_df, len(labels))
+    count_df = pd.DataFrame({
+        'seq': masks_df['seq'],
+        'count': bits.sum(axis=1),
+        # seqs detected by the last methodology (Roman Large)
+        'is_in_last_df': bits[:, -1],
+    }).sort_values('seq')
+
+    plot_detected_outages_by_methodology(
+        count_df, outage_dfs, labels, target_dst, fig_output_dir,
+    )
+
+def get_stages() -> list:
+    stages = []
+    for data_f in data_files:
+        label = data_f['label'].lower().replace(' ', '_')
+        output_dir = data_f['output_dir']
+        stages.append(Stage(
+            f"clean:naive_roman_rl_{label}",
+            clean_methodology,
+            args=(data_f,),
+            inputs=[
+                f for f in [data_f['seclast_file'], data_f['endpoint_file'], data_f['mapping_file'], CENSYS_FILE]
+                if f is not None
+            ],
+            outputs=[f"{output_dir}/outage.csv", f"{output_dir}/latency.csv", f"{output_dir}/latency_summary.pkl"],
+        ))
+        stages.append(Stage(
+            f"segment:naive_roman_rl_{label}_target",
+            get_target_outages,
+            args=(output_dir, target_dst),
+            inputs=[f"{output_dir}/latency.csv"],
+            outputs=[get_target_outage_file(output_dir, target_dst)],
+        ))
+
+    labels = [data_f['label'] for data_f in data_files]
+    outage_files = [f"{data_f['output_dir']}/outage.csv" for data_f in data_files]
+    stages.append(Stage(
+        "enrich:methodology_comparison",
+        compare_outages,
+        args=(outage_files, labels, DATA),
+        inputs=outage_files,
+        outputs=[f"{DATA}/methodology_{name}.csv" for name in comparison_tables],
+    ))
+
+    target_files = [get_target_outage_file(data_f['output_dir'], target_dst) for data_f in data_files]
+    stages.append(Stage(
+        f"plot:naive_roman_rl_outage_{target_dst}",
+        plot_target_outages,
+        args=(target_files, labels, target_dst, FIG_OUTPUT_DIR),
+        inputs=target_files,
+        outputs=[f"{FIG_OUTPUT_DIR}/naive_roman_rl_outage_{target_dst}.png"],
+    ))
+    return stages
+
+def main():
+    run_stages(get_stages())
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,8 @@
-import matplotlib.pyplot as plt
-import os
 import pandas as pd
-import seaborn as sns
 
-from .src.config import FIG_OUTPUT_DIR, PATH
-from .src.outage_analysis import get_consecutive_df
-from .src.import_data import get_endpoint_file, get_seclast_file, import_and_clean_df
+from .src.config import FIG_OUTPUT_DIR
+from .src.datasets import ROMAN_HH_DAYS, get_consecutive_file, get_day_stages
+from .src.pipeline import Stage, run_stages
 
 def plot_outage_length_cdf(
         outages_and_labels: list, 
@@ -25,6 +22,9 @@ def plot_outage_length_cdf(
     :param min_outage_len: (optional), minimum outage length to filter for
                             default is 5 consecutive sequence numbers
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.figure(figsize=(5, 3))
 
     #--- CDF
@@ -51,58 +51,32 @@ def plot_outage_length_cdf(
     plt.grid(True, linestyle='--', alpha=0.6)
     plt.tight_layout()
     plt.savefig(f"{output_dir}/outage_length_cdf_plot.png")
+    plt.close()
 
 
-censys_file = f'{PATH}/data/censys_exposed_services_AS14593.csv'
-data_list = [
-    {
-        'data_dir': f'{PATH}/data/roman-hh-may27',
-        'sample_size': 300,
-        'label': 'May 27',
-    },
-    {
-        'data_dir': f'{PATH}/data/roman-hh-may28',
-        'sample_size': 300,
-        'label': 'May 28',
-    },
-    {
-        'data_dir': f'{PATH}/data/roman-hh-may29',
-        'sample_size': 300,
-        'label': 'May 29',
-    },
-]
-
-min_outage_len = 5
-dfs_and_labels = []
-for d in data_list:
-    OUTPUT_DIR = d['data_dir']
-    INPUT_DIR = d['data_dir']
-    sample_size = d['sample_size']
-
-    if (os.path.exists(f"{OUTPUT_DIR}/consecutive_outages.csv")):
-        consec_df = pd.read_csv(f"{OUTPUT_DIR}/consecutive_outages.csv")
-
-    else:
-        # seclast_endpoint_mapping = pd.read_csv(f"{dir}/modified_concurrent_AS14593_{sample_size}_sec_last_actual_vs_expected.csv")
-        endpoint_file = get_endpoint_file(INPUT_DIR, sample_size)
-        seclast_file = get_seclast_file(INPUT_DIR, sample_size)
-        outages_df, latency_df, _ = import_and_clean_df(
-                seclast_file, 
-                endpoint_file,
-                censys_file, 
-                OUTPUT_DIR,
-                modified=True,
-                seclast_mapping = f'{INPUT_DIR}/modified_concurrent_AS14593_{sample_size}_sec_last_actual_vs_expected.csv',
-                merge_censys = True,
-        )
-        consec_df = get_consecutive_df(outages_df)
-        consec_df = consec_df[consec_df['len'] > min_outage_len]
-        consec_df.to_csv(f"{OUTPUT_DIR}/consecutive_outages.csv", index=False)
+def plot_outage_lengths(consecutive_files: list, labels: list, output_dir: str):
+    plot_outage_length_cdf(
+        [
+            {'df': pd.read_csv(f), 'label': label}
+            for f, label in zip(consecutive_files, labels)
+        ],
+        output_dir,
+    )
 
-    dfs_and_labels.append({
-        'df': consec_df,
-        'label': d['label'],
-    })
+def get_stages() -> list:
+    stages = [stage for day in ROMAN_HH_DAYS for stage in get_day_stages(day)]
+    consecutive_files = [get_consecutive_file(day['data_dir']) for day in ROMAN_HH_DAYS]
+    stages.append(Stage(
+        "plot:outage_length_cdf",
+        plot_outage_lengths,
+        args=(consecutive_files, [day['label'] for day in ROMAN_HH_DAYS], FIG_OUTPUT_DIR),
+        inputs=consecutive_files,
+        outputs=[f"{FIG_OUTPUT_DIR}/outage_length_cdf_plot.png"],
+    ))
+    return stages
 
+def main():
+    run_stages(get_stages())
 
-plot_outage_length_cdf(dfs_and_labels, FIG_OUTPUT_DIR)
+if __name__ == "__main__":
+    main()
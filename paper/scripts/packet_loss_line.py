@@ -1,12 +1,25 @@
-import matplotlib.pyplot as plt
 import os
 import pandas as pd
 import re
 
-from .src.config import FIG_OUTPUT_DIR, PATH
+from .src.config import FIG_OUTPUT_DIR, MAY16_DIR, PATH
+from .src.datasets import CENSYS_FILE
 from .src.import_data import get_total_loss_data_points, import_and_clean_df
+from .src.pipeline import Stage, run_stages
 
-CENSYS_FILE = f'{PATH}/data/censys_exposed_services_AS14593.csv'
+def get_sample_sizes(dir: str) -> list:
+    """
+    Returns the sample sizes of the endpoint files in `dir`, sorted.
+    """
+    if not os.path.isdir(dir):
+        return []
+    pattern = re.compile(r"^modified_concurrent_AS14593_(\d+)_endpoint\.csv$")
+    sample_sizes = []
+    for filename in os.listdir(dir):
+        match = pattern.match(filename)
+        if match:
+            sample_sizes.append(int(match.group(1)))
+    return sorted(sample_sizes)
 
 def get_packet_loss_rate(
         dir: str,
@@ -21,19 +34,13 @@ def get_packet_loss_rate(
         packet_loss_df = pd.read_csv(f"{output_dir}/packet_loss_by_sample_size.csv")
         return packet_loss_df
 
-    failure_frac_data = []
+    sample_sizes = get_sample_sizes(dir)
+    if not sample_sizes:
+        raise ValueError(f"no modified_concurrent_AS14593_<sample size>_endpoint.csv files in {dir}")
 
-    pattern = re.compile(r"^modified_concurrent_AS14593_(\d+)_endpoint\.csv$")
-    matching_files = []
-    for filename in os.listdir(dir):
-        match = pattern.match(filename)
-        if match:
-            sample_size = int(match.group(1))  # Extract the integer if needed
-            matching_files.append((filename, sample_size))
-
-    matching_files.sort(key=lambda x: x[1])
+    failure_frac_data = []
 
-    for endpoint_file_name, sample_size in matching_files:
+    for sample_size in sample_sizes:
         tmp_endpoint_file = f"{dir}/modified_concurrent_AS14593_{sample_size}_endpoint.csv"
         tmp_seclast_file = f"{dir}/modified_concurrent_AS14593_{sample_size}_sec_last.csv"
         tmp_seclast_endpoint_mapping_file = f"{dir}/modified_concurrent_AS14593_{sample_size}_sec_last_actual_vs_expected.csv"
@@ -81,6 +88,8 @@ def plot_measurement_success_of_different_sampling_methods(
     :param failure_dfs: a list of dataframes with columns: 'num_endpoints', 'frac'
                         must have the same length as success_dfs
     """
+    import matplotlib.pyplot as plt
+
     # --- how does the subnet sampling vs. sec-last sampling affect failure rates?
     cmap = plt.get_cmap('tab10')
     colors = [cmap(i) for i in range(len(failure_dfs))]
@@ -107,78 +116,108 @@ def plot_measurement_success_of_different_sampling_methods(
     plt.grid(True)
     plt.tight_layout()
     plt.savefig(f'{output_dir}/{fig_name}.png')
+    plt.close()
 
     
-SUBNET_DIR = f"/home/mandat/leo-hitchhiking-tools/roman-hh-may16/sample_size"
+SUBNET_DIR = f"{MAY16_DIR}/sample_size"
 # SUBNET_DIR = f"{PATH}/data/naive_partition/subnet"
-subnet_failure_df = get_packet_loss_rate(
-    SUBNET_DIR,
-    SUBNET_DIR,
-)
-
-# --- SEC-LAST sample size
-SECLAST_DIR = "/home/mandat/leo-hitchhiking-tools/roman-hh-may16/seclast_size"
+SECLAST_DIR = f"{MAY16_DIR}/seclast_size"
 # SECLAST_DIR = f"{PATH}/data/naive_partition/seclast"
-seclast_failure_df = get_packet_loss_rate(
-    SECLAST_DIR,
-    SECLAST_DIR,
-)
-
-plot_measurement_success_of_different_sampling_methods(
-    [subnet_failure_df],
-    FIG_OUTPUT_DIR,
-    "packet_loss_by_sample_size",
-    ['subnet'],
-)
-# --- SUBNET vs. SEC-LAST
-# --- how does the subnet sampling vs. sec-last sampling affect failure rates?
-plot_measurement_success_of_different_sampling_methods(
-    [subnet_failure_df, seclast_failure_df],
-    FIG_OUTPUT_DIR,
-    "packet_loss_by_sample_size_subnet_vs_seclast",
-    ['subnet', 'pre-satellite hop'],
-)
-
-
-DATA_PATH = "/home/mandat/leo-hitchhiking-tools/roman-hh-may16/"
-MULTI_DIR = f"{DATA_PATH}/concurrent_multi_src"
-SINGLE_DIR = f"{DATA_PATH}/concurrent_single_src"
-ROMAN_MULTI_DIR = f"{DATA_PATH}/modified_concurrent_multi_src"
-ROMAN_SINGLE_DIR = f"{DATA_PATH}/modified_concurrent_single_src"
+
+MULTI_DIR = f"{MAY16_DIR}/concurrent_multi_src"
+SINGLE_DIR = f"{MAY16_DIR}/concurrent_single_src"
+ROMAN_MULTI_DIR = f"{MAY16_DIR}/modified_concurrent_multi_src"
+ROMAN_SINGLE_DIR = f"{MAY16_DIR}/modified_concurrent_single_src"
 
 SINGLE_OUTPUT_DIR = f"{PATH}/data/measurement_config_comp/naive_single"
 MULTI_OUTPUT_DIR = f"{PATH}/data/measurement_config_comp/naive_multiple"
 ROMAN_SINGLE_OUTPUT_DIR = f"{PATH}/data/measurement_config_comp/roman_single"
 ROMAN_MULTI_OUTPUT_DIR = f"{PATH}/data/measurement_config_comp/roman_multiple"
-# --- measurement configuration comparison
-single_failure_df = get_packet_loss_rate(
-    SINGLE_DIR,
-    SINGLE_OUTPUT_DIR,
-    modified=False,
-)
-
-multi_failure_df = get_packet_loss_rate(
-    MULTI_DIR,
-    MULTI_OUTPUT_DIR,
-    modified=False,
-)
-
-roman_single_failure_df = get_packet_loss_rate(
-    ROMAN_SINGLE_DIR,
-    ROMAN_SINGLE_OUTPUT_DIR,
-    modified=True,
-)
-
-roman_multi_failure_df = get_packet_loss_rate(
-    ROMAN_MULTI_DIR,
-    ROMAN_MULTI_OUTPUT_DIR,
-    modified=True,
-)
-
-plot_measurement_success_of_different_sampling_methods(
-    [single_failure_df, multi_failure_df, roman_single_failure_df, roman_multi_failure_df],
-    FIG_OUTPUT_DIR,
-    "packet_loss_by_measurement_config",
-    ['1 Source IP (Naive)', '8 Source IPs (Naive)', '1 Source IP (Roman)', '8 Source IPs (Roman)'],
-    marker=False,
-)
\ No newline at end of file
+
+# name -> (raw measurement dir, output dir, modified)
+loss_datasets = {
+    'subnet': (SUBNET_DIR, SUBNET_DIR, False),
+    'seclast': (SECLAST_DIR, SECLAST_DIR, False),
+    'naive_single': (SINGLE_DIR, SINGLE_OUTPUT_DIR, False),
+    'naive_multiple': (MULTI_DIR, MULTI_OUTPUT_DIR, False),
+    'roman_single': (ROMAN_SINGLE_DIR, ROMAN_SINGLE_OUTPUT_DIR, True),
+    'roman_multiple': (ROMAN_MULTI_DIR, ROMAN_MULTI_OUTPUT_DIR, True),
+}
+
+figures = [
+    {
+        # --- subnet sample size
+        'fig_name': "packet_loss_by_sample_size",
+        'datasets': ['subnet'],
+        'labels': ['subnet'],
+        'marker': True,
+    },
+    {
+        # --- SUBNET vs. SEC-LAST
+        # --- how does the subnet sampling vs. sec-last sampling affect failure rates?
+        'fig_name': "packet_loss_by_sample_size_subnet_vs_seclast",
+        'datasets': ['subnet', 'seclast'],
+        'labels': ['subnet', 'pre-satellite hop'],
+        'marker': True,
+    },
+    {
+        # --- measurement configuration comparison
+        'fig_name': "packet_loss_by_measurement_config",
+        'datasets': ['naive_single', 'naive_multiple', 'roman_single', 'roman_multiple'],
+        'labels': ['1 Source IP (Naive)', '8 Source IPs (Naive)', '1 Source IP (Roman)', '8 Source IPs (Roman)'],
+        'marker': False,
+    },
+]
+
+def get_loss_file(output_dir: str) -> str:
+    return f"{output_dir}/packet_loss_by_sample_size.csv"
+
+def plot_packet_loss(loss_files: list, fig_name: str, labels: list, marker: bool, fig_output_dir: str):
+    plot_measurement_success_of_different_sampling_methods(
+        [pd.read_csv(f) for f in loss_files],
+        fig_output_dir,
+        fig_name,
+        labels,
+        marker=marker,
+    )
+
+def get_stages() -> list:
+    stages = []
+    for name, (dir, output_dir, modified) in loss_datasets.items():
+        sample_sizes = get_sample_sizes(dir)
+        stages.append(Stage(
+            f"clean:packet_loss_{name}",
+            get_packet_loss_rate,
+            args=(dir, output_dir, modified),
+            # not `dir` itself, the outputs written into it keep it newer than
+            # them, unless it has no sample sizes (e.g. the raw data is not
+            # there) and the stage cannot run
+            inputs=[
+                f"{dir}/modified_concurrent_AS14593_{sample_size}_{stream}.csv"
+                for sample_size in sample_sizes
+                for stream in ['endpoint', 'sec_last']
+            ] or [dir],
+            # the joined data of each sample size is cached too
+            outputs=[get_loss_file(output_dir)] + [
+                f"{output_dir}/sample_{sample_size}/{f}"
+                for sample_size in sample_sizes
+                for f in ['outage.csv', 'latency.csv', 'latency_summary.pkl']
+            ],
+        ))
+
+    for figure in figures:
+        loss_files = [get_loss_file(loss_datasets[name][1]) for name in figure['datasets']]
+        stages.append(Stage(
+            f"plot:{figure['fig_name']}",
+            plot_packet_loss,
+            args=(loss_files, figure['fig_name'], figure['labels'], figure['marker'], FIG_OUTPUT_DIR),
+            inputs=loss_files,
+            outputs=[f"{FIG_OUTPUT_DIR}/{figure['fig_name']}.png"],
+        ))
+    return stages
+
+def main():
+    run_stages(get_stages())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+
+# figures are rendered in worker processes without a display; set before
+# the plotting functions import matplotlib
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from . import (
+    naive_packet_loss_box_plot, outage_countries, outage_detection_example,
+    outage_lengths, packet_loss_line,
+)
+from .src.pipeline import run_stages, select_stages
+
+"""
+Builds every paper figure, running only the stages whose inputs changed, see
+src/pipeline.py. Run from the paper/ directory:
+    python -m scripts.pipeline --jobs 4
+    python -m scripts.pipeline plot:outage_length_cdf
+Each figure script can also be run on its own, e.g. `python -m scripts.outage_lengths`.
+"""
+
+FIGURE_SCRIPTS = [
+    naive_packet_loss_box_plot,
+    outage_countries,
+    outage_detection_example,
+    outage_lengths,
+    packet_loss_line,
+]
+
+def get_all_stages() -> list:
+    """
+    Returns the stages of every figure script, stages shared by several
+    scripts (e.g. the cleaning of a day) once.
+    """
+    stages = {}
+    for script in FIGURE_SCRIPTS:
+        for stage in script.get_stages():
+            stages.setdefault(stage.name, stage)
+    return list(stages.values())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the paper figures")
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        help="Optional stage names or prefixes (e.g. 'plot:', 'clean:may_27') to build with their dependencies"
+    )
+    parser.add_argument("--jobs", type=int, default=1, help="Number of stages run at once")
+    parser.add_argument("--force", action="store_true", help="Rebuild every selected stage")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the stages that would run")
+    parser.add_argument("--list", action="store_true", help="List the stages with their inputs and outputs")
+    args = parser.parse_args()
+
+    stages = get_all_stages()
+    if args.stages:
+        stages = select_stages(stages, args.stages)
+
+    if args.list:
+        for stage in stages:
+            print(stage.name)
+            for f in stage.inputs:
+                print(f"  < {f}")
+            for f in stage.outputs:
+                print(f"  > {f}")
+    else:
+        status = run_stages(stages, jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+        for stage in stages:
+            print(f"{stage.name:<50} {status[stage.name]}")
@@ -0,0 +1,146 @@
+import os
+import pandas as pd
+
+from .import_data import (
+    clean_joined_df, get_loss_outlier_dsts, get_outage_data_points, join_measurements,
+    read_measurements,
+)
+from .loss_stats import LEVELS, LossCounters
+from .outage_analysis import get_outage_segments
+
+"""
+Single-pass analysis of one collection output: the endpoint and pre-sat
+measurements are read and joined once, and every table is derived from the
+joined data in memory, see scripts/analyze.py.
+
+Tables:
+- latency: the joined and cleaned measurements, like 'latency.csv' from
+  `import_and_clean_df`
+- outages: every run of consecutive outage seqs per dst, see
+  `get_outage_segments`
+- loss: probes sent and lost per dst and per pre-sat hop, see `LossCounters`
+- summary: one row of campaign-wide counts, loss and latency quantiles
+"""
+
+TABLES = ['latency', 'outages', 'loss', 'summary']
+
+def get_loss_table(joined_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param joined_df: output of `join_measurements`, before outlying dsts are
+                      dropped
+    :return: dataframe with 'level', 'key', 'sent', 'lost', 'loss_rate' and
+             'outlier': for dsts, the ones `clean_joined_df` drops from the
+             latency table (rated on seqs with loss over the last seq, not on
+             'loss_rate'); for pre-sat hops, the outliers of 'loss_rate'
+    """
+    counters = LossCounters(windows=1)
+    counters.update(joined_df)
+    loss_dfs = []
+    for level in LEVELS:
+        level_df = counters.cumulative_loss(level)
+        outliers = get_loss_outlier_dsts(joined_df) if level == 'dst' else counters.outliers(level)
+        level_df['outlier'] = level_df.index.isin(outliers)
+        loss_dfs.append(level_df.rename_axis('key').reset_index().assign(level=level))
+    return pd.concat(loss_dfs, ignore_index=True)[
+        ['level', 'key', 'sent', 'lost', 'loss_rate', 'outlier']
+    ]
+
+def get_summary(
+        joined_df: pd.DataFrame,
+        latency_df: pd.DataFrame,
+        outages_df: pd.DataFrame,
+        segments_df: pd.DataFrame,
+        loss_df: pd.DataFrame,
+) -> pd.DataFrame:
+    dst_loss_df = loss_df[loss_df['level'] == 'dst']
+    sent = dst_loss_df['sent'].sum()
+    summary = {
+        'dsts': joined_df['dst'].nunique(),
+        'dsts_kept': latency_df['dst'].nunique(),
+        'presat_hops': latency_df['sec_last_ip'].nunique(),
+        'first_seq': joined_df['seq'].min(),
+        'last_seq': joined_df['seq'].max(),
+        'first_start_time': joined_df['start_time'].min(),
+        'last_start_time': joined_df['start_time'].max(),
+        'probes': sent,
+        'loss_rate': dst_loss_df['lost'].sum() / sent if sent else float('nan'),
+        'outage_probes': len(outages_df),
+        'outages': len(segments_df),
+        'outage_dsts': segments_df['dst'].nunique(),
+        'mean_outage_len': segments_df['len'].mean(),
+        'max_outage_len': segments_df['len'].max(),
+    }
+    for metric in ['sat_rtt', 'rtt_endpoint']:
+        for q in [0.5, 0.9, 0.99]:
+            summary[f'{metric}_q{q}'] = latency_df[metric].quantile(q)
+    return pd.DataFrame([summary])
+
+def analyze_measurements(
+        seclast_file: str,
+        endpoint_file: str,
+        mapping_file: str = None,
+        censys_file: str = None,
+        filter: bool = True,
+        min_outage_len: int = 1,
+        seq_range: tuple = None,
+) -> dict:
+    """
+    Builds every table from one read and join of the measurements.
+
+    :param seclast_file: pre-sat measurements, csv or manifest
+    :param endpoint_file: endpoint measurements, csv or manifest
+    :param mapping_file: (optional) file mapping each 'dst' to its
+                         'sec_last_ip'; if given, the pre-sat hops are joined
+                         through their representative dst (Roman HitchHiking)
+    :param censys_file: (optional) Censys exposed services file, joins the
+                        'dns_trunc' and GeoIP columns and keeps only the dsts
+                        in it
+    :param filter: (optional) drop the dsts with outlying loss
+    :param min_outage_len: (optional) shortest outage kept, in seqs
+    :param seq_range: (optional) inclusive (first seq, last seq) to read
+    :return: table name -> dataframe, see `TABLES`
+    """
+    joined_df = join_measurements(
+        read_measurements(seclast_file, seq_range=seq_range),
+        read_measurements(endpoint_file, seq_range=seq_range),
+        modified=mapping_file is not None,
+        seclast_mapping=mapping_file,
+    )
+    latency_df = clean_joined_df(
+        joined_df, censys_file, filter=filter, merge_censys=censys_file is not None,
+    ).reset_index(drop=True)
+
+    outages_df = get_outage_data_points(latency_df)
+    segments_df = get_outage_segments(outages_df)
+    segments_df = segments_df[segments_df['len'] >= min_outage_len].reset_index(drop=True)
+    # the pre-sat hop of each dst, to group its outages with its neighbours'
+    presat_of_dst = latency_df.dropna(subset=['sec_last_ip']).groupby('dst')['sec_last_ip'].first()
+    segments_df.insert(1, 'sec_last_ip', segments_df['dst'].map(presat_of_dst))
+
+    loss_df = get_loss_table(joined_df)
+    return {
+        'latency': latency_df,
+        'outages': segments_df,
+        'loss': loss_df,
+        'summary': get_summary(joined_df, latency_df, outages_df, segments_df, loss_df),
+    }
+
+def get_table_file(output_dir: str, table: str) -> str:
+    return f"{output_dir}/{table}.parquet"
+
+def write_analysis(tables: dict, output_dir: str) -> list:
+    """
+    Writes each table to '{output_dir}/{table}.parquet' (requires pyarrow).
+
+    :return: files written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files = []
+    for table, df in tables.items():
+        file = get_table_file(output_dir, table)
+        df.to_parquet(file, index=False)
+        files.append(file)
+    return files
+
+def read_analysis(output_dir: str, table: str) -> pd.DataFrame:
+    return pd.read_parquet(get_table_file(output_dir, table))
@@ -1,2 +1,18 @@
-FIG_OUTPUT_DIR = "figures"
-PATH = "/home/mandat/roman_hitchhiking/paper" # assumes in /paper directory
\ No newline at end of file
+import os
+
+# every path can be overridden with an environment variable, e.g.
+#   ROMAN_HH_PAPER_DIR=/data/paper python -m scripts.pipeline
+
+# the paper/ directory, holding data/ and figures/
+PATH = os.environ.get(
+    "ROMAN_HH_PAPER_DIR",
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+)
+FIG_OUTPUT_DIR = os.environ.get("ROMAN_HH_FIG_DIR", f"{PATH}/figures")
+# shared inputs converted once for faster reads, see scripts/pipeline.py
+CACHE_DIR = os.environ.get("ROMAN_HH_CACHE_DIR", f"{PATH}/data/cache")
+
+# raw measurements of the May 16 sample size and configuration comparisons
+MAY16_DIR = os.environ.get("ROMAN_HH_MAY16_DIR", "/home/mandat/leo-hitchhiking-tools/roman-hh-may16")
+# directory of the Natural Earth ne_110m_admin_0_countries shapefile
+SHAPEFILE_DIR = os.environ.get("ROMAN_HH_SHAPEFILE_DIR", f"{PATH}/data/shapefiles")
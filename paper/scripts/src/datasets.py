@@ -0,0 +1,108 @@
+import pandas as pd
+
+from .config import PATH
+from .import_data import get_endpoint_file, get_seclast_file, import_and_clean_df
+from .outage_analysis import get_consecutive_df
+from .pipeline import Stage
+
+"""
+Datasets shared by several figure scripts, and the pipeline stages turning
+their raw measurements into the intermediate files the figures read.
+"""
+
+CENSYS_FILE = f'{PATH}/data/censys_exposed_services_AS14593.csv'
+
+# one day of Roman HitchHiking each, see data/README.md
+ROMAN_HH_DAYS = [
+    {
+        'data_dir': f'{PATH}/data/roman-hh-may27',
+        'sample_size': 300,
+        'label': 'May 27',
+    },
+    {
+        'data_dir': f'{PATH}/data/roman-hh-may28',
+        'sample_size': 300,
+        'label': 'May 28',
+    },
+    {
+        'data_dir': f'{PATH}/data/roman-hh-may29',
+        'sample_size': 300,
+        'label': 'May 29',
+    },
+]
+
+MIN_OUTAGE_LEN = 5
+
+def get_stage_label(label: str) -> str:
+    return label.lower().replace(' ', '_')
+
+def get_mapping_file(data_dir: str, sample_size: int) -> str:
+    return f'{data_dir}/modified_concurrent_AS14593_{sample_size}_sec_last_actual_vs_expected.csv'
+
+def get_consecutive_file(data_dir: str) -> str:
+    return f"{data_dir}/consecutive_outages.csv"
+
+def get_location_file(data_dir: str) -> str:
+    return f"{data_dir}/dst_locations.csv"
+
+def clean_day(data_dir: str, sample_size: int):
+    import_and_clean_df(
+        get_seclast_file(data_dir, sample_size),
+        get_endpoint_file(data_dir, sample_size),
+        CENSYS_FILE,
+        data_dir,
+        modified=True,
+        seclast_mapping=get_mapping_file(data_dir, sample_size),
+        merge_censys=True,
+    )
+
+def segment_outages(outage_file: str, consecutive_file: str, min_outage_len: int = MIN_OUTAGE_LEN):
+    consec_df = get_consecutive_df(pd.read_csv(outage_file))
+    consec_df = consec_df[consec_df['len'] > min_outage_len]
+    consec_df.to_csv(consecutive_file, index=False)
+
+def locate_customers(latency_file: str, location_file: str):
+    location_df = pd.read_csv(latency_file, usecols=[
+        'dst', 'sec_last_ip', 'dns_trunc', 'subnet', 'country', 'region',
+    ])
+    location_df = location_df.drop_duplicates().dropna(subset=['dst', 'country'])
+    location_df.to_csv(location_file, index=False)
+
+def get_day_stages(day: dict) -> list:
+    """
+    Returns the stages building the outage segments ('consecutive_outages.csv')
+    and customer locations ('dst_locations.csv') of one of `ROMAN_HH_DAYS`.
+    """
+    data_dir = day['data_dir']
+    sample_size = day['sample_size']
+    label = get_stage_label(day['label'])
+    outage_file = f"{data_dir}/outage.csv"
+    latency_file = f"{data_dir}/latency.csv"
+    return [
+        Stage(
+            f"clean:{label}",
+            clean_day,
+            args=(data_dir, sample_size),
+            inputs=[
+                get_seclast_file(data_dir, sample_size),
+                get_endpoint_file(data_dir, sample_size),
+                get_mapping_file(data_dir, sample_size),
+                CENSYS_FILE,
+            ],
+            outputs=[outage_file, latency_file, f"{data_dir}/latency_summary.pkl"],
+        ),
+        Stage(
+            f"segment:{label}",
+            segment_outages,
+            args=(outage_file, get_consecutive_file(data_dir)),
+            inputs=[outage_file],
+            outputs=[get_consecutive_file(data_dir)],
+        ),
+        Stage(
+            f"enrich:{label}_locations",
+            locate_customers,
+            args=(latency_file, get_location_file(data_dir)),
+            inputs=[latency_file],
+            outputs=[get_location_file(data_dir)],
+        ),
+    ]
@@ -1,7 +1,10 @@
+import json
 import os
 import pandas as pd
 
-from .parse_geolocation import get_all_geoip, get_cleaned_censys
+from .latency_summary import summarize_latency
+from .loss_stats import get_loss_outliers
+from .parse_geolocation import get_censys_enrichment
 
 def get_endpoint_file(
         dir: str,
@@ -15,6 +18,52 @@ def get_seclast_file(
 ):
     return f"{dir}/modified_concurrent_AS14593_{sample_num}_sec_last.csv"
 
+def in_range(low, high, value_range: tuple) -> bool:
+    # segments without a recorded range are always read
+    if value_range is None or low is None or high is None:
+        return True
+    return low <= value_range[1] and high >= value_range[0]
+
+def read_measurements(
+        file: str,
+        seq_range: tuple = None,
+        time_range: tuple = None,
+) -> pd.DataFrame:
+    """
+    Reads one stream of measurements from data_collection/, either a single
+    csv or the segments listed in a `.manifest.json` written by
+    data_collection/output_partitions.py. Only the segments overlapping
+    `seq_range` and `time_range` are read.
+
+    :param file: csv or manifest file
+    :param seq_range: (optional) inclusive (first seq, last seq) to keep
+    :param time_range: (optional) inclusive (first, last) 'start_sec' to keep
+    """
+    if not file.endswith(".manifest.json"):
+        dfs = [pd.read_csv(file, index_col=0)]
+    else:
+        with open(file, 'r') as f:
+            manifest = json.load(f)
+        segment_dir = os.path.dirname(file)
+        dfs = [
+            pd.read_csv(os.path.join(segment_dir, segment['file']), index_col=0)
+            for segment in manifest['segments']
+            if in_range(segment['min_seq'], segment['max_seq'], seq_range)
+            and in_range(segment['min_start_sec'], segment['max_start_sec'], time_range)
+        ]
+        if not dfs:
+            return pd.DataFrame(columns=[
+                'seq', 'dst', 'stop_reason', 'start_time', 'start_sec',
+                'hop_count', 'ip_at_ttl', 'probe_ttl', 'rtt',
+            ])
+
+    df = pd.concat(dfs)
+    if seq_range is not None:
+        df = df[df['seq'].between(*seq_range)]
+    if time_range is not None:
+        df = df[df['start_sec'].between(*time_range)]
+    return df
+
 def get_successful_data_points(
         df: pd.DataFrame, 
 ) -> pd.DataFrame:
@@ -51,36 +100,25 @@ def get_total_loss_data_points(
         df['rtt_endpoint'].isna() & df['rtt_seclast'].isna()
     )]
 
-def import_and_clean_df(
-        seclast_file: str, endpoint_file: str, 
-        censys_file: str, 
-        output_dir: str,
+def join_measurements(
+        seclast_df: pd.DataFrame,
+        endpoint_df: pd.DataFrame,
         modified: bool = False,
-        filter: bool = True,
         seclast_mapping: str = None,
-        merge_censys: bool = False,
-):
-    """
-    Imports data from data_collection/ and cleans it:
-    - filters out invalid endpoints according to the original HitchHiking methodology.
-    - maps the endpoint ips to their second-to-last ips and joins the data.
-    - joins metadata (dns_name) from Censys data and Starlink GeoIP data.
-    
-    The 'ip_at_ttl' when conducting pre-satellite measurements very rarely changes.
-    The average number of successful measurements for each pre-satellite hop is around 245.
+) -> pd.DataFrame:
     """
+    Joins the endpoint and pre-sat measurements of each seq, keeping the
+    IPs with at least one viable data point.
 
-    if (
-        os.path.exists(f"{output_dir}/outage.csv") 
-        and os.path.exists(f"{output_dir}/latency.csv") 
-    ):
-        outages_df = pd.read_csv(f"{output_dir}/outage.csv")
-        latency_df = pd.read_csv(f"{output_dir}/latency.csv")
-        return outages_df, latency_df, None
-
-    seclast_df = pd.read_csv(seclast_file, index_col=0)
-    endpoint_df = pd.read_csv(endpoint_file, index_col=0)
-
+    :param seclast_df: pre-sat measurements, see `read_measurements`
+    :param endpoint_df: endpoint measurements, see `read_measurements`
+    :param modified: (optional) whether the pre-sat hops were probed through
+                     one representative dst each (Roman HitchHiking)
+    :param seclast_mapping: (optional) with `modified`, file mapping each
+                            'dst' to its 'sec_last_ip'
+    :return: dataframe with 'seq', 'dst', 'sec_last_ip', 'ip_at_ttl_seclast',
+             'start_time', 'rtt_seclast' and 'rtt_endpoint'
+    """
     # only include pre-sat IPs with at least one viable data point
     seclast_filtered = seclast_df.dropna(subset='rtt')
     seclast_ips = list(seclast_filtered['ip_at_ttl'].unique())
@@ -149,12 +187,18 @@ def import_and_clean_df(
         )
         df['sec_last_ip'] = df['ip_at_ttl_seclast']
 
-    df = df[[
+    return df[[
         'seq', 'dst', 'sec_last_ip', 'ip_at_ttl_seclast', 
         'start_time', 'rtt_seclast', 'rtt_endpoint',
     ]]
 
-
+def get_loss_outlier_dsts(
+        df: pd.DataFrame,
+) -> pd.Index:
+    """
+    Returns the dsts `clean_joined_df` drops: those whose number of seqs with
+    a lost probe, over the last seq, is an outlier (see `get_loss_outliers`).
+    """
     max_seq = df['seq'].max()
     loss_df = get_total_loss_data_points(df)
     loss_per_dst = (
@@ -162,34 +206,80 @@ def import_and_clean_df(
         .groupby('dst')['seq']
         .nunique()
     )
-    loss_per_dst_df = loss_per_dst.reset_index()
     loss_rate_per_dst = loss_per_dst / max_seq
-    mean_loss = loss_rate_per_dst.mean()
-    std_loss = loss_rate_per_dst.std()
+    return get_loss_outliers(loss_rate_per_dst)
 
+def clean_joined_df(
+        df: pd.DataFrame,
+        censys_file: str,
+        filter: bool = True,
+        merge_censys: bool = False,
+) -> pd.DataFrame:
+    """
+    Drops the dsts with outlying loss, joins the Censys metadata and adds
+    'sat_rtt' to the output of `join_measurements`.
+    """
     if filter:
-        loss_per_dst_df['loss_rate'] = loss_per_dst_df['seq'] / max_seq
-
-        failure_count_thresh = loss_per_dst_df[
-            loss_per_dst_df['loss_rate'] > (mean_loss + 2 * std_loss)
-        ]['dst'].unique()
+        # see loss_stats.py for the same filter over incrementally updated counts
+        failure_count_thresh = get_loss_outlier_dsts(df)
         df = df[~df['dst'].isin(failure_count_thresh)]
 
     # Merge with Censys dns names
     if merge_censys: # Starlink-specific filtering
-        censys_df = get_cleaned_censys(censys_file)
-        censys_df = censys_df[['ip', 'dns_trunc']]
-        censys_df = get_all_geoip(censys_df)
-        censys_df.to_csv(f"{output_dir}/censys_cleaned.csv", index=False)
-        df = df.merge(censys_df, how='inner', left_on='dst', right_on='ip')
-        df = df.drop(columns='ip')
+        censys_df = get_censys_enrichment(censys_file)
+        df = df.join(censys_df, how='inner', on='dst').reset_index(drop=True)
     df['sat_rtt'] = df['rtt_endpoint'] - df['rtt_seclast']
-    df = df.drop_duplicates(subset=['dst', 'ip_at_ttl_seclast', 'seq'])
+    return df.drop_duplicates(subset=['dst', 'ip_at_ttl_seclast', 'seq'])
+
+def import_and_clean_df(
+        seclast_file: str, endpoint_file: str, 
+        censys_file: str, 
+        output_dir: str,
+        modified: bool = False,
+        filter: bool = True,
+        seclast_mapping: str = None,
+        merge_censys: bool = False,
+        seq_range: tuple = None,
+):
+    """
+    Imports data from data_collection/ and cleans it:
+    - filters out invalid endpoints according to the original HitchHiking methodology.
+    - maps the endpoint ips to their second-to-last ips and joins the data.
+    - joins metadata (dns_name) from Censys data and Starlink GeoIP data,
+      using the shared lookup table from `get_censys_enrichment`.
+
+    `seclast_file` and `endpoint_file` may be csv files or manifests of
+    rotated segments, see `read_measurements`. With `seq_range` only the
+    segments and rows in that range are read, and the full-range outage.csv
+    and latency.csv cached in `output_dir` are neither read nor written (the
+    dsts dropped for outlying loss depend on the range).
+    
+    The 'ip_at_ttl' when conducting pre-satellite measurements very rarely changes.
+    The average number of successful measurements for each pre-satellite hop is around 245.
+    """
+
+    use_cache = seq_range is None
+    if (
+        use_cache
+        and os.path.exists(f"{output_dir}/outage.csv") 
+        and os.path.exists(f"{output_dir}/latency.csv") 
+    ):
+        outages_df = pd.read_csv(f"{output_dir}/outage.csv")
+        latency_df = pd.read_csv(f"{output_dir}/latency.csv")
+        return outages_df, latency_df, None
+
+    seclast_df = read_measurements(seclast_file, seq_range=seq_range)
+    endpoint_df = read_measurements(endpoint_file, seq_range=seq_range)
+    df = join_measurements(seclast_df, endpoint_df, modified=modified, seclast_mapping=seclast_mapping)
+    df = clean_joined_df(df, censys_file, filter=filter, merge_censys=merge_censys)
 
-    # plot joined and filtered data
-    df.to_csv(f"{output_dir}/latency.csv", index=False)
     outages_df = df[(df['rtt_seclast'].notna()) & (df['rtt_endpoint'].isna())]
-    outages_df.to_csv(f"{output_dir}/outage.csv", index=False)
+    if use_cache:
+        # plot joined and filtered data
+        df.to_csv(f"{output_dir}/latency.csv", index=False)
+        # per-minute counts and sat_rtt/rtt_endpoint sketches, see latency_summary.py
+        pd.to_pickle(summarize_latency(df), f"{output_dir}/latency_summary.pkl")
+        outages_df.to_csv(f"{output_dir}/outage.csv", index=False)
 
     outages_df = outages_df.copy()
     outages_df['seq'] = outages_df['seq'].astype(int)
@@ -0,0 +1,232 @@
+import os
+import numpy as np
+import pandas as pd
+
+"""
+Downsampled summary of joined measurements (the 'latency.csv' written by
+`import_and_clean_df`), so latency over days or months can be plotted and
+compared without loading every row.
+
+For every dst, pre-sat hop ('sec_last_ip') and PoP ('dns_trunc') and every
+`freq` time bucket of 'start_time', a summary keeps:
+- buckets: the number of probes and of lost probes, those without a pre-sat
+  reply ('rtt_seclast' NaN) as in loss_stats.py
+- sketches: the number of 'sat_rtt' and 'rtt_endpoint' values per
+  logarithmic bin, so quantiles are within `relative_accuracy` of the exact
+  ones
+
+Both are plain counts, so summaries of several files or days are merged, and
+buckets coarsened, by adding them up (`merge_latency_summaries`,
+`downsample_latency_summary`).
+"""
+
+DEFAULT_FREQ = '1min'
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# values closer to 0 ms than this share bin 0
+MIN_VALUE = 1e-3
+
+LEVELS = ['dst', 'sec_last_ip', 'dns_trunc']
+METRICS = ['sat_rtt', 'rtt_endpoint']
+
+def get_gamma(relative_accuracy: float) -> float:
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+def get_sketch_bins(values: np.ndarray, relative_accuracy: float) -> np.ndarray:
+    """
+    Returns the bin of each value: bin k > 0 holds the values in
+    (MIN_VALUE * gamma^(k-1), MIN_VALUE * gamma^k], negative values (e.g. a
+    'sat_rtt' below the pre-sat rtt) the mirrored bins -k.
+    """
+    magnitude = np.abs(values)
+    bins = np.zeros(len(values), dtype='int64')
+    large = magnitude >= MIN_VALUE
+    bins[large] = np.maximum(np.ceil(
+        np.log(magnitude[large] / MIN_VALUE) / np.log(get_gamma(relative_accuracy))
+    ).astype('int64'), 1)
+    return np.where(values < 0, -bins, bins)
+
+def get_bin_values(bins: np.ndarray, relative_accuracy: float) -> np.ndarray:
+    gamma = get_gamma(relative_accuracy)
+    magnitude = MIN_VALUE * gamma ** (np.abs(bins) - 1) * 2 * gamma / (gamma + 1)
+    return np.where(bins == 0, 0.0, np.sign(bins) * magnitude)
+
+def summarize_latency(
+        df: pd.DataFrame,
+        freq: str = DEFAULT_FREQ,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+) -> dict:
+    """
+    Summarizes joined measurements.
+
+    :param df: measurements formatted like the output of `import_and_clean_df`
+    :param freq: (optional) pandas frequency of the time buckets
+    :param relative_accuracy: (optional) relative error of the sketch quantiles
+    :return: summary dict with 'freq', 'relative_accuracy', 'buckets'
+             (level, key, bucket, count, lost) and 'sketches'
+             (level, key, bucket, metric, bin, count)
+    """
+    df = df.assign(bucket=pd.to_datetime(df['start_time']).dt.floor(freq))
+    if 'sat_rtt' not in df.columns:
+        df['sat_rtt'] = df['rtt_endpoint'] - df['rtt_seclast']
+    # the repo's loss: the pre-sat hop did not reply, see `get_total_loss_data_points`
+    df['lost'] = df['rtt_seclast'].isna()
+    for metric in METRICS:
+        values = df[metric].to_numpy(dtype='float64')
+        bins = np.full(len(df), np.nan)
+        valid = ~np.isnan(values)
+        bins[valid] = get_sketch_bins(values[valid], relative_accuracy)
+        df[f'{metric}_bin'] = bins
+
+    buckets, sketches = [], []
+    for level in LEVELS:
+        if level not in df.columns:
+            continue
+        level_df = df[df[level].notna()]
+        bucket_df = (
+            level_df
+            .groupby([level, 'bucket'])
+            .agg(count=('lost', 'size'), lost=('lost', 'sum'))
+            .reset_index()
+            .rename(columns={level: 'key'})
+        )
+        buckets.append(bucket_df.assign(level=level))
+        for metric in METRICS:
+            sketch_df = (
+                level_df
+                .dropna(subset=[f'{metric}_bin'])
+                .groupby([level, 'bucket', f'{metric}_bin'])
+                .size()
+                .reset_index(name='count')
+                .rename(columns={level: 'key', f'{metric}_bin': 'bin'})
+            )
+            sketches.append(sketch_df.assign(level=level, metric=metric))
+
+    return format_summary(buckets, sketches, freq, relative_accuracy)
+
+def format_summary(buckets: list, sketches: list, freq: str, relative_accuracy: float) -> dict:
+    buckets_df = pd.DataFrame(columns=['level', 'key', 'bucket', 'count', 'lost'])
+    if buckets:
+        buckets_df = pd.concat(buckets, ignore_index=True)[buckets_df.columns]
+    sketches_df = pd.DataFrame(columns=['level', 'key', 'bucket', 'metric', 'bin', 'count'])
+    if sketches:
+        sketches_df = pd.concat(sketches, ignore_index=True)[sketches_df.columns]
+    return {
+        'freq': freq,
+        'relative_accuracy': relative_accuracy,
+        'buckets': buckets_df.astype({'level': 'category', 'count': 'int64', 'lost': 'int64'}),
+        'sketches': sketches_df.astype({
+            'level': 'category', 'metric': 'category', 'bin': 'int32', 'count': 'int64',
+        }),
+    }
+
+def downsample_latency_summary(summary: dict, freq: str) -> dict:
+    """
+    Coarsens the time buckets of a summary to `freq`, which must be a
+    multiple of its current frequency.
+    """
+    buckets_df = summary['buckets'].assign(bucket=summary['buckets']['bucket'].dt.floor(freq))
+    sketches_df = summary['sketches'].assign(bucket=summary['sketches']['bucket'].dt.floor(freq))
+    return format_summary(
+        [buckets_df.groupby(['level', 'key', 'bucket'], as_index=False, observed=True)[['count', 'lost']].sum()],
+        [sketches_df.groupby(['level', 'key', 'bucket', 'metric', 'bin'], as_index=False, observed=True)['count'].sum()],
+        freq, summary['relative_accuracy'],
+    )
+
+def merge_latency_summaries(summaries: list) -> dict:
+    """
+    Merges summaries built with the same `relative_accuracy`, e.g. of
+    several days, into one at the coarsest of their frequencies.
+    """
+    if len({s['relative_accuracy'] for s in summaries}) > 1:
+        raise ValueError("summaries must have the same 'relative_accuracy'")
+    freq = max((s['freq'] for s in summaries), key=pd.tseries.frequencies.to_offset)
+    merged = {
+        'freq': freq,
+        'relative_accuracy': summaries[0]['relative_accuracy'],
+        'buckets': pd.concat([s['buckets'] for s in summaries], ignore_index=True),
+        'sketches': pd.concat([s['sketches'] for s in summaries], ignore_index=True),
+    }
+    return downsample_latency_summary(merged, freq)
+
+def is_summary_stale(latency_file: str, summary_file: str) -> bool:
+    return (
+        not os.path.exists(summary_file)
+        or os.path.getmtime(summary_file) < os.path.getmtime(latency_file)
+    )
+
+def build_latency_summary(
+        latency_file: str,
+        summary_file: str,
+        freq: str = DEFAULT_FREQ,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        chunksize: int = 1000000,
+        force: bool = False,
+) -> dict:
+    """
+    Summarizes a joined measurement file `chunksize` rows at a time and
+    writes the summary to `summary_file`. Reads the existing summary if it is
+    newer than `latency_file`, unless `force` is set.
+    """
+    if not force and not is_summary_stale(latency_file, summary_file):
+        return pd.read_pickle(summary_file)
+
+    print(f"building latency summary: {summary_file}")
+    summaries = [
+        summarize_latency(chunk, freq=freq, relative_accuracy=relative_accuracy)
+        for chunk in pd.read_csv(latency_file, chunksize=chunksize)
+    ]
+    summary = merge_latency_summaries(summaries) if summaries else summarize_latency(
+        pd.DataFrame(columns=['start_time', 'rtt_endpoint', 'rtt_seclast']),
+        freq=freq, relative_accuracy=relative_accuracy,
+    )
+    pd.to_pickle(summary, summary_file)
+    return summary
+
+def get_latency_quantiles(
+        summary: dict,
+        level: str = 'dst',
+        metric: str = 'sat_rtt',
+        quantiles: list = [0.5, 0.9, 0.99],
+        keys: list = None,
+        freq: str = None,
+) -> pd.DataFrame:
+    """
+    Returns the probe counts, loss rate and quantiles of `metric` per key of
+    `level` and time bucket.
+
+    :param summary: summary from `summarize_latency` or `build_latency_summary`
+    :param level: (optional) 'dst', 'sec_last_ip' or 'dns_trunc'
+    :param metric: (optional) 'sat_rtt' or 'rtt_endpoint'
+    :param quantiles: (optional) quantiles to return, as columns 'q<quantile>'
+    :param keys: (optional) keys of `level` to return, default all
+    :param freq: (optional) coarser time buckets to merge the summary into
+    :return: dataframe with 'key', 'bucket', 'count', 'lost', 'loss_rate'
+             and one column per quantile, NaN in buckets without values
+    """
+    if freq is not None:
+        summary = downsample_latency_summary(summary, freq)
+    buckets_df = summary['buckets']
+    buckets_df = buckets_df[buckets_df['level'] == level]
+    sketches_df = summary['sketches']
+    sketches_df = sketches_df[(sketches_df['level'] == level) & (sketches_df['metric'] == metric)]
+    if keys is not None:
+        buckets_df = buckets_df[buckets_df['key'].isin(keys)]
+        sketches_df = sketches_df[sketches_df['key'].isin(keys)]
+
+    df = buckets_df[['key', 'bucket', 'count', 'lost']].reset_index(drop=True)
+    df['loss_rate'] = df['lost'] / df['count']
+
+    sketches_df = sketches_df.sort_values(['key', 'bucket', 'bin'], kind='stable')
+    groups = sketches_df.groupby(['key', 'bucket'], sort=False)['count']
+    cumulative = groups.cumsum().to_numpy()
+    totals = groups.transform('sum').to_numpy()
+    values = get_bin_values(sketches_df['bin'].to_numpy(), summary['relative_accuracy'])
+    group_keys = sketches_df[['key', 'bucket']].reset_index(drop=True)
+    for q in quantiles:
+        # the value of rank q * (n - 1) is in the first bin whose cumulative
+        # count exceeds it
+        reached = cumulative > q * (totals - 1)
+        first = group_keys[reached].assign(value=values[reached]).drop_duplicates(['key', 'bucket'])
+        df = df.merge(first.rename(columns={'value': f'q{q}'}), how='left', on=['key', 'bucket'])
+
+    return df.sort_values(['key', 'bucket']).reset_index(drop=True)
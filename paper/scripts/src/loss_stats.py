@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+"""
+Loss counters per customer (dst) and per pre-sat hop (sec_last_ip) that are
+updated one seq window at a time, so long campaigns can be filtered and
+monitored without holding the whole run in memory.
+
+A probe is one (dst, seq) of the joined data from `import_and_clean_df`, and
+it is lost when the pre-sat hop did not answer either ('rtt_seclast' is NaN),
+the same data points as `get_total_loss_data_points`. Rows without a
+'sec_last_ip' count for the last pre-sat hop seen for their dst.
+"""
+
+LEVELS = ['dst', 'sec_last_ip']
+
+def get_loss_outliers(loss_rates: pd.Series) -> pd.Index:
+    """
+    Returns the keys whose loss rate is more than 2 standard deviations above
+    the mean, over the keys with any loss, the filter of `import_and_clean_df`.
+
+    :param loss_rates: loss rate indexed by key
+    """
+    loss_rates = loss_rates[loss_rates > 0]
+    threshold = loss_rates.mean() + 2 * loss_rates.std()
+    return loss_rates.index[loss_rates > threshold]
+
+class LossCounters:
+    """
+    Cumulative and rolling probe and loss counts per dst and per pre-sat hop.
+    Counts are kept in arrays indexed by a code per key, with the counts of the
+    last `windows` updates in a ring for the rolling rates.
+
+    :param windows: (optional) number of updates the rolling rates span
+    """
+    def __init__(self, windows: int = 60):
+        if windows < 1:
+            raise ValueError("'windows' must be at least 1")
+
+        self.windows = windows
+        self.updates = 0
+        self.last_seq = None
+        self.codes = {level: {} for level in LEVELS}
+        self.keys = {level: [] for level in LEVELS}
+        self.sent = {level: np.zeros(0, dtype='int64') for level in LEVELS}
+        self.lost = {level: np.zeros(0, dtype='int64') for level in LEVELS}
+        self.ring_sent = {level: np.zeros((windows, 0), dtype='int64') for level in LEVELS}
+        self.ring_lost = {level: np.zeros((windows, 0), dtype='int64') for level in LEVELS}
+        # dst code -> code of its last seen pre-sat hop, -1 if none yet
+        self.presat_of_dst = np.zeros(0, dtype='int64')
+
+    def get_codes(self, level: str, values: pd.Series) -> np.ndarray:
+        codes = self.codes[level]
+        for key in values.unique():
+            if key not in codes:
+                codes[key] = len(self.keys[level])
+                self.keys[level].append(key)
+
+        size = len(self.keys[level])
+        if size > len(self.sent[level]):
+            # grow by doubling, so adding keys stays amortized constant
+            capacity = max(size, 2 * len(self.sent[level]), 64)
+            pad = capacity - len(self.sent[level])
+            self.sent[level] = np.pad(self.sent[level], (0, pad))
+            self.lost[level] = np.pad(self.lost[level], (0, pad))
+            self.ring_sent[level] = np.pad(self.ring_sent[level], ((0, 0), (0, pad)))
+            self.ring_lost[level] = np.pad(self.ring_lost[level], ((0, 0), (0, pad)))
+            if level == 'dst':
+                self.presat_of_dst = np.pad(self.presat_of_dst, (0, pad), constant_values=-1)
+        return values.map(codes).to_numpy(dtype='int64')
+
+    def add_counts(self, level: str, slot: int, codes: np.ndarray, lost: np.ndarray):
+        capacity = len(self.sent[level])
+        sent_counts = np.bincount(codes, minlength=capacity)
+        lost_counts = np.bincount(codes, weights=lost, minlength=capacity).astype('int64')
+        self.sent[level] += sent_counts
+        self.lost[level] += lost_counts
+        self.ring_sent[level][slot] = sent_counts
+        self.ring_lost[level][slot] = lost_counts
+
+    def update(self, df: pd.DataFrame) -> int:
+        """
+        Adds one window of joined data. Windows are expected in seq order;
+        rows of seqs already counted by an earlier update are skipped, so the
+        tail of a growing output can be passed again.
+
+        :param df: rows with 'seq', 'dst', 'sec_last_ip' and 'rtt_seclast'
+        :return: number of probes counted
+        """
+        if self.last_seq is not None:
+            df = df[df['seq'] > self.last_seq]
+        df = df.drop_duplicates(subset=['dst', 'seq'])
+        slot = self.updates % self.windows
+        self.updates += 1
+        if len(df) == 0:
+            for level in LEVELS:
+                self.ring_sent[level][slot] = 0
+                self.ring_lost[level][slot] = 0
+            return 0
+        self.last_seq = df['seq'].max()
+        lost = df['rtt_seclast'].isna().to_numpy(dtype='int64')
+
+        dst_codes = self.get_codes('dst', df['dst'])
+        self.add_counts('dst', slot, dst_codes, lost)
+
+        has_presat = df['sec_last_ip'].notna().to_numpy()
+        if has_presat.any():
+            presat_codes = self.get_codes('sec_last_ip', df['sec_last_ip'][has_presat])
+            # the last assignment of each dst wins, so keep the rows in seq order
+            order = np.argsort(df['seq'].to_numpy()[has_presat], kind='stable')
+            self.presat_of_dst[dst_codes[has_presat][order]] = presat_codes[order]
+        presat_codes = self.presat_of_dst[dst_codes]
+        known = presat_codes >= 0
+        self.add_counts('sec_last_ip', slot, presat_codes[known], lost[known])
+        return len(df)
+
+    def get_rates(self, level: str, sent: np.ndarray, lost: np.ndarray) -> pd.DataFrame:
+        size = len(self.keys[level])
+        sent, lost = sent[:size], lost[:size]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            loss_rate = np.where(sent > 0, lost / sent, np.nan)
+        return pd.DataFrame({
+            'sent': sent,
+            'lost': lost,
+            'loss_rate': loss_rate,
+        }, index=pd.Index(self.keys[level], name=level))
+
+    def cumulative_loss(self, level: str = 'dst') -> pd.DataFrame:
+        """
+        :param level: 'dst' or 'sec_last_ip'
+        :return: dataframe indexed by `level` with the 'sent' and 'lost'
+                 probes and the 'loss_rate' since the first update
+        """
+        return self.get_rates(level, self.sent[level], self.lost[level])
+
+    def rolling_loss(self, level: str = 'dst') -> pd.DataFrame:
+        """
+        Like `cumulative_loss`, over the last `windows` updates. Keys not
+        probed in those updates have a NaN 'loss_rate'.
+        """
+        return self.get_rates(
+            level, self.ring_sent[level].sum(axis=0), self.ring_lost[level].sum(axis=0),
+        )
+
+    def outliers(self, level: str = 'dst', rolling: bool = False) -> pd.Index:
+        """
+        Returns the keys of `level` filtered out by `get_loss_outliers`.
+        """
+        df = self.rolling_loss(level) if rolling else self.cumulative_loss(level)
+        return get_loss_outliers(df['loss_rate'].dropna())
@@ -0,0 +1,180 @@
+import functools
+import os
+import numpy as np
+import pandas as pd
+
+"""
+Persistent index over joined measurements (the 'latency.csv' written by
+`import_and_clean_df`) so single customers, pre-satellite hops, PoPs or
+seq/time windows can be read without reloading the whole dataset.
+
+Layout of an index directory:
+- blocks.csv: one row per block with its row count and min/max stats
+- keys.csv: the (dst, sec_last_ip, dns_trunc) combinations in the data
+- block_#####.pkl: measurements sorted by (dst, seq), `block_size` rows each
+"""
+
+DEFAULT_BLOCK_SIZE = 50000
+
+BLOCKS_FILE = "blocks.csv"
+KEYS_FILE = "keys.csv"
+
+def get_block_file(index_dir: str, block: int) -> str:
+    return f"{index_dir}/block_{block:05d}.pkl"
+
+def is_index_stale(latency_file: str, index_dir: str) -> bool:
+    blocks_file = f"{index_dir}/{BLOCKS_FILE}"
+    return (
+        not os.path.exists(blocks_file)
+        or os.path.getmtime(blocks_file) < os.path.getmtime(latency_file)
+    )
+
+def build_measurement_index(
+        latency_file: str,
+        index_dir: str,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        force: bool = False,
+) -> str:
+    """
+    Builds a block index over a joined measurement file. Does nothing if the
+    index is newer than `latency_file`, unless `force` is set.
+
+    :param latency_file: joined measurements, as written by `import_and_clean_df`
+    :param index_dir: directory to write the index to
+    :param block_size: (optional) number of rows per block
+    :param force: (optional) rebuild even if the index is up to date
+    :return: index_dir
+    """
+    if not force and not is_index_stale(latency_file, index_dir):
+        return index_dir
+
+    print(f"building measurement index: {index_dir}")
+    os.makedirs(index_dir, exist_ok=True)
+    df = pd.read_csv(latency_file)
+    df = df.sort_values(['dst', 'seq'], kind='stable').reset_index(drop=True)
+
+    key_cols = [c for c in ['dst', 'sec_last_ip', 'dns_trunc'] if c in df.columns]
+    df[key_cols].drop_duplicates().to_csv(f"{index_dir}/{KEYS_FILE}", index=False)
+
+    blocks = []
+    for block, start in enumerate(range(0, len(df), block_size)):
+        block_df = df.iloc[start:start + block_size]
+        block_df.to_pickle(get_block_file(index_dir, block))
+        blocks.append({
+            'block': block,
+            'rows': len(block_df),
+            'min_dst': block_df['dst'].iloc[0],
+            'max_dst': block_df['dst'].iloc[-1],
+            'min_seq': block_df['seq'].min(),
+            'max_seq': block_df['seq'].max(),
+            'min_start_time': block_df['start_time'].min(),
+            'max_start_time': block_df['start_time'].max(),
+        })
+
+    # written last, so a partially built index is treated as stale
+    blocks_df = pd.DataFrame(blocks, columns=[
+        'block', 'rows', 'min_dst', 'max_dst', 'min_seq', 'max_seq',
+        'min_start_time', 'max_start_time',
+    ])
+    blocks_df.to_csv(f"{index_dir}/{BLOCKS_FILE}", index=False)
+
+    return index_dir
+
+@functools.lru_cache(maxsize=32)
+def _read_index_table(table_file: str, mtime: float) -> pd.DataFrame:
+    return pd.read_csv(table_file)
+
+def read_index_table(index_dir: str, table: str) -> pd.DataFrame:
+    table_file = f"{index_dir}/{table}"
+    return _read_index_table(table_file, os.path.getmtime(table_file))
+
+@functools.lru_cache(maxsize=64)
+def _read_block(block_file: str, mtime: float) -> pd.DataFrame:
+    return pd.read_pickle(block_file)
+
+def read_block(index_dir: str, block: int) -> pd.DataFrame:
+    block_file = get_block_file(index_dir, block)
+    return _read_block(block_file, os.path.getmtime(block_file))
+
+def as_list(value) -> list:
+    if value is None or isinstance(value, list):
+        return value
+    if isinstance(value, (tuple, set)):
+        return list(value)
+    return [value]
+
+def query_measurements(
+        index_dir: str,
+        dst=None,
+        sec_last_ip=None,
+        pop=None,
+        seq_range: tuple = None,
+        time_range: tuple = None,
+) -> pd.DataFrame:
+    """
+    Returns the measurements matching every given filter, reading only the
+    blocks whose min/max stats can contain matches.
+
+    :param index_dir: directory built by `build_measurement_index`
+    :param dst: (optional) endpoint IP or list of endpoint IPs
+    :param sec_last_ip: (optional) pre-satellite hop IP or list of IPs
+    :param pop: (optional) PoP ('dns_trunc') or list of PoPs
+    :param seq_range: (optional) inclusive (first seq, last seq)
+    :param time_range: (optional) inclusive (first, last) 'start_time' strings,
+                       formatted like the data ('YYYY-MM-DD HH:MM:SS')
+    :return: dataframe of matching measurements sorted by (dst, seq)
+    """
+    blocks_df = read_index_table(index_dir, BLOCKS_FILE)
+
+    # resolve pre-sat hop and PoP filters to the endpoints behind them
+    dsts = as_list(dst)
+    for col, values in [('sec_last_ip', as_list(sec_last_ip)), ('dns_trunc', as_list(pop))]:
+        if values is None:
+            continue
+        keys_df = read_index_table(index_dir, KEYS_FILE)
+        matching = set(keys_df.loc[keys_df[col].isin(values), 'dst'])
+        dsts = list(matching) if dsts is None else [d for d in dsts if d in matching]
+
+    candidates = np.ones(len(blocks_df), dtype=bool)
+    if dsts is not None:
+        # blocks are sorted by dst, so each dst spans a contiguous block range
+        dst_values = np.sort(np.array(dsts, dtype=object))
+        first = np.searchsorted(blocks_df['max_dst'].to_numpy(dtype=object), dst_values, side='left')
+        last = np.searchsorted(blocks_df['min_dst'].to_numpy(dtype=object), dst_values, side='right')
+        dst_mask = np.zeros(len(blocks_df) + 1, dtype='int64')
+        np.add.at(dst_mask, first, 1)
+        np.add.at(dst_mask, np.maximum(first, last), -1)
+        candidates &= np.cumsum(dst_mask)[:-1] > 0
+    if seq_range is not None:
+        candidates &= (
+            (blocks_df['max_seq'] >= seq_range[0])
+            & (blocks_df['min_seq'] <= seq_range[1])
+        ).to_numpy()
+    if time_range is not None:
+        candidates &= (
+            (blocks_df['max_start_time'] >= time_range[0])
+            & (blocks_df['min_start_time'] <= time_range[1])
+        ).to_numpy()
+
+    dfs = []
+    for block in blocks_df.loc[candidates, 'block']:
+        df = read_block(index_dir, block)
+        mask = pd.Series(True, index=df.index)
+        if dsts is not None:
+            mask &= df['dst'].isin(dsts)
+        if sec_last_ip is not None:
+            mask &= df['sec_last_ip'].isin(as_list(sec_last_ip))
+        if pop is not None:
+            mask &= df['dns_trunc'].isin(as_list(pop))
+        if seq_range is not None:
+            mask &= df['seq'].between(seq_range[0], seq_range[1])
+        if time_range is not None:
+            mask &= df['start_time'].between(time_range[0], time_range[1])
+        dfs.append(df[mask])
+
+    if len(dfs) == 0:
+        if len(blocks_df) == 0:
+            return pd.DataFrame()
+        return read_block(index_dir, 0).iloc[0:0]
+
+    return pd.concat(dfs, ignore_index=True)
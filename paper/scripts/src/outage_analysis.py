@@ -1,5 +1,10 @@
+import json
+import numpy as np
 import pandas as pd
 
+# groupings outages are correlated over, from the narrowest to the widest
+CORRELATION_LEVELS = ['sec_last_ip', 'dns_trunc', 'region', 'country']
+
 def group_consecutive(seq_list):
     groups = []
     group = [seq_list[0]]
@@ -25,3 +30,270 @@ def get_consecutive_df(df):
             })
 
     return pd.DataFrame(result)
+
+def get_seqs_bounds(seqs) -> tuple:
+    """
+    Returns the first and last seq of an outage's 'seqs', either a list or
+    its string form once read back from a csv.
+    """
+    if isinstance(seqs, str):
+        seqs = json.loads(seqs)
+    return seqs[0], seqs[-1]
+
+def get_outage_intervals(consec_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param consec_df: outages formatted like the output of `get_consecutive_df`
+    :return: dataframe with the 'dst', inclusive 'start_seq' and 'end_seq',
+             and 'len' of every outage
+    """
+    bounds = np.array([get_seqs_bounds(seqs) for seqs in consec_df['seqs']], dtype='int64').reshape(-1, 2)
+    return pd.DataFrame({
+        'dst': consec_df['dst'].to_numpy(),
+        'start_seq': bounds[:, 0],
+        'end_seq': bounds[:, 1],
+        'len': consec_df['len'].to_numpy(),
+    })
+
+def get_outage_segments(outages_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Finds the runs of consecutive outage seqs of every dst in one sorted
+    pass, like `get_consecutive_df` followed by `get_outage_intervals`.
+
+    :param outages_df: outage data points with 'dst' and 'seq', see
+                       `get_outage_data_points`
+    :return: dataframe with the 'dst', inclusive 'start_seq' and 'end_seq',
+             and 'len' of every outage
+    """
+    df = outages_df[['dst', 'seq']].drop_duplicates().sort_values(['dst', 'seq'])
+    if df.empty:
+        # a campaign without outages
+        return pd.DataFrame({
+            'dst': pd.Series(dtype='object'),
+            'start_seq': pd.Series(dtype='int64'),
+            'end_seq': pd.Series(dtype='int64'),
+            'len': pd.Series(dtype='int64'),
+        })
+    dsts = df['dst'].to_numpy()
+    seqs = df['seq'].to_numpy(dtype='int64')
+    starts = np.ones(len(df), dtype=bool)
+    starts[1:] = (dsts[1:] != dsts[:-1]) | (seqs[1:] != seqs[:-1] + 1)
+    start_idx = np.flatnonzero(starts)
+    end_idx = np.append(start_idx[1:], len(df)) - 1
+    return pd.DataFrame({
+        'dst': dsts[start_idx],
+        'start_seq': seqs[start_idx],
+        'end_seq': seqs[end_idx],
+        'len': end_idx - start_idx + 1,
+    })
+
+def sweep_correlated_outages(
+        intervals: pd.DataFrame,
+        level: str,
+        min_customers: int,
+) -> pd.DataFrame:
+    """
+    Sweeps the outage intervals of every group of `level` at once, finding
+    the seq ranges during which at least `min_customers` customers of a group
+    are out at the same time.
+    """
+    df = intervals.dropna(subset=[level])
+    codes, groups = pd.factorize(df[level])
+    # each outage adds one customer at its start and removes it after its end
+    points = pd.DataFrame({
+        'code': np.concatenate([codes, codes]),
+        'seq': np.concatenate([df['start_seq'].to_numpy(), df['end_seq'].to_numpy() + 1]),
+        'delta': np.concatenate([np.ones(len(df), dtype='int64'), -np.ones(len(df), dtype='int64')]),
+    })
+    points = points.groupby(['code', 'seq'], sort=True)['delta'].sum().reset_index()
+    active = points.groupby('code')['delta'].cumsum().to_numpy()
+
+    above = active >= min_customers
+    prev_above = np.zeros(len(points), dtype=bool)
+    same_group = points['code'].to_numpy()[1:] == points['code'].to_numpy()[:-1]
+    prev_above[1:] = above[:-1] & same_group
+    # every group ends with no active outages, so each event start has an end
+    event_starts = np.flatnonzero(above & ~prev_above)
+    event_ends = np.flatnonzero(~above & prev_above)
+
+    event_codes = points['code'].to_numpy()[event_starts]
+    start_seqs = points['seq'].to_numpy()[event_starts]
+    end_seqs = points['seq'].to_numpy()[event_ends] - 1
+    if len(event_starts) > 0:
+        bounds = np.column_stack([event_starts, event_ends]).ravel()
+        peaks = np.maximum.reduceat(active, bounds)[::2]
+    else:
+        peaks = np.zeros(0, dtype='int64')
+
+    # events of a group are disjoint and sorted, so the events an outage
+    # overlaps are a contiguous range, found on (group, seq) keys
+    stride = int(points['seq'].max()) + 2 if len(points) > 0 else 1
+    event_start_keys = event_codes * stride + start_seqs
+    event_end_keys = event_codes * stride + end_seqs
+    first = np.searchsorted(event_end_keys, codes * stride + df['start_seq'].to_numpy(), side='left')
+    last = np.searchsorted(event_start_keys, codes * stride + df['end_seq'].to_numpy(), side='right')
+    counts = np.maximum(last - first, 0)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    members = pd.DataFrame({
+        'event': np.repeat(first, counts) + offsets,
+        'dst': np.repeat(df['dst'].to_numpy(), counts),
+    })
+    dsts = members.groupby('event')['dst'].agg(lambda x: sorted(set(x)))
+
+    events = pd.DataFrame({
+        'level': level,
+        'group': groups[event_codes] if len(event_codes) > 0 else [],
+        'start_seq': start_seqs,
+        'end_seq': end_seqs,
+        'duration': end_seqs - start_seqs + 1,
+        'peak_customers': peaks,
+    })
+    events['dsts'] = dsts.reindex(range(len(events))).to_numpy()
+    events['customers'] = events['dsts'].map(len)
+    return events[[
+        'level', 'group', 'start_seq', 'end_seq', 'duration',
+        'peak_customers', 'customers', 'dsts',
+    ]]
+
+def find_correlated_outages(
+        outage_df: pd.DataFrame,
+        location_df: pd.DataFrame,
+        levels: list = CORRELATION_LEVELS,
+        min_customers: int = 2,
+) -> pd.DataFrame:
+    """
+    Finds every correlated outage event in a dataset: a seq range during which
+    at least `min_customers` customers behind the same pre-sat hop, PoP,
+    region or country are out at once.
+
+    :param outage_df: outages formatted like the output of `get_consecutive_df`
+    :param location_df: 'dst' to `levels` mapping, e.g. the 'dst_locations.csv'
+                        written by outage_countries.py
+    :param levels: (optional) columns of `location_df` to group customers by
+    :param min_customers: (optional) concurrent outages that make an event
+    :return: dataframe with one row per event: the 'level' and 'group', the
+             inclusive 'start_seq' and 'end_seq', 'duration', 'peak_customers'
+             out at once, and the 'customers' and 'dsts' with an outage
+             overlapping the event
+    """
+    intervals = get_outage_intervals(outage_df).merge(
+        location_df.groupby('dst', as_index=False).first(),
+        how='left',
+        on='dst',
+    )
+    events = [
+        sweep_correlated_outages(intervals, level, min_customers)
+        for level in levels
+        if level in intervals.columns
+    ]
+    return pd.concat(events, ignore_index=True)
+
+def get_detection_masks(outage_dfs: list) -> pd.DataFrame:
+    """
+    Returns every (dst, seq) detected as an outage by any of several
+    methodologies, with a bitmask of the methodologies that detected it.
+
+    :param outage_dfs: outage data points per methodology, each with 'dst' and
+                       'seq', e.g. from `get_outage_data_points`
+    :return: dataframe with 'dst', 'seq' and 'mask', bit i set when
+             outage_dfs[i] has the (dst, seq), sorted by (dst, seq)
+    """
+    if len(outage_dfs) > 62:
+        raise ValueError("at most 62 methodologies can be compared")
+    df = pd.concat([
+        df[['dst', 'seq']].assign(mask=np.int64(1) << i)
+        for i, df in enumerate(outage_dfs)
+    ], ignore_index=True)
+    if len(df) == 0:
+        return pd.DataFrame({'dst': [], 'seq': [], 'mask': []}).astype({'seq': 'int64', 'mask': 'int64'})
+
+    dst_codes, dsts = pd.factorize(df['dst'], sort=True)
+    seqs = df['seq'].to_numpy(dtype='int64')
+    min_seq = seqs.min()
+    stride = seqs.max() - min_seq + 1
+    keys = dst_codes.astype('int64') * stride + (seqs - min_seq)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    masks = np.bitwise_or.reduceat(df['mask'].to_numpy()[order], starts)
+    return pd.DataFrame({
+        'dst': np.asarray(dsts)[keys[starts] // stride],
+        'seq': keys[starts] % stride + min_seq,
+        'mask': masks,
+    })
+
+def get_detection_bits(masks_df: pd.DataFrame, num_methods: int) -> np.ndarray:
+    # (rows, methods) booleans of the methodologies detecting each row
+    return (masks_df['mask'].to_numpy()[:, None] >> np.arange(num_methods)) & 1 == 1
+
+def compare_methodologies(
+        outage_dfs: list,
+        labels: list,
+        min_len: int = 1,
+) -> dict:
+    """
+    Compares the outages detected by several methodologies over all dsts,
+    taking the union of their detections as the reference.
+
+    :param outage_dfs: outage data points per methodology, see `get_detection_masks`
+    :param labels: name of each methodology
+    :param min_len: (optional) minimum length, in seqs, of the union outages
+                    whose boundaries are compared
+    :return: dict of dataframes:
+             - 'masks': output of `get_detection_masks`
+             - 'agreement': per seq, the dsts detected by each methodology,
+               by any ('union'), by all ('all') and by exactly k of them
+               ('agree_<k>')
+             - 'recall': per methodology, its detections and their share of the union
+             - 'dst_recall': the same per dst, one column per methodology
+             - 'boundaries': per union outage ('dst', 'start_seq', 'end_seq',
+               'len'), the first and last seq each methodology detected in it
+               and their offsets from the union's, NaN if it detected none
+    """
+    masks_df = get_detection_masks(outage_dfs)
+    bits = get_detection_bits(masks_df, len(labels))
+    bits_df = pd.DataFrame(bits, columns=labels)
+    num_detected = bits.sum(axis=1)
+
+    agreement_df = bits_df.assign(seq=masks_df['seq']).groupby('seq')[labels].sum()
+    agreement_df['union'] = masks_df.groupby('seq').size()
+    agreement_df['all'] = pd.Series(num_detected == len(labels)).groupby(masks_df['seq']).sum()
+    agree_df = pd.crosstab(masks_df['seq'], num_detected).reindex(
+        columns=range(1, len(labels) + 1), fill_value=0,
+    )
+    agree_df.columns = [f'agree_{k}' for k in agree_df.columns]
+    agreement_df = agreement_df.join(agree_df).reset_index()
+
+    recall_df = pd.DataFrame({
+        'methodology': labels,
+        'detected': bits.sum(axis=0),
+        'union': len(masks_df),
+    })
+    recall_df['recall'] = recall_df['detected'] / recall_df['union']
+    dst_recall_df = bits_df.groupby(masks_df['dst']).mean().reset_index()
+
+    # union outages are runs of consecutive seqs of one dst
+    dsts = masks_df['dst'].to_numpy()
+    seqs = masks_df['seq'].to_numpy()
+    new_outage = np.r_[True, (dsts[1:] != dsts[:-1]) | (seqs[1:] != seqs[:-1] + 1)]
+    outage_ids = np.cumsum(new_outage) - 1
+    boundaries_df = (
+        masks_df.assign(outage=outage_ids)
+        .groupby('outage')
+        .agg(dst=('dst', 'first'), start_seq=('seq', 'min'), end_seq=('seq', 'max'), len=('seq', 'size'))
+    )
+    for i, label in enumerate(labels):
+        detected = masks_df[bits[:, i]].assign(outage=outage_ids[bits[:, i]])
+        bounds = detected.groupby('outage')['seq'].agg(['min', 'max'])
+        boundaries_df[f'{label}_start_seq'] = bounds['min']
+        boundaries_df[f'{label}_end_seq'] = bounds['max']
+        boundaries_df[f'{label}_start_delta'] = boundaries_df[f'{label}_start_seq'] - boundaries_df['start_seq']
+        boundaries_df[f'{label}_end_delta'] = boundaries_df['end_seq'] - boundaries_df[f'{label}_end_seq']
+    boundaries_df = boundaries_df[boundaries_df['len'] >= min_len].reset_index(drop=True)
+
+    return {
+        'masks': masks_df,
+        'agreement': agreement_df,
+        'recall': recall_df,
+        'dst_recall': dst_recall_df,
+        'boundaries': boundaries_df,
+    }
@@ -0,0 +1,170 @@
+import functools
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from .outage_analysis import get_outage_intervals
+
+"""
+Persistent interval index over outage segments (the 'consecutive_outages.csv'
+written by the outage scripts), so the customers down during a seq window or
+the outages overlapping a given one can be found without scanning every
+segment. Seqs restart every measurement day, so times are (day, seq).
+
+Layout of an index directory:
+- days.csv: one row per indexed day with its source file, the source's
+  mtime in integer nanoseconds, and its seq range
+- day_<day>.pkl: that day's segments sorted by start_seq, with the running
+  maximum of end_seq, and their order by (dst, start_seq)
+
+Days are added one at a time with `add_outages`, so adding a day never
+rewrites the others.
+"""
+
+DAYS_FILE = "days.csv"
+
+def get_day_file(index_dir: str, day: str) -> str:
+    return f"{index_dir}/day_{re.sub(r'[^A-Za-z0-9_.-]', '_', day)}.pkl"
+
+@functools.lru_cache(maxsize=8)
+def _read_days(days_file: str, mtime: float) -> pd.DataFrame:
+    # mtimes are read as text, a float column would round the nanoseconds
+    return pd.read_csv(days_file, dtype={'day': str, 'source_mtime': str})
+
+def read_days(index_dir: str) -> pd.DataFrame:
+    days_file = f"{index_dir}/{DAYS_FILE}"
+    if not os.path.exists(days_file):
+        return pd.DataFrame(columns=['day', 'source_file', 'source_mtime', 'segments', 'min_seq', 'max_seq'])
+    return _read_days(days_file, os.path.getmtime(days_file))
+
+@functools.lru_cache(maxsize=32)
+def _read_day(day_file: str, mtime: float) -> dict:
+    return pd.read_pickle(day_file)
+
+def read_day(index_dir: str, day: str) -> dict:
+    day_file = get_day_file(index_dir, day)
+    return _read_day(day_file, os.path.getmtime(day_file))
+
+def add_outages(
+        index_dir: str,
+        consec_df: pd.DataFrame,
+        day: str,
+        source_file: str = None,
+) -> str:
+    """
+    Adds, or replaces, the outage segments of one day.
+
+    :param index_dir: directory of the index, created if needed
+    :param consec_df: outages formatted like the output of `get_consecutive_df`
+    :param day: label of the measurement day, e.g. 'May 27'
+    :param source_file: (optional) file `consec_df` was read from, so
+                        `is_day_stale` can tell when it changes
+    :return: index_dir
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    segments = get_outage_intervals(consec_df)
+    segments = segments.sort_values(['start_seq', 'end_seq'], kind='stable').reset_index(drop=True)
+    # the running maximum of end_seq is sorted, so the first segment that can
+    # reach a seq is found by binary search
+    segments['max_end_seq'] = np.maximum.accumulate(segments['end_seq'].to_numpy()) if len(segments) > 0 else []
+    by_dst = np.lexsort((segments['start_seq'].to_numpy(), segments['dst'].to_numpy().astype(str)))
+    pd.to_pickle({
+        'segments': segments,
+        'by_dst': by_dst,
+        'dsts': segments['dst'].to_numpy().astype(str)[by_dst],
+    }, get_day_file(index_dir, day))
+
+    days_df = read_days(index_dir)
+    days_df = days_df[days_df['day'] != day]
+    days_df = pd.concat([days_df, pd.DataFrame([{
+        'day': day,
+        'source_file': source_file,
+        'source_mtime': str(os.stat(source_file).st_mtime_ns) if source_file else None,
+        'segments': len(segments),
+        'min_seq': segments['start_seq'].min() if len(segments) > 0 else None,
+        'max_seq': segments['end_seq'].max() if len(segments) > 0 else None,
+    }])], ignore_index=True)
+    # written last, so a day whose segments were not written is not listed
+    days_df.to_csv(f"{index_dir}/{DAYS_FILE}", index=False)
+    return index_dir
+
+def is_day_stale(index_dir: str, day: str, source_file: str) -> bool:
+    days_df = read_days(index_dir)
+    days_df = days_df[days_df['day'] == day]
+    return (
+        len(days_df) == 0
+        or not os.path.exists(get_day_file(index_dir, day))
+        or days_df['source_mtime'].iloc[0] != str(os.stat(source_file).st_mtime_ns)
+    )
+
+def query_outages(
+        index_dir: str,
+        seq_range: tuple = None,
+        dst=None,
+        days: list = None,
+) -> pd.DataFrame:
+    """
+    Returns the outage segments overlapping `seq_range` and belonging to
+    `dst`, for every given filter.
+
+    :param index_dir: directory built by `add_outages`
+    :param seq_range: (optional) inclusive (first seq, last seq); use
+                      (seq, seq) for the outages ongoing at one seq
+    :param dst: (optional) endpoint IP or list of endpoint IPs
+    :param days: (optional) days to search, default every indexed day
+    :return: dataframe with the 'day', 'dst', 'start_seq', 'end_seq' and
+             'len' of the matching segments, sorted by (day, start_seq)
+    """
+    days_df = read_days(index_dir)
+    if days is not None:
+        days_df = days_df[days_df['day'].isin(days)]
+    if seq_range is not None:
+        days_df = days_df[
+            (days_df['max_seq'] >= seq_range[0]) & (days_df['min_seq'] <= seq_range[1])
+        ]
+    if dst is not None and not isinstance(dst, (list, tuple, set)):
+        dst = [dst]
+
+    dfs = []
+    for day in days_df['day']:
+        index = read_day(index_dir, day)
+        segments = index['segments']
+        if dst is not None:
+            dst_values = np.unique(np.array(list(dst), dtype=str))
+            first = np.searchsorted(index['dsts'], dst_values, side='left')
+            last = np.searchsorted(index['dsts'], dst_values, side='right')
+            positions = np.sort(np.concatenate([
+                index['by_dst'][f:l] for f, l in zip(first, last)
+            ] + [np.zeros(0, dtype='int64')]))
+        else:
+            positions = None
+
+        if seq_range is not None:
+            # segments from `first` on can reach seq_range[0], and those
+            # before `last` start no later than seq_range[1]
+            first = np.searchsorted(segments['max_end_seq'].to_numpy(), seq_range[0], side='left')
+            last = np.searchsorted(segments['start_seq'].to_numpy(), seq_range[1], side='right')
+            candidates = np.arange(first, last)
+            if positions is not None:
+                candidates = positions[(positions >= first) & (positions < last)]
+            df = segments.iloc[candidates]
+            df = df[df['end_seq'] >= seq_range[0]]
+        elif positions is not None:
+            df = segments.iloc[positions]
+        else:
+            df = segments
+        dfs.append(df.drop(columns=['max_end_seq']).assign(day=day))
+
+    columns = ['day', 'dst', 'start_seq', 'end_seq', 'len']
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(dfs, ignore_index=True)[columns]
+
+def query_overlapping_outages(index_dir: str, day: str, dst: str, start_seq: int, end_seq: int) -> pd.DataFrame:
+    """
+    Returns the outages of other customers on `day` overlapping the outage
+    of `dst` from `start_seq` to `end_seq`.
+    """
+    df = query_outages(index_dir, seq_range=(start_seq, end_seq), days=[day])
+    return df[df['dst'] != dst].reset_index(drop=True)
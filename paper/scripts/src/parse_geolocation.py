@@ -1,19 +1,124 @@
-import ast
+import functools
 import ipaddress
+import os
+import numpy as np
 import pandas as pd
 
 from .config import PATH
 
-# import starlink geoip data
-starlink_geoip_df = pd.read_csv(
-    # "https://geoip.starlinkisp.net/",
-    f"{PATH}/data/geoip.starlinkisp.net.txt",
-    names=['subnet', 'country', 'region', 'city'],
-    usecols=list(range(4)),
-    index_col=None,
-)
+# "https://geoip.starlinkisp.net/"
+STARLINK_GEOIP_FILE = f"{PATH}/data/geoip.starlinkisp.net.txt"
 
-def summarize_starlink_geoip(geoip_df: pd.DataFrame = starlink_geoip_df):
+# prefixes checked when mapping an IP to its Starlink GeoIP subnet
+GEOIP_MIN_PREFIX = 24
+GEOIP_MAX_PREFIX = 31
+
+# one entry per IPv4 subnet, sorted by (prefixlen, network)
+GEOIP_INDEX_DTYPE = np.dtype([
+    ('prefixlen', 'u1'),
+    ('network', 'u4'),
+    ('row', 'u4'),
+])
+
+@functools.lru_cache(maxsize=None)
+def get_starlink_geoip_df(geoip_file: str = STARLINK_GEOIP_FILE) -> pd.DataFrame:
+    """
+    Loads the Starlink GeoIP data on first use (instead of at import time).
+    """
+    return pd.read_csv(
+        geoip_file,
+        names=['subnet', 'country', 'region', 'city'],
+        usecols=list(range(4)),
+        index_col=None,
+    )
+
+def get_geoip_index_file(geoip_file: str) -> str:
+    return f"{geoip_file}.idx.npy"
+
+def ipv4_parts_to_int(parts: np.ndarray) -> np.ndarray:
+    """
+    Converts an (n, 4) array of IPv4 octets to integers.
+    """
+    return (parts[:, 0] << 24) | (parts[:, 1] << 16) | (parts[:, 2] << 8) | parts[:, 3]
+
+def build_geoip_index(geoip_file: str, index_file: str) -> np.ndarray:
+    """
+    Compiles the IPv4 subnets of the Starlink GeoIP data into a sorted array of
+    integer networks, saved as a .npy file so it can be memory-mapped.
+
+    :param geoip_file: Starlink GeoIP file
+    :param index_file: .npy file to write the index to
+    :return: the index, one GEOIP_INDEX_DTYPE entry per IPv4 subnet
+    """
+    subnets = get_starlink_geoip_df(geoip_file)['subnet']
+    subnets = subnets[~subnets.str.contains(':')]
+    parts = subnets.str.split(r'[./]', expand=True).astype('int64').to_numpy()
+
+    index = np.empty(len(subnets), dtype=GEOIP_INDEX_DTYPE)
+    index['prefixlen'] = parts[:, 4]
+    index['network'] = ipv4_parts_to_int(parts[:, :4])
+    index['row'] = subnets.index.to_numpy()
+    index.sort(order=['prefixlen', 'network'])
+
+    # write then rename so readers never map a partially written index
+    tmp_file = f"{index_file}.tmp.npy"
+    np.save(tmp_file, index)
+    os.replace(tmp_file, index_file)
+    return index
+
+@functools.lru_cache(maxsize=None)
+def load_geoip_index(geoip_file: str = STARLINK_GEOIP_FILE) -> np.ndarray:
+    """
+    Memory-maps the compiled GeoIP index, rebuilding it first if it is missing
+    or older than `geoip_file`.
+    """
+    index_file = get_geoip_index_file(geoip_file)
+    if (
+        not os.path.exists(index_file)
+        or os.path.getmtime(index_file) < os.path.getmtime(geoip_file)
+    ):
+        print(f"building geoip index: {index_file}")
+        build_geoip_index(geoip_file, index_file)
+    return np.load(index_file, mmap_mode='r')
+
+def get_geoip_rows(
+        ips: pd.Series,
+        geoip_file: str = STARLINK_GEOIP_FILE,
+) -> np.ndarray:
+    """
+    Finds the row of the Starlink GeoIP data that each IPv4 address belongs to.
+    Like `get_starlink_geoip`, the shortest matching prefix between
+    GEOIP_MIN_PREFIX and GEOIP_MAX_PREFIX wins.
+
+    :param ips: series of IPv4 address strings
+    :param geoip_file: Starlink GeoIP file
+    :return: array of GeoIP row numbers, -1 where no subnet matches
+    """
+    index = load_geoip_index(geoip_file)
+
+    parts = ips.astype('string').str.split('.', expand=True, n=3)
+    parts = parts.reindex(columns=range(4))
+    parts = parts.apply(pd.to_numeric, errors='coerce')
+    valid = parts.notna().all(axis=1).to_numpy()
+    ip_ints = ipv4_parts_to_int(parts.fillna(0).astype('int64').to_numpy())
+
+    rows = np.full(len(ips), -1, dtype='int64')
+    for prefix in range(GEOIP_MIN_PREFIX, GEOIP_MAX_PREFIX + 1):
+        lo, hi = np.searchsorted(index['prefixlen'], [prefix, prefix + 1])
+        if lo == hi:
+            continue
+        networks = index['network'][lo:hi]
+        mask = (0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF
+        ip_networks = ip_ints & mask
+        pos = np.minimum(np.searchsorted(networks, ip_networks), hi - lo - 1)
+        found = valid & (rows == -1) & (networks[pos] == ip_networks)
+        rows[found] = index['row'][lo:hi][pos[found]]
+
+    return rows
+
+def summarize_starlink_geoip(geoip_df: pd.DataFrame = None):
+   if geoip_df is None:
+      geoip_df = get_starlink_geoip_df()
    # only inspect ipv4
    geoip_df = geoip_df[~geoip_df['subnet'].apply(lambda x: ':' in x)]
 
@@ -38,38 +143,111 @@ def get_subnet(ip_str, prefix_length):
   return str(subnet) + '/' + str(network.prefixlen)
 
 def get_starlink_geoip(ip_str):
-  prefix = 24
-  while prefix < 32:
-    subnet = get_subnet(ip_str, prefix)
-    if subnet in starlink_geoip_df['subnet'].values:
-      return subnet
-    prefix += 1
-  return None
+  row = get_geoip_rows(pd.Series([ip_str]))[0]
+  if row == -1:
+    return None
+  return get_starlink_geoip_df()['subnet'].iloc[row]
 
 def get_all_geoip(df: pd.DataFrame) -> pd.DataFrame:
-    df['subnet'] = df['ip'].apply(get_starlink_geoip)
-    df = df.merge(starlink_geoip_df, how='left', on='subnet')
+    geoip_df = get_starlink_geoip_df()
+    rows = get_geoip_rows(df['ip'])
+    subnets = geoip_df['subnet'].to_numpy()[np.maximum(rows, 0)]
+    df['subnet'] = np.where(rows == -1, None, subnets)
+    df = df.merge(geoip_df, how='left', on='subnet')
     return df
 
 def get_cleaned_censys(filename: str) -> pd.DataFrame:
+    """
+    Cleans a Censys exposed services file and filters for Starlink customer
+    endpoints, adding the PoP name as 'dns_trunc'.
+
+    Accepts both the flattened columns written by `get_censys_exposed_services`
+    (a single 'dns_name' and a boolean 'pep_link') and the stringified list
+    columns of older exports.
+    """
     censys_df = pd.read_csv(filename, index_col=0)
+    # first reverse dns name, either "name" or "['name', ...]"
     censys_df['dns_name'] = (
         censys_df['dns_name']
-        .apply(
-            lambda x: ast.literal_eval(x) if isinstance(x, str) else []
-        )
+        .astype('string')
+        .str.extract(r"^\[?\s*'?([^'\[\]\s,]+)", expand=False)
     )
-    censys_df['dns_name'] = censys_df['dns_name'].apply(lambda x: x[0] if x else None)
-    censys_df['pep_link'] = censys_df['pep_link'].apply(lambda x: True if 'True' in x else False)
-
-    # Filter out peplink
-    censys_df = censys_df[~censys_df['pep_link']]
-    # Filter for customer endpoints
-    censys_df = censys_df[censys_df['dns_name'].str.contains(
-        r'^customer\..+\.pop\.starlinkisp\.net$', 
-        na=False
-    )]
-    censys_df['dns_trunc'] = censys_df['dns_name'].apply(
-      lambda x: x.split('.')[1]
+    if censys_df['pep_link'].dtype != bool:
+        censys_df['pep_link'] = (
+            censys_df['pep_link']
+            .astype('string')
+            .str.contains('True', na=False)
+            .astype(bool)
+        )
+    # customer endpoints are named customer.<pop>[...].pop.starlinkisp.net
+    censys_df['dns_trunc'] = censys_df['dns_name'].str.extract(
+        r'^customer\.([^.]+)(?:\..+)?\.pop\.starlinkisp\.net$',
+        expand=False,
     )
+
+    # Filter out peplink and filter for customer endpoints
+    censys_df = censys_df[~censys_df['pep_link'] & censys_df['dns_trunc'].notna()]
     return censys_df
+
+# in-process cache of enrichment tables, keyed by (enrichment file, mtime)
+_censys_enrichment_cache = {}
+
+def get_censys_enrichment_file(censys_file: str) -> str:
+    root, _ = os.path.splitext(censys_file)
+    return f"{root}_enriched.csv"
+
+def get_censys_enrichment(
+        censys_file: str,
+        enrichment_file: str = None,
+) -> pd.DataFrame:
+    """
+    Returns the cleaned Censys metadata joined with Starlink GeoIP data as a
+    lookup table indexed by 'ip'.
+
+    The table is built once and persisted to `enrichment_file` (by default
+    next to `censys_file`), so every dataset joins against the same table
+    instead of re-cleaning Censys. It is rebuilt when `censys_file` is newer
+    than the persisted table.
+
+    :param censys_file: Censys exposed services file
+    :param enrichment_file: (optional) where to persist the lookup table
+    :return: dataframe indexed by 'ip' with columns
+             'dns_trunc', 'subnet', 'country', 'region', 'city'
+    """
+    if enrichment_file is None:
+        enrichment_file = get_censys_enrichment_file(censys_file)
+
+    if (
+        not os.path.exists(enrichment_file)
+        or os.path.getmtime(enrichment_file) < os.path.getmtime(censys_file)
+    ):
+        print(f"building censys enrichment: {enrichment_file}")
+        censys_df = get_cleaned_censys(censys_file)
+        censys_df = censys_df[['ip', 'dns_trunc']]
+        censys_df = get_all_geoip(censys_df)
+        censys_df = censys_df.drop_duplicates(subset='ip')
+        censys_df.to_csv(enrichment_file, index=False)
+
+    cache_key = (enrichment_file, os.path.getmtime(enrichment_file))
+    if cache_key not in _censys_enrichment_cache:
+        _censys_enrichment_cache[cache_key] = pd.read_csv(
+            enrichment_file,
+            index_col='ip',
+        )
+
+    return _censys_enrichment_cache[cache_key]
+
+def cache_country_shapes(shapefile: str, cache_file: str):
+    """
+    Converts the country shapefile used by the choropleth maps to a pickle,
+    which reads much faster than parsing the shapefile for every figure.
+    """
+    import geopandas as gpd
+    gpd.read_file(shapefile).to_pickle(cache_file)
+
+@functools.lru_cache(maxsize=4)
+def read_country_shapes(cache_file: str):
+    """
+    Reads the countries written by `cache_country_shapes`, once per process.
+    """
+    return pd.read_pickle(cache_file)
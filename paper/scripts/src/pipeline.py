@@ -0,0 +1,207 @@
+import concurrent.futures
+import os
+import time
+
+"""
+Runs the stages behind the paper figures (import, clean, segment, enrich,
+plot), rebuilding only the stale ones.
+
+Each stage declares the files it reads and writes, and a stage depends on the
+stages writing its inputs. A stage is stale when one of its outputs is
+missing, an input is newer than its oldest output, or a stage it depends on
+was rebuilt. Inputs that no stage writes and that do not exist (e.g. raw
+measurements that are not shipped with the repository) make a stage stale
+only if its outputs are missing too; such a stage is reported and skipped.
+
+Independent stages run in parallel with `jobs` > 1.
+"""
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    :param name: unique name, by convention '<kind>:<dataset or figure>'
+    :param func: module-level function running the stage, so it can be sent
+                 to a worker process
+    :param args: (optional) positional arguments of `func`
+    :param inputs: (optional) files `func` reads
+    :param outputs: (optional) files `func` writes
+    """
+    def __init__(
+            self,
+            name: str,
+            func,
+            args: tuple = (),
+            inputs: list = (),
+            outputs: list = (),
+    ):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+def get_mtime(file: str) -> float:
+    return os.path.getmtime(file) if os.path.exists(file) else None
+
+def is_stale(stage: Stage) -> bool:
+    output_mtimes = [get_mtime(f) for f in stage.outputs]
+    if not output_mtimes or None in output_mtimes:
+        return True
+    input_mtimes = [m for m in map(get_mtime, stage.inputs) if m is not None]
+    return bool(input_mtimes) and max(input_mtimes) > min(output_mtimes)
+
+def get_writers(stages: list) -> dict:
+    """
+    Returns the name of the stage writing each output.
+    """
+    writers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in writers:
+                raise ValueError(f"{output} is written by both {writers[output]} and {stage.name}")
+            writers[output] = stage.name
+    return writers
+
+def get_dependencies(stages: list) -> dict:
+    """
+    Returns the names of the stages each stage depends on, the stages
+    writing its inputs.
+    """
+    writers = get_writers(stages)
+    return {
+        stage.name: {writers[f] for f in stage.inputs if f in writers and writers[f] != stage.name}
+        for stage in stages
+    }
+
+def select_stages(stages: list, names: list) -> list:
+    """
+    Returns the stages whose name starts with one of `names`, and the stages
+    they depend on, in their original order.
+    """
+    dependencies = get_dependencies(stages)
+    selected = set()
+    to_visit = [s.name for s in stages if any(s.name.startswith(n) for n in names)]
+    while to_visit:
+        name = to_visit.pop()
+        if name not in selected:
+            selected.add(name)
+            to_visit.extend(dependencies[name])
+    return [s for s in stages if s.name in selected]
+
+def run_stage(stage: Stage) -> float:
+    """
+    Runs one stage, removing its outputs first so the caches inside the
+    analysis functions (e.g. `import_and_clean_df`) are rebuilt. Raises
+    ValueError, leaving the outputs in place, if an input is missing.
+
+    :return: seconds the stage took
+    """
+    start = time.time()
+    missing = [f for f in stage.inputs if not os.path.exists(f)]
+    if missing:
+        raise ValueError(f"cannot build {stage.name}, missing: {', '.join(missing)}")
+    for output in stage.outputs:
+        if os.path.isfile(output):
+            os.remove(output)
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    stage.func(*stage.args)
+    return time.time() - start
+
+def run_stages(
+        stages: list,
+        jobs: int = 1,
+        force: bool = False,
+        dry_run: bool = False,
+) -> dict:
+    """
+    Runs the stale stages, each after the stages it depends on.
+
+    :param stages: stages to consider, with unique names
+    :param jobs: (optional) number of stages run at once in worker processes
+    :param force: (optional) rebuild every stage
+    :param dry_run: (optional) only print what would run
+    :return: stage name -> 'rebuilt' ('would run' with `dry_run`),
+             'up to date', 'missing inputs', 'failed' or 'skipped' (a
+             dependency failed)
+    """
+    if len({s.name for s in stages}) != len(stages):
+        raise ValueError("stage names must be unique")
+    writers = get_writers(stages)
+    dependencies = get_dependencies(stages)
+    status = {}
+    running = {}
+
+    def start_ready(executor):
+        for stage in stages:
+            name = stage.name
+            if name in status or name in running.values():
+                continue
+            if any(dep not in status for dep in dependencies[name]):
+                continue
+            dep_status = [status[dep] for dep in dependencies[name]]
+            if any(s in ['failed', 'skipped'] for s in dep_status):
+                status[name] = 'skipped'
+                print(f"skipped {name}: a dependency failed")
+                continue
+            rebuilt = {'rebuilt', 'would run'}
+            if not (force or rebuilt & set(dep_status) or is_stale(stage)):
+                status[name] = 'up to date'
+                continue
+            missing = [
+                f for f in stage.inputs
+                if not os.path.exists(f) and status.get(writers.get(f)) != 'would run'
+            ]
+            if missing:
+                status[name] = 'missing inputs'
+                print(f"cannot build {name}, missing: {', '.join(missing)}")
+                continue
+            if dry_run:
+                status[name] = 'would run'
+                print(f"would run {name}")
+                continue
+            print(f"running {name}")
+            if executor is None:
+                finish(name, run_in_process(stage))
+            else:
+                running[executor.submit(run_stage, stage)] = name
+
+    def run_in_process(stage):
+        try:
+            return run_stage(stage), None
+        except Exception as e:
+            return None, e
+
+    def finish(name, result):
+        seconds, error = result
+        if error is not None:
+            status[name] = 'failed'
+            print(f"failed {name}: {error!r}")
+        else:
+            status[name] = 'rebuilt'
+            print(f"done {name} in {seconds:.1f} s")
+
+    if jobs <= 1 or dry_run:
+        # stages finish as they start, so one pass per dependency level
+        while len(status) < len(stages):
+            done = len(status)
+            start_ready(None)
+            if len(status) == done:
+                raise ValueError("stages depend on each other in a cycle")
+        return status
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        start_ready(executor)
+        while running:
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                finish(name, (None if error else future.result(), error))
+            start_ready(executor)
+    if len(status) < len(stages):
+        raise ValueError("stages depend on each other in a cycle")
+    return status